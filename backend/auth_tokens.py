@@ -0,0 +1,143 @@
+"""
+Tokens de sesión firmados (JWT HS256) para usuarios y admin.
+
+- access token corto + refresh token largo; ambos llevan jti para poder revocarlos
+- el access token se verifica solo en memoria (claves cacheadas, sin ir a Mongo)
+- la revocación (logout / rotación de refresh) vive en un set en memoria con TTL:
+  cada jti se guarda solo hasta que su token habría expirado igual
+- refresh y logout, que son raros, además pasan por MongoRevocations: una
+  colección compartida entre workers (único por jti, TTL por exp), así un
+  refresh token sirve una sola vez aunque haya varios procesos
+
+Rotación de claves: JWT_SECRETS="kid1:secreto1,kid2:secreto2" firma con la
+primera y acepta todas.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import jwt
+from pymongo.errors import DuplicateKeyError
+
+
+class TokenError(Exception):
+    pass
+
+
+class RevocationSet:
+    """jti revocados hasta su exp; se barre solo al insertar."""
+
+    def __init__(self, sweep_every: float = 60.0):
+        self._items: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._swept_at = time.monotonic()
+
+    def add(self, jti: str, exp: float):
+        with self._lock:
+            self._items[jti] = exp
+            now = time.monotonic()
+            if now - self._swept_at >= self._sweep_every:
+                self._swept_at = now
+                wall = time.time()
+                for k in [k for k, e in self._items.items() if e < wall]:
+                    del self._items[k]
+
+    def __contains__(self, jti: str) -> bool:
+        exp = self._items.get(jti)
+        return exp is not None and exp >= time.time()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class MongoRevocations:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("jti", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def claim(self, claims: dict) -> bool:
+        """Revoca el jti para todos los workers; False si ya estaba revocado (usado o cerrado)."""
+        try:
+            await self.collection.insert_one({
+                "jti":        claims["jti"],
+                "typ":        claims.get("typ"),
+                "expires_at": datetime.fromtimestamp(float(claims["exp"]), timezone.utc),
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+
+def parse_keys(spec: Optional[str], fallback_seed: str) -> Dict[str, bytes]:
+    keys: Dict[str, bytes] = {}
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        kid, _, secret = part.partition(":")
+        if not secret:
+            kid, secret = "k1", kid
+        keys[kid] = secret.encode()
+    if not keys:
+        # sin JWT_SECRETS: clave derivada determinística (igual en todos los workers)
+        keys["k0"] = hashlib.sha256(f"tennis-booking:{fallback_seed}".encode()).digest()
+    return keys
+
+
+class TokenService:
+    algorithm = "HS256"
+
+    def __init__(self, keys: Dict[str, bytes], access_ttl: int = 3600, refresh_ttl: int = 14 * 86400,
+                 issuer: str = "tennis-booking"):
+        self.keys = keys
+        self.signing_kid = next(iter(keys))
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.issuer = issuer
+        self.revoked = RevocationSet()
+
+    def _encode(self, claims: dict, ttl: int) -> str:
+        now = int(time.time())
+        payload = dict(claims, iat=now, exp=now + ttl, iss=self.issuer, jti=uuid.uuid4().hex)
+        return jwt.encode(payload, self.keys[self.signing_kid], algorithm=self.algorithm,
+                          headers={"kid": self.signing_kid})
+
+    def issue(self, sub: str, role: str, venue_id: str) -> dict:
+        claims = {"sub": sub, "role": role, "venue": venue_id}
+        return {
+            "access_token":  self._encode(dict(claims, typ="access"), self.access_ttl),
+            "refresh_token": self._encode(dict(claims, typ="refresh"), self.refresh_ttl),
+            "token_type":    "bearer",
+            "expires_in":    self.access_ttl,
+        }
+
+    def verify(self, token: str, typ: str = "access") -> dict:
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = self.keys.get(kid)
+            if key is None:
+                raise TokenError("Clave de firma desconocida")
+            claims = jwt.decode(token, key, algorithms=[self.algorithm], issuer=self.issuer,
+                                options={"require": ["exp", "sub", "jti"]})
+        except jwt.PyJWTError as e:
+            raise TokenError(str(e))
+        if claims.get("typ") != typ:
+            raise TokenError("Tipo de token inválido")
+        if claims["jti"] in self.revoked:
+            raise TokenError("Token revocado")
+        return claims
+
+    def revoke(self, claims: dict):
+        self.revoked.add(claims["jti"], float(claims["exp"]))
+
+    def refresh(self, refresh_token: str) -> dict:
+        claims = self.verify(refresh_token, typ="refresh")
+        self.revoke(claims)   # rotación en este proceso; el API además la registra en MongoRevocations
+        return self.issue(claims["sub"], claims["role"], claims["venue"])
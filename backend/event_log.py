@@ -0,0 +1,133 @@
+"""
+Bitácora append-only de eventos de reservas y pagos (auditoría / disputas).
+
+Los handlers llaman a emit(), que solo agrega el evento a un buffer en memoria:
+no hay round trip a Mongo en el camino de la petición. Una tarea de fondo hace
+group commit con insert_many cuando el buffer llega a `max_batch` eventos o
+pasan `flush_interval` segundos, y en el apagado se vacía lo pendiente.
+
+Cada evento lleva su _id generado al emitir: si un insert_many falla a medias,
+el lote se reintenta y los que ya estaban se descartan como duplicados.
+
+Tipos: booking_created (snapshot completo), booking_cancelled, booking_updated
+(campos cambiados), charge_paid, charge_failed, voucher_rendered.
+fold_events() reconstruye el estado de cada reserva a partir de sus eventos.
+"""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+logger = logging.getLogger("tennis_booking.events")
+
+
+class EventLog:
+    def __init__(self, writer: Callable[[List[dict]], Awaitable[None]], max_batch: int = 200,
+                 flush_interval: float = 0.5, max_buffer: int = 50000):
+        self.writer = writer
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: deque = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+        self.emitted = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def emit(self, venue_id: str, type_: str, booking_id: Optional[str] = None, **data):
+        if len(self._buffer) >= self.max_buffer:
+            # Mongo caído por mucho rato: no crecer sin límite
+            self._buffer.popleft()
+            self.dropped += 1
+        self._buffer.append({
+            "_id":        ObjectId(),
+            "venue_id":   venue_id,
+            "type":       type_,
+            "booking_id": booking_id,
+            "at":         datetime.now(timezone.utc).isoformat(),
+            "data":       data,
+        })
+        self.emitted += 1
+        if len(self._buffer) >= self.max_batch and self._wake is not None:
+            self._wake.set()
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.max_batch, len(self._buffer)))]
+                try:
+                    await self.writer(batch)
+                except Exception:
+                    self.failures += 1
+                    self._buffer.extendleft(reversed(batch))   # se reintenta en el próximo ciclo
+                    logger.exception("event log: falló el insert de %d eventos", len(batch))
+                    return
+                except BaseException:
+                    # cancelado a mitad del insert: el lote vuelve al buffer para el flush final
+                    self._buffer.extendleft(reversed(batch))
+                    raise
+                self.written += len(batch)
+                self.batches += 1
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            # sin cancel: un insert en curso termina (o devuelve su lote al buffer) antes de salir
+            self._stopping = True
+            self._wake.set()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            logger.error("event log: %d eventos sin escribir al apagar", len(self._buffer))
+
+    def stats(self) -> dict:
+        return {"emitted": self.emitted, "written": self.written, "batches": self.batches,
+                "pending": len(self._buffer), "dropped": self.dropped, "failures": self.failures}
+
+
+def fold_events(events: Iterable[dict]) -> Dict[str, dict]:
+    """Estado de cada reserva según sus eventos, que deben venir ordenados por (at, _id)."""
+    state: Dict[str, dict] = {}
+    for ev in events:
+        bid = ev.get("booking_id")
+        if not bid:
+            continue
+        data = ev.get("data") or {}
+        if ev["type"] == "booking_created":
+            state[bid] = dict(data.get("booking") or {})
+        elif bid not in state:
+            continue   # evento de una reserva anterior a la bitácora
+        elif ev["type"] == "booking_cancelled":
+            state[bid]["status"] = "cancelled"
+            state[bid].update(data.get("fields") or {})   # p. ej. payment_status al rechazarse el pago
+        elif ev["type"] == "booking_updated":
+            state[bid].update(data.get("fields") or {})
+    return state
@@ -0,0 +1,97 @@
+"""
+Índice en memoria de huecos libres por (local, fecha, cancha) para buscar
+"el primer turno libre de N horas" sin pedir la disponibilidad día por día.
+
+Por cada fecha cargada se guarda el bitmask de ocupación de cada cancha (el
+mismo de daily_summaries: bit i = franja de 30 min desde 00:00). Los huecos
+libres son las corridas de ceros del mask dentro del horario de atención, así
+que una búsqueda es puro cálculo de bits sobre las plantillas del local.
+
+- las fechas que faltan se cargan con una sola consulta por rango
+- las reservas y cancelaciones del propio worker se aplican al mask al instante
+- los cambios de otros workers llegan por el poller de versiones (invalidate)
+"""
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from venues import VenueConfig, hhmm_to_minutes
+
+
+class FreeIntervalIndex:
+    def __init__(self, max_dates: int = 5000):
+        self.max_dates = max_dates
+        self._masks: "OrderedDict[Tuple[str, str], Dict[int, int]]" = OrderedDict()
+        self.loads = 0
+
+    def missing(self, venue_id: str, dates: Iterable[str]) -> List[str]:
+        return [d for d in dates if (venue_id, d) not in self._masks]
+
+    def load(self, venue_id: str, booking_date: str, masks: Dict[int, int]):
+        key = (venue_id, booking_date)
+        self._masks[key] = dict(masks)
+        self._masks.move_to_end(key)
+        while len(self._masks) > self.max_dates:
+            self._masks.popitem(last=False)
+
+    def apply(self, venue_id: str, booking_date: str, court: int, mask: int, added: bool):
+        masks = self._masks.get((venue_id, booking_date))
+        if masks is None:
+            return   # fecha no cargada: se leerá fresca cuando alguien la busque
+        current = masks.get(court, 0)
+        masks[court] = current | mask if added else current & ~mask
+
+    def invalidate(self, venue_id: str, booking_date: str):
+        self._masks.pop((venue_id, booking_date), None)
+
+    def masks(self, venue_id: str, booking_date: str) -> Dict[int, int]:
+        return self._masks.get((venue_id, booking_date)) or {}
+
+    def stats(self) -> dict:
+        return {"dates": len(self._masks), "loads": self.loads}
+
+
+def date_range(date_from: date, date_to: date) -> List[date]:
+    return [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+
+def find_slots(index: FreeIntervalIndex, venue: VenueConfig, dates: List[date], duration: int,
+               earliest: int = 0, latest: int = 24 * 60, courts: Optional[Iterable[int]] = None,
+               limit: int = 5, not_before: Optional[Tuple[date, int]] = None) -> List[dict]:
+    """
+    Turnos libres de `duration` minutos (múltiplo de slot_minutes) que empiezan
+    desde `earliest` y terminan hasta `latest`, en orden de fecha/hora/cancha.
+    not_before=(hoy, minutos_ahora) descarta lo que ya empezó.
+    """
+    n = duration // venue.slot_minutes
+    courts = sorted(courts) if courts else list(venue.courts)
+    out: List[dict] = []
+    for d in dates:
+        templates = venue.slots_for(d)
+        masks = index.masks(venue.id, d.isoformat())
+        for i in range(len(templates) - n + 1):
+            run = templates[i:i + n]
+            start, end = hhmm_to_minutes(run[0].start), hhmm_to_minutes(run[-1].end)
+            if start < earliest:
+                continue
+            if end > latest:
+                break
+            if not_before and d == not_before[0] and start < not_before[1]:
+                continue
+            if end - start != duration:
+                continue   # la grilla tiene un corte (p.ej. horario partido)
+            need = 0
+            for s in run:
+                need |= s.mask
+            for court in courts:
+                if not masks.get(court, 0) & need:
+                    out.append({
+                        "date":         d.isoformat(),
+                        "court_number": court,
+                        "start_time":   run[0].start,
+                        "end_time":     run[-1].end,
+                        "price_cents":  sum(s.price_cents for s in run),
+                    })
+                    if len(out) >= limit:
+                        return out
+    return out
@@ -0,0 +1,373 @@
+"""
+Importación masiva de reservas y usuarios históricos (migración desde planillas).
+
+    python manage.py import bookings reservas.csv --venue club-norte --workers 4
+    python manage.py import users clientes.ndjson --max-rate 2000
+
+1. lectura en streaming (CSV con encabezado o NDJSON) en lotes de --batch filas
+2. validación en un pool de procesos con los mismos modelos del API (Booking,
+   UserProfile / User) y las reglas del local (cancha, grilla); el hash de las
+   contraseñas que traiga la planilla también se hace ahí
+3. conflictos de turno en memoria: ocupación por (fecha, cancha) como máscara,
+   cargada de Mongo (y del archivo) la primera vez que aparece cada fecha
+4. insert_many(ordered=False) por lote. Sin límite de horas por cliente: son
+   reservas históricas cargadas por el club, no reservas nuevas
+5. al final, daily_summaries se reconstruye una vez para el rango importado (y
+   los contadores del límite diario, si hay reservas de hoy en adelante)
+
+Reanudable: cada archivo se identifica por el sha1 de su contenido y guarda en
+la colección imports la última línea escrita. Los documentos llevan un _id
+derivado de (archivo, línea): repetir un lote que quedó a medias choca con el
+_id y no duplica. Las filas rechazadas van a <archivo>.rejected.ndjson.
+"""
+import asyncio
+import csv
+import hashlib
+import json
+import multiprocessing
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+import server
+from user_search import search_tokens
+
+KINDS = ("bookings", "users")
+BOOKING_STATUSES = ("confirmed", "cancelled")
+
+
+def file_id(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """(línea, fila, error de lectura). Las celdas vacías se omiten: cuentan como campo ausente."""
+    fmt = fmt or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {k.strip(): v.strip() for k, v in row.items()
+                                        if k and isinstance(v, str) and v.strip()}, None
+            return
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield n, None, f"JSON inválido: {exc}"
+                continue
+            if isinstance(row, dict):
+                yield n, row, None
+            else:
+                yield n, None, "La línea no es un objeto JSON"
+
+
+def _row_id(import_id: str, line: int) -> ObjectId:
+    return ObjectId(hashlib.sha1(f"{import_id}:{line}".encode()).digest()[:12])
+
+
+def _reason(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in exc.errors())
+    return str(exc)
+
+
+def _booking_doc(venue, import_id: str, line: int, row: dict) -> dict:
+    booking = server.Booking(**row)
+    if not venue.has_court(booking.court_number):
+        raise ValueError("Cancha inválida")
+    start = booking.start_time.strftime("%H:%M")
+    slot = venue.slot_at(booking.booking_date, start)
+    if slot is None:
+        raise ValueError("Horario fuera de la grilla de atención")
+    status = row.get("status", "confirmed")
+    if status not in BOOKING_STATUSES:
+        raise ValueError(f"status inválido: {status}")
+    if row.get("price_cents") is not None:
+        price_cents = int(row["price_cents"])
+    elif row.get("price_soles") is not None:
+        price_cents = server.soles_a_centimos(row["price_soles"])
+    else:
+        price_cents = slot.price_cents
+    data = jsonable_encoder(booking)
+    data.update(_id=_row_id(import_id, line), venue_id=venue.id, start_time=start, end_time=slot.end,
+                price_cents=price_cents, status=status, created_at=row.get("created_at") or server.now_iso(),
+                import_id=import_id)
+    return data
+
+
+def _user_doc(venue, import_id: str, line: int, row: dict) -> dict:
+    user = (server.User if row.get("password") else server.UserProfile)(**row)
+    if user.email.lower() == server.ADMIN_EMAIL.lower():
+        raise ValueError("El correo pertenece a una cuenta de administrador")
+    data = jsonable_encoder(user)
+    if "password" in data:
+        data["password_hash"] = server.passwords.context.hash(data.pop("password"))
+    else:
+        # sin contraseña en la planilla: marca inutilizable, login_user la rechaza siempre
+        data["password_hash"] = server.UNUSABLE_PASSWORD
+    data.update(_id=_row_id(import_id, line), venue_id=venue.id, import_id=import_id,
+                search_tokens=search_tokens(user.customer_name, user.email, user.phone))
+    return data
+
+
+def validate_rows(kind: str, venue_id: str, import_id: str, rows: List[Tuple[int, dict]]):
+    """Corre en el pool de procesos: devuelve ([(línea, doc, fila)], [(línea, motivo, fila)])."""
+    venue = server.venue_registry.get(venue_id)
+    build = _booking_doc if kind == "bookings" else _user_doc
+    ok, rejected = [], []
+    for line, row in rows:
+        try:
+            ok.append((line, build(venue, import_id, line, row), row))
+        except (ValidationError, ValueError, TypeError) as exc:
+            rejected.append((line, _reason(exc), row))
+    return ok, rejected
+
+
+class Importer:
+    def __init__(self, venue, kind: str, path: str, fmt: Optional[str] = None, batch_size: int = 1000,
+                 workers: Optional[int] = None, max_rate: float = 0.0, rejects_path: Optional[str] = None,
+                 restart: bool = False, report_every: float = 2.0):
+        self.venue = venue
+        self.kind = kind
+        self.path = path
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.workers = workers or max(1, (multiprocessing.cpu_count() or 2) - 1)
+        self.max_rate = max_rate
+        self.rejects_path = rejects_path or f"{path}.rejected.ndjson"
+        self.restart = restart
+        self.report_every = report_every
+        self.vdb = server.venue_db(venue.id)
+        self.import_id = file_id(path)
+        self.checkpoint_id = f"{venue.id}:{kind}:{self.import_id}"
+        self._occupancy: dict = {}   # fecha → {cancha: máscara}
+        self._imported_ids: set = set()
+        self._rejects = None
+        self.counts = Counter()
+        self.reasons = Counter()
+        self.date_min: Optional[str] = None
+        self.date_max: Optional[str] = None
+
+    # ── conflictos ─────────────────────────────────────────────────────────
+    async def _load_dates(self, dates):
+        missing = sorted({d for d in dates if d not in self._occupancy})
+        if not missing:
+            return
+        for d in missing:
+            self._occupancy[d] = {}
+        match = {"venue_id": self.venue.id, "booking_date": {"$in": missing}, "status": "confirmed"}
+        projection = {"booking_date": 1, "start_time": 1, "end_time": 1, "court_number": 1, "import_id": 1}
+        async for b in server._iter_with_archive(self.vdb, "bookings", match, projection):
+            if b.get("import_id") == self.import_id:
+                self._imported_ids.add(b["_id"])   # escrita en una corrida anterior: no choca consigo misma
+            occ = self._occupancy[b["booking_date"]]
+            court = int(b["court_number"])
+            occ[court] = occ.get(court, 0) | server._booking_mask(b, self.venue)
+
+    async def _without_conflicts(self, docs):
+        await self._load_dates(doc["booking_date"] for _, doc, _ in docs)
+        out = []
+        for line, doc, row in docs:
+            if doc["_id"] in self._imported_ids:
+                self.counts["already_imported"] += 1
+                continue
+            if doc["status"] == "confirmed":
+                occ = self._occupancy[doc["booking_date"]]
+                court, mask = doc["court_number"], server._booking_mask(doc, self.venue)
+                if occ.get(court, 0) & mask:
+                    self._reject(line, f"Choca con otra reserva: cancha {court} {doc['booking_date']} "
+                                       f"{doc['start_time']}", row)
+                    continue
+                occ[court] = occ.get(court, 0) | mask
+            out.append((line, doc, row))
+        return out
+
+    # ── escritura ──────────────────────────────────────────────────────────
+    def _reject(self, line: int, reason: str, row):
+        self.counts["rejected"] += 1
+        self.reasons[reason.split(":")[0] if reason.startswith("Choca") else reason] += 1
+        self._rejects.write(json.dumps({"line": line, "reason": reason, "row": row}, default=str) + "\n")
+
+    async def _write(self, docs) -> List[dict]:
+        if not docs:
+            return []
+        failed = set()
+        try:
+            await self.vdb[self.kind].insert_many([doc for _, doc, _ in docs], ordered=False)
+        except BulkWriteError as exc:
+            for err in exc.details.get("writeErrors", []):
+                line, doc, row = docs[err["index"]]
+                failed.add(err["index"])
+                key = err.get("keyPattern") or {}
+                if err.get("code") == 11000 and "_id" in key:
+                    self.counts["already_imported"] += 1   # lote repetido al reanudar
+                elif err.get("code") == 11000 and "court_number" in key:
+                    # turno tomado por una reserva hecha en vivo mientras corría la importación
+                    self._reject(line, f"Choca con otra reserva: cancha {doc['court_number']} "
+                                       f"{doc['booking_date']} {doc['start_time']}", row)
+                elif err.get("code") == 11000:
+                    self._reject(line, "Email ya registrado", row)
+                else:
+                    self._reject(line, err.get("errmsg", "error de escritura"), row)
+        written = [doc for i, (_, doc, _) in enumerate(docs) if i not in failed]
+        self.counts["inserted"] += len(written)
+        return written
+
+    async def _commit(self, result, last_line: int):
+        ok, rejected = result
+        for line, reason, row in rejected:
+            self._reject(line, reason, row)
+        if self.kind == "bookings":
+            ok = await self._without_conflicts(ok)
+        written = await self._write(ok)
+        dates = [doc["booking_date"] for doc in written] if self.kind == "bookings" else []
+        if dates:
+            self.date_min = min([self.date_min or dates[0]] + dates)
+            self.date_max = max([self.date_max or dates[0]] + dates)
+            server._emit_bookings(self.venue, "booking_created", written, "import")
+            await server.events.flush()
+            # las fechas se suben al reconstruir daily_summaries al final
+            await server._bump_keys(self.venue, {server._email_key(doc["email"]) for doc in written})
+        self._rejects.flush()
+        update = {"$set": {"venue_id": self.venue.id, "kind": self.kind, "file": self.path, "line": last_line,
+                           "status": "running", "updated_at": server.now_iso()},
+                  "$inc": {"inserted": len(written)}}
+        if dates:
+            update["$min"] = {"date_min": self.date_min}
+            update["$max"] = {"date_max": self.date_max}
+        await self.vdb.imports.update_one({"_id": self.checkpoint_id}, update, upsert=True)
+
+    # ── reanudación ────────────────────────────────────────────────────────
+    def _trim_rejects(self, resume_line: int):
+        """Deja solo los rechazos hasta el checkpoint: los posteriores se vuelven a escribir al reanudar."""
+        try:
+            with open(self.rejects_path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        keep = []
+        for raw in lines:
+            try:
+                if json.loads(raw)["line"] <= resume_line:
+                    keep.append(raw)
+            except (ValueError, KeyError, TypeError):
+                continue   # línea a medio escribir cuando se cortó el proceso
+        with open(self.rejects_path, "w", encoding="utf-8") as f:
+            f.writelines(keep)
+
+    async def _imported_date_range(self):
+        """Rango de fechas de todo lo ya escrito por este archivo, no solo lo que alcanzó el checkpoint:
+        un lote insertado justo antes de cortarse queda como already_imported y no suma fechas."""
+        for name in ("bookings", "bookings_archive"):
+            async for row in self.vdb[name].aggregate([
+                {"$match": {"venue_id": self.venue.id, "import_id": self.import_id}},
+                {"$group": {"_id": None, "min": {"$min": "$booking_date"}, "max": {"$max": "$booking_date"}}},
+            ]):
+                self.date_min = min(filter(None, (self.date_min, row["min"])))
+                self.date_max = max(filter(None, (self.date_max, row["max"])))
+
+    # ── pipeline ───────────────────────────────────────────────────────────
+    def _batches(self, resume_line: int):
+        batch = []
+        for line, row, error in read_rows(self.path, self.fmt):
+            if line <= resume_line:
+                continue
+            self.counts["read"] += 1
+            if error:
+                self._reject(line, error, None)
+                continue
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def run(self) -> dict:
+        ckpt = await self.vdb.imports.find_one({"_id": self.checkpoint_id})
+        if ckpt and self.restart:
+            await self.vdb.imports.delete_one({"_id": self.checkpoint_id})
+            ckpt = None
+        if ckpt and ckpt.get("status") == "done":
+            print(f"{self.path} ya se importó ({ckpt.get('inserted', 0)} filas); --restart para repetir")
+            return dict(ckpt)
+        resume_line = ckpt["line"] if ckpt else 0
+        self.date_min, self.date_max = (ckpt or {}).get("date_min"), (ckpt or {}).get("date_max")
+        if resume_line:
+            print(f"reanudando {self.path} después de la línea {resume_line}")
+            self._trim_rejects(resume_line)
+            if self.kind == "bookings":
+                await self._imported_date_range()
+
+        loop = asyncio.get_running_loop()
+        t0 = last_report = time.monotonic()
+        in_flight: deque = deque()
+        self._rejects = open(self.rejects_path, "a" if resume_line else "w", encoding="utf-8")
+        # spawn: el padre ya tiene hilos (motor, pools) y fork con hilos no es seguro
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            for batch in self._batches(resume_line):
+                in_flight.append((batch[-1][0], loop.run_in_executor(
+                    pool, validate_rows, self.kind, self.venue.id, self.import_id, batch)))
+                if len(in_flight) < self.workers * 2:
+                    continue
+                last_line, fut = in_flight.popleft()
+                await self._commit(await fut, last_line)
+                await self._throttle(t0)
+                if time.monotonic() - last_report >= self.report_every:
+                    last_report = time.monotonic()
+                    self._progress(t0)
+            while in_flight:
+                last_line, fut = in_flight.popleft()
+                await self._commit(await fut, last_line)
+        finally:
+            pool.shutdown(cancel_futures=True)
+            self._rejects.close()
+
+        if self.kind == "bookings" and self.date_min:
+            await server.rebuild_daily_summaries(self.venue, self.date_min, self.date_max)
+            if self.date_max >= date.today().isoformat():
+                await server.rebuild_daily_limits(self.venue)   # reservas futuras: cuentan para el límite
+        await self.vdb.imports.update_one({"_id": self.checkpoint_id},
+                                          {"$set": {"status": "done", "finished_at": server.now_iso()}},
+                                          upsert=True)
+        self._progress(t0)
+        return self.report(time.monotonic() - t0)
+
+    async def _throttle(self, t0: float):
+        if self.max_rate > 0:
+            ahead = self.counts["read"] / self.max_rate - (time.monotonic() - t0)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+
+    def _progress(self, t0: float):
+        elapsed = max(time.monotonic() - t0, 1e-9)
+        print(f"[{self.venue.id}] {self.kind}: {self.counts['read']} leídas  {self.counts['inserted']} insertadas  "
+              f"{self.counts['rejected']} rechazadas  {self.counts['read'] / elapsed:.0f} filas/s", flush=True)
+
+    def report(self, elapsed: float) -> dict:
+        return {
+            "import_id":        self.import_id,
+            "read":             self.counts["read"],
+            "inserted":         self.counts["inserted"],
+            "rejected":         self.counts["rejected"],
+            "already_imported": self.counts["already_imported"],
+            "rows_per_second":  round(self.counts["read"] / max(elapsed, 1e-9), 1),
+            "date_range":       [self.date_min, self.date_max] if self.date_min else None,
+            "rejects_file":     self.rejects_path if self.counts["rejected"] else None,
+            "top_reasons":      self.reasons.most_common(10),
+        }
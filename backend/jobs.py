@@ -0,0 +1,233 @@
+"""
+Cola de trabajos durable sobre una colección de Mongo (jobs).
+
+Lo lento que no tiene que bloquear una respuesta (PDF de vouchers, avisos de la
+lista de espera y, a futuro, correos) se encola acá y lo ejecuta un worker:
+`python manage.py worker`, o el que arranca dentro del API con JOB_WORKER_IN_API=1.
+
+Documento: {_id, type, venue_id, payload, status, attempts, max_attempts, run_at,
+            locked_until, worker, last_error, created_at, started_at, finished_at}
+status: queued → running → done | queued (reintento con backoff) | dead
+
+- claim atómico con find_one_and_update: dos workers nunca toman el mismo trabajo
+- visibility timeout: si un worker muere con un trabajo tomado, al vencer
+  locked_until otro lo vuelve a tomar (los handlers tienen que ser idempotentes)
+- reintentos con backoff exponencial; al agotar max_attempts queda en dead
+- los done se borran solos pasados retention_days (índice TTL parcial)
+
+Las fechas son datetime UTC (no ISO como en el resto): el TTL y los $lte contra
+el reloj las necesitan así.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from metrics_util import percentile
+
+logger = logging.getLogger("tennis_booking.jobs")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _seconds(a: datetime, b: datetime) -> float:
+    # Mongo devuelve datetimes naive (UTC): se comparan sin zona
+    return (a.replace(tzinfo=None) - b.replace(tzinfo=None)).total_seconds()
+
+
+def parse_concurrency(spec: str, defaults: Dict[str, int]) -> Dict[str, int]:
+    """"voucher_pdf=2,waitlist_promote=4" → {tipo: workers}; los tipos no nombrados quedan con el default."""
+    out = dict(defaults)
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, n = part.split("=", 1)
+            out[name.strip()] = max(0, int(n))
+    return out
+
+
+class JobQueue:
+    def __init__(self, coll, max_attempts: int = 5, backoff_base: float = 2.0, backoff_max: float = 300.0,
+                 retention_days: int = 7):
+        self.coll = coll
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retention_days = retention_days
+
+    async def ensure_indexes(self):
+        await self.coll.create_index([("type", 1), ("status", 1), ("run_at", 1)])
+        await self.coll.create_index([("type", 1), ("status", 1), ("locked_until", 1)])
+        await self.coll.create_index("finished_at", expireAfterSeconds=self.retention_days * 86400,
+                                     partialFilterExpression={"status": "done"})
+
+    def _doc(self, type_: str, payload: dict, venue_id: Optional[str], delay: float,
+             max_attempts: Optional[int]) -> dict:
+        now = _now()
+        return {
+            "type":         type_,
+            "venue_id":     venue_id,
+            "payload":      payload,
+            "status":       "queued",
+            "attempts":     0,
+            "max_attempts": max_attempts or self.max_attempts,
+            "run_at":       now + timedelta(seconds=delay),
+            "created_at":   now,
+        }
+
+    async def enqueue(self, type_: str, payload: dict, venue_id: Optional[str] = None, delay: float = 0.0,
+                      max_attempts: Optional[int] = None):
+        res = await self.coll.insert_one(self._doc(type_, payload, venue_id, delay, max_attempts))
+        return res.inserted_id
+
+    async def enqueue_many(self, jobs: Iterable[Tuple[str, dict, Optional[str]]]):
+        docs = [self._doc(type_, payload, venue_id, 0.0, None) for type_, payload, venue_id in jobs]
+        if docs:
+            await self.coll.insert_many(docs, ordered=False)
+
+    async def claim(self, type_: str, worker_id: str, visibility: float) -> Optional[dict]:
+        now = _now()
+        return await self.coll.find_one_and_update(
+            {"type": type_, "$or": [{"status": "queued", "run_at": {"$lte": now}},
+                                    {"status": "running", "locked_until": {"$lte": now}}]},
+            {"$set": {"status": "running", "worker": worker_id, "started_at": now,
+                      "locked_until": now + timedelta(seconds=visibility)},
+             "$inc": {"attempts": 1}},
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _owned(self, job: dict) -> dict:
+        # si venció el visibility timeout y otro worker lo tomó, este ya no puede cerrarlo
+        return {"_id": job["_id"], "worker": job["worker"], "attempts": job["attempts"], "status": "running"}
+
+    async def complete(self, job: dict):
+        await self.coll.update_one(self._owned(job), {"$set": {"status": "done", "finished_at": _now()},
+                                                      "$unset": {"locked_until": ""}})
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max) * random.uniform(0.8, 1.2)
+
+    async def fail(self, job: dict, error: str) -> str:
+        now = _now()
+        if job["attempts"] >= job.get("max_attempts", self.max_attempts):
+            update = {"status": "dead", "finished_at": now, "last_error": error}
+        else:
+            update = {"status": "queued", "run_at": now + timedelta(seconds=self.backoff(job["attempts"])),
+                      "last_error": error}
+        await self.coll.update_one(self._owned(job), {"$set": update, "$unset": {"locked_until": ""}})
+        return update["status"]
+
+    async def retry_dead(self, type_: Optional[str] = None) -> int:
+        match = {"status": "dead"}
+        if type_:
+            match["type"] = type_
+        res = await self.coll.update_many(match, {"$set": {"status": "queued", "attempts": 0, "run_at": _now()},
+                                                  "$unset": {"finished_at": ""}})
+        return res.modified_count
+
+    async def depth(self) -> Dict[str, dict]:
+        """Por tipo: cuántos hay en cada estado y la antigüedad del más viejo esperando."""
+        now = _now()
+        out: Dict[str, dict] = {}
+        cursor = self.coll.aggregate([
+            {"$match": {"status": {"$in": ["queued", "running", "dead"]}}},
+            {"$group": {"_id": {"type": "$type", "status": "$status"}, "n": {"$sum": 1},
+                        "oldest": {"$min": "$run_at"}}},
+        ])
+        async for row in cursor:
+            t = out.setdefault(row["_id"]["type"], {"queued": 0, "running": 0, "dead": 0, "oldest_queued_s": 0.0})
+            t[row["_id"]["status"]] = row["n"]
+            if row["_id"]["status"] == "queued" and row["oldest"] is not None:
+                t["oldest_queued_s"] = round(max(0.0, _seconds(now, row["oldest"])), 1)
+        return out
+
+
+class JobWorker:
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[dict], Awaitable[None]]],
+                 concurrency: Dict[str, int], visibility: Dict[str, float], poll_interval: float = 1.0,
+                 worker_id: Optional[str] = None):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.visibility = visibility
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping: Optional[asyncio.Event] = None
+        self._stats = {t: {"done": 0, "failed": 0, "dead": 0, "wait_ms": deque(maxlen=1000),
+                           "run_ms": deque(maxlen=1000)} for t in handlers}
+
+    def start(self):
+        self._stopping = asyncio.Event()
+        for type_ in self.handlers:
+            for _ in range(self.concurrency.get(type_, 1)):
+                self._tasks.append(asyncio.create_task(self._loop(type_)))
+
+    async def stop(self, timeout: float = 10.0):
+        """Deja terminar los trabajos en curso (hasta timeout); lo cortado lo retoma otro al vencer locked_until."""
+        if self._stopping is None:
+            return
+        self._stopping.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _loop(self, type_: str):
+        visibility = self.visibility.get(type_, 60.0)
+        stats = self._stats[type_]
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim(type_, self.worker_id, visibility)
+            except Exception:
+                logger.exception("jobs: no se pudo tomar un trabajo %s", type_)
+                await self._idle()
+                continue
+            if job is None:
+                await self._idle()
+                continue
+            stats["wait_ms"].append(max(0.0, _seconds(job["started_at"], job["run_at"])) * 1000)
+            t0 = asyncio.get_running_loop().time()
+            try:
+                # si tarda más que el visibility timeout otro worker ya podría haberlo tomado
+                await asyncio.wait_for(self.handlers[type_](job), timeout=visibility)
+            except Exception as exc:
+                status = await self.queue.fail(job, repr(exc)[:500])
+                stats["dead" if status == "dead" else "failed"] += 1
+                logger.warning("jobs: %s %s falló (intento %d) → %s: %r", type_, job["_id"], job["attempts"],
+                               status, exc)
+            else:
+                await self.queue.complete(job)
+                stats["done"] += 1
+            stats["run_ms"].append((asyncio.get_running_loop().time() - t0) * 1000)
+
+    def stats(self) -> Dict[str, dict]:
+        out = {}
+        for type_, s in self._stats.items():
+            out[type_] = {
+                "workers":     self.concurrency.get(type_, 1),
+                "done":        s["done"],
+                "failed":      s["failed"],
+                "dead":        s["dead"],
+                "wait_p50_ms": round(percentile(s["wait_ms"], 50), 1),
+                "wait_p99_ms": round(percentile(s["wait_ms"], 99), 1),
+                "run_p50_ms":  round(percentile(s["run_ms"], 50), 1),
+                "run_p99_ms":  round(percentile(s["run_ms"], 99), 1),
+            }
+        return out
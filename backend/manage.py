@@ -0,0 +1,212 @@
+"""
+Comandos de mantenimiento del backend.
+
+Uso (desde backend/):
+    python manage.py rebuild-summaries [--venue ID] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+    python manage.py assign-venue --venue ID      # datos previos a multi-local
+    python manage.py shard-setup                  # sharding por venue_id (mongos)
+    python manage.py archive [--venue ID] [--days N] [--batch 500] [--pause 0.1]
+    python manage.py replay-events [--venue ID] [--into bookings_replayed] [--verify]
+    python manage.py worker [--types voucher_pdf ...] [--concurrency voucher_pdf=2,...]
+    python manage.py retry-jobs [--type TIPO]      # dead → queued
+    python manage.py index-users [--venue ID]      # search_tokens del autocompletado
+    python manage.py rebuild-limits [--venue ID] [--from YYYY-MM-DD]   # contadores del límite diario
+    python manage.py import {bookings,users} ARCHIVO [--venue ID] [--workers N] [--max-rate FILAS/S]
+"""
+import argparse
+import asyncio
+import json
+import signal
+
+import server
+from importer import KINDS, Importer
+from jobs import parse_concurrency
+
+
+def _venues(args):
+    if getattr(args, "venue", None):
+        venue = server.venue_registry.get(args.venue)
+        if venue is None:
+            raise SystemExit(f"Local desconocido: {args.venue}")
+        return [venue]
+    return server.venue_registry.all()
+
+
+async def _rebuild_summaries(args):
+    for venue in _venues(args):
+        n = await server.rebuild_daily_summaries(venue, args.date_from, args.date_to)
+        print(f"[{venue.id}] daily_summaries: {n} fechas reconstruidas")
+
+
+async def _rebuild_limits(args):
+    await server.ensure_venue_indexes()
+    for venue in _venues(args):
+        n = await server.rebuild_daily_limits(venue, args.date_from)
+        print(f"[{venue.id}] daily_limits: {n} contadores reconstruidos")
+
+
+async def _assign_venue(args):
+    venue = _venues(args)[0]
+    vdb = server.venue_db(venue.id)
+    for name in ("bookings", "charges", "users"):
+        res = await vdb[name].update_many({"venue_id": {"$exists": False}}, {"$set": {"venue_id": venue.id}})
+        print(f"[{venue.id}] {name}: {res.modified_count} documentos asignados")
+    await server.rebuild_daily_summaries(venue)
+    await server.ensure_indexes(vdb)
+
+
+async def _shard_setup(args):
+    admin = server.client.admin
+    names = {server.venue_db(v.id).name for v in _venues(args)}
+    for db_name in sorted(names):
+        await admin.command("enableSharding", db_name)
+        await server.ensure_indexes(server.client[db_name])
+        for coll, key in server.SHARD_KEYS.items():
+            await admin.command("shardCollection", f"{db_name}.{coll}", key=key)
+            print(f"{db_name}.{coll} → {key}")
+
+
+async def _run(func, args):
+    await server.connect_mongo(warm=False)
+    try:
+        await func(args)
+    finally:
+        server.close_mongo()
+
+
+async def _archive(args):
+    cutoff = server.archive_cutoff(args.days)
+    for venue in _venues(args):
+        for name in args.collections:
+            n = await server.archive_collection(venue, name, cutoff, batch_size=args.batch, pause=args.pause)
+            print(f"[{venue.id}] {name}: {n} documentos anteriores a {cutoff} → {name}_archive")
+
+
+async def _replay_events(args):
+    for venue in _venues(args):
+        res = await server.replay_events(venue, args.into, verify=args.verify)
+        print(f"[{venue.id}] booking_events → {args.into}: {res['bookings']} reservas")
+        if args.verify:
+            print(f"[{venue.id}] {len(res['mismatches'])} reservas no coinciden con bookings")
+            for bid in res["mismatches"][:20]:
+                print(f"    {bid}")
+
+
+async def _worker(args):
+    await server.ensure_job_indexes()
+    concurrency = parse_concurrency(args.concurrency, server.JOB_CONCURRENCY)
+    worker = server.make_job_worker(args.types, concurrency)
+    worker.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"worker {worker.worker_id}: {', '.join(f'{t}×{concurrency.get(t, 1)}' for t in worker.handlers)}")
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=args.report)
+            except asyncio.TimeoutError:
+                report = {"depth": await server._jobs().depth(), "worker": worker.stats()}
+                print(json.dumps(report), flush=True)
+    finally:
+        await worker.stop()
+        server.stop_worker_pools()
+
+
+async def _retry_jobs(args):
+    n = await server._jobs().retry_dead(args.type)
+    print(f"{n} trabajos dead vueltos a la cola")
+
+
+async def _index_users(args):
+    await server.ensure_venue_indexes()
+    for venue in _venues(args):
+        n = await server.backfill_user_search(venue, batch_size=args.batch)
+        print(f"[{venue.id}] users: {n} con search_tokens nuevos")
+
+
+async def _import(args):
+    await server.ensure_venue_indexes()
+    venue = server.venue_registry.get(args.venue)
+    if venue is None:
+        raise SystemExit(f"Local desconocido: {args.venue}")
+    importer = Importer(venue, args.kind, args.path, fmt=args.format, batch_size=args.batch,
+                        workers=args.workers, max_rate=args.max_rate, rejects_path=args.rejects,
+                        restart=args.restart)
+    report = await importer.run()
+    print(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tennis booking · mantenimiento")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-summaries", help="Backfill de daily_summaries desde bookings")
+    p.add_argument("--venue", default=None, help="Solo este local (por defecto: todos)")
+    p.add_argument("--from", dest="date_from", default=None)
+    p.add_argument("--to", dest="date_to", default=None)
+    p.set_defaults(func=_rebuild_summaries)
+
+    p = sub.add_parser("rebuild-limits", help="Recalcula los contadores del límite diario desde bookings")
+    p.add_argument("--venue", default=None, help="Solo este local (por defecto: todos)")
+    p.add_argument("--from", dest="date_from", default=None, help="Por defecto: hoy")
+    p.set_defaults(func=_rebuild_limits)
+
+    p = sub.add_parser("assign-venue", help="Asigna venue_id a documentos que no lo tienen")
+    p.add_argument("--venue", default=None, help="Local destino (por defecto: el local por defecto)")
+    p.set_defaults(func=_assign_venue)
+
+    p = sub.add_parser("shard-setup", help="enableSharding + shardCollection con claves por venue_id")
+    p.add_argument("--venue", default=None)
+    p.set_defaults(func=_shard_setup)
+
+    p = sub.add_parser("archive", help="Mueve reservas y cobros viejos a *_archive (por lotes, reanudable)")
+    p.add_argument("--venue", default=None, help="Solo este local (por defecto: todos)")
+    p.add_argument("--days", type=int, default=None, help="Antigüedad mínima (default ARCHIVE_AFTER_DAYS)")
+    p.add_argument("--batch", type=int, default=500)
+    p.add_argument("--pause", type=float, default=0.1, help="Segundos de pausa entre lotes")
+    p.add_argument("--collections", nargs="+", choices=sorted(server.ARCHIVE_FIELDS),
+                   default=sorted(server.ARCHIVE_FIELDS))
+    p.set_defaults(func=_archive)
+
+    p = sub.add_parser("replay-events", help="Reconstruye las reservas desde la bitácora booking_events")
+    p.add_argument("--venue", default=None, help="Solo este local (por defecto: todos)")
+    p.add_argument("--into", default="bookings_replayed", help="Colección destino (se reescribe)")
+    p.add_argument("--verify", action="store_true", help="Compara el resultado con bookings")
+    p.set_defaults(func=_replay_events)
+
+    p = sub.add_parser("worker", help="Ejecuta la cola de trabajos (vouchers PDF, lista de espera)")
+    p.add_argument("--types", nargs="+", choices=sorted(server.JOB_HANDLERS), default=None,
+                   help="Solo estos tipos (por defecto: todos)")
+    p.add_argument("--concurrency", default="", help="Workers por tipo, p.ej. voucher_pdf=2,waitlist_promote=4")
+    p.add_argument("--report", type=float, default=30.0, help="Segundos entre reportes de profundidad/latencia")
+    p.set_defaults(func=_worker)
+
+    p = sub.add_parser("retry-jobs", help="Vuelve a encolar los trabajos en dead")
+    p.add_argument("--type", default=None)
+    p.set_defaults(func=_retry_jobs)
+
+    p = sub.add_parser("index-users", help="Backfill de search_tokens para la búsqueda de clientes del admin")
+    p.add_argument("--venue", default=None, help="Solo este local (por defecto: todos)")
+    p.add_argument("--batch", type=int, default=500)
+    p.set_defaults(func=_index_users)
+
+    p = sub.add_parser("import", help="Importa reservas o usuarios desde CSV / NDJSON (reanudable)")
+    p.add_argument("kind", choices=KINDS)
+    p.add_argument("path")
+    p.add_argument("--venue", default=None, help="Local destino (por defecto: el local por defecto)")
+    p.add_argument("--format", choices=["csv", "ndjson"], default=None, help="Por defecto: según la extensión")
+    p.add_argument("--batch", type=int, default=1000)
+    p.add_argument("--workers", type=int, default=None, help="Procesos de validación (por defecto: CPUs - 1)")
+    p.add_argument("--max-rate", type=float, default=0.0, help="Tope de filas/s (0: sin tope)")
+    p.add_argument("--rejects", default=None, help="Reporte de rechazos (por defecto: ARCHIVO.rejected.ndjson)")
+    p.add_argument("--restart", action="store_true", help="Ignora el checkpoint y empieza de cero")
+    p.set_defaults(func=_import)
+
+    args = parser.parse_args()
+    asyncio.run(_run(args.func, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+Utilidades chicas para las métricas del admin y los benchmarks.
+"""
+
+
+def percentile(values, p):
+    """Percentil p (0–100) por el valor más cercano; 0.0 si no hay valores."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] if values else 0.0
@@ -0,0 +1,125 @@
+"""
+Opciones del pool de conexiones de Motor/pymongo y métricas de espera del pool.
+
+Variables de entorno (todas opcionales; sin ellas quedan los defaults de pymongo):
+    MONGO_MAX_POOL_SIZE          conexiones máximas por servidor (default 100)
+    MONGO_MIN_POOL_SIZE          conexiones que el pool mantiene abiertas (default 0)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS  cuánto puede esperar una operación por una conexión libre
+    MONGO_MAX_IDLE_TIME_MS       cierra conexiones ociosas pasado este tiempo
+    MONGO_COMPRESSORS            "zstd,snappy,zlib" en orden de preferencia; zstd necesita
+                                 el paquete zstandard y snappy python-snappy (si faltan,
+                                 pymongo avisa y usa el siguiente)
+    MONGO_WARM_CONNECTIONS       conexiones a abrir al arrancar (default = min pool)
+
+PoolWaitMetrics mide la espera entre "pedí una conexión" y "la obtuve": es lo que
+crece cuando el pool se queda corto en una ráfaga. pymongo emite ambos eventos
+en el mismo hilo, así que el inicio se guarda en un threading.local.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+from metrics_util import percentile
+
+
+def client_options(env=os.environ) -> Dict[str, object]:
+    opts: Dict[str, object] = {}
+    for key, opt in (("MONGO_MAX_POOL_SIZE", "maxPoolSize"),
+                     ("MONGO_MIN_POOL_SIZE", "minPoolSize"),
+                     ("MONGO_WAIT_QUEUE_TIMEOUT_MS", "waitQueueTimeoutMS"),
+                     ("MONGO_MAX_IDLE_TIME_MS", "maxIdleTimeMS")):
+        if env.get(key):
+            opts[opt] = int(env[key])
+    compressors = [c.strip() for c in env.get("MONGO_COMPRESSORS", "").split(",") if c.strip()]
+    if compressors:
+        opts["compressors"] = compressors
+    return opts
+
+
+def warm_connections(opts: Dict[str, object], env=os.environ) -> int:
+    if env.get("MONGO_WARM_CONNECTIONS"):
+        return int(env["MONGO_WARM_CONNECTIONS"])
+    return int(opts.get("minPoolSize", 0)) or 1
+
+
+class PoolWaitMetrics(monitoring.ConnectionPoolListener):
+    def __init__(self, window: int = 2048):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)   # esperas recientes en ms (para p50/p99)
+        self.checkouts = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.checked_out = 0
+        self.open = 0
+
+    # checkout
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started: Optional[float] = getattr(self._local, "started", None)
+        wait_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+        self._local.started = None
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self._recent.append(wait_ms)
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        with self._lock:
+            self.failed += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    # ciclo de vida de conexiones
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            recent = list(self._recent)
+            return {
+                "checkouts":       self.checkouts,
+                "checkout_failed": self.failed,
+                "wait_timeouts":   self.timeouts,
+                "wait_ms_avg":     round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_p50":     round(percentile(recent, 50), 3),
+                "wait_ms_p99":     round(percentile(recent, 99), 3),
+                "wait_ms_max":     round(self.max_wait_ms, 3),
+                "in_use":          self.checked_out,
+                "open":            self.open,
+            }
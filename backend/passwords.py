@@ -0,0 +1,82 @@
+"""
+Hash de contraseñas fuera del event loop.
+
+argon2 / bcrypt / pbkdf2 tardan ~50-150 ms por operación a propósito; hacerlo
+inline en un handler async congela todas las peticiones del worker. Acá se
+ejecutan en un pool de hilos acotado (argon2-cffi, bcrypt y hashlib liberan el
+GIL) y con un semáforo que limita cuántas operaciones pueden esperar a la vez:
+si se llena durante `queue_timeout` segundos se lanza PasswordServiceBusy.
+
+verify() devuelve además el hash nuevo cuando el guardado usa un esquema o
+parámetros viejos (rehash transparente al iniciar sesión).
+"""
+import asyncio
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence, Tuple
+
+from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+
+
+# cuentas sin contraseña (p. ej. importadas de una planilla): ningún verify la acepta
+UNUSABLE_PASSWORD = "!"
+
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+def _available(schemes: Sequence[str]) -> list:
+    out = []
+    for name in schemes:
+        handler = get_crypt_handler(name)
+        has_backend = getattr(handler, "has_backend", None)
+        if has_backend is None or has_backend():
+            out.append(name)
+    return out
+
+
+class PasswordService:
+    def __init__(self, schemes: Sequence[str] = ("argon2", "pbkdf2_sha256"), max_workers: int = 4,
+                 max_pending: int = 64, queue_timeout: float = 5.0, **context_kwargs):
+        usable = _available(schemes) or ["pbkdf2_sha256"]
+        # el primero disponible hashea; el resto solo verifica (y queda marcado para rehash)
+        self.context = CryptContext(schemes=usable, deprecated="auto", **context_kwargs)
+        self.scheme = usable[0]
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pwhash")
+        self._sem: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+
+    async def _run(self, fn, *args):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise PasswordServiceBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self._sem.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, stored_hash: str) -> Tuple[bool, Optional[str]]:
+        """(ok, hash_nuevo_o_None)."""
+        return await self._run(self.context.verify_and_update, password, stored_hash)
+
+    async def verify_legacy(self, password: str, plaintext: str) -> Tuple[bool, Optional[str]]:
+        """Registro antiguo con contraseña en claro: si coincide devuelve el hash con el que migrarlo."""
+        if not plaintext or not hmac.compare_digest(password.encode(), plaintext.encode()):
+            return False, None
+        return True, await self.hash(password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
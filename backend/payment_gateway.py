@@ -0,0 +1,81 @@
+"""
+Cliente del proveedor de pagos (modo PAYMENT_MODE=gateway) y firma de webhooks.
+
+El flujo es asíncrono como en los proveedores reales:
+1. POST /api/payments/charge guarda el cobro en `pending` y responde al instante
+2. un worker de fondo lo envía al proveedor (submit), que solo acusa recibo
+3. el proveedor confirma más tarde por webhook (charge.succeeded / charge.failed)
+
+Los webhooks van firmados con HMAC-SHA256 del cuerpo (cabecera X-Signature).
+El proveedor puede repetir eventos o mandarlos en desorden: quien los recibe
+tiene que ser idempotente (ver payment_webhook en server.py).
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+
+TERMINAL_EVENTS = {"charge.succeeded": "paid", "charge.failed": "failed"}
+
+
+def sign(secret: str, body: bytes) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    return bool(signature) and hmac.compare_digest(sign(secret, body), signature)
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayClient:
+    def __init__(self, base_url: str, timeout: float = 5.0, max_workers: int = 4):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # requests es bloqueante: va en su propio pool, nunca en el event loop
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gateway")
+        self._session = requests.Session()
+        self.submitted = 0
+        self.errors = 0
+
+    def _post(self, path: str, payload: dict, idempotency_key: Optional[str] = None) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        resp = self._session.post(f"{self.base_url}{path}", data=json.dumps(payload),
+                                  headers=headers, timeout=self.timeout)
+        if resp.status_code >= 300:
+            raise GatewayError(f"{resp.status_code}: {resp.text[:200]}")
+        return resp.json()
+
+    async def submit(self, charge: dict, callback_url: str, simulate: Optional[dict] = None) -> dict:
+        payload = {
+            "charge_id":    charge["id"],
+            "amount":       charge["amount"],
+            "currency":     charge.get("currency", "PEN"),
+            "callback_url": callback_url,
+            "metadata":     {"venue_id": charge["venue_id"]},
+            "simulate":     simulate or {},
+        }
+        loop = asyncio.get_running_loop()
+        try:
+            # mismo cobro → misma clave: el proveedor responde lo mismo y no cobra dos veces
+            out = await loop.run_in_executor(self._pool, self._post, "/v1/charges", payload, charge["id"])
+        except Exception:
+            self.errors += 1
+            raise
+        self.submitted += 1
+        return out
+
+    def stats(self) -> dict:
+        return {"submitted": self.submitted, "errors": self.errors}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._session.close()
@@ -0,0 +1,145 @@
+"""
+Simulador local del proveedor de pagos (reemplaza al proveedor real en desarrollo).
+
+Acepta cobros en POST /v1/charges (responde 202 al instante) y después de una
+latencia configurable manda los webhooks firmados al callback_url:
+    charge.processing  → informativo
+    charge.succeeded / charge.failed → estado final
+Con --duplicate-rate repite el evento final (mismo id) y con --reorder-rate lo
+manda antes que charge.processing, para ejercitar la idempotencia del receptor.
+Los envíos que no reciben 2xx se reintentan con backoff, como un proveedor real.
+
+Uso (desde backend/):
+    python payment_simulator.py --port 8010 --latency 2 --jitter 1 --failure-rate 0.1 \\
+        --duplicate-rate 0.2 --reorder-rate 0.2
+    # en el API: PAYMENT_MODE=gateway PAYMENT_GATEWAY_URL=http://localhost:8010
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Optional
+
+import requests
+from fastapi import FastAPI, Header
+from pydantic import BaseModel
+
+from payment_gateway import sign
+
+logger = logging.getLogger("payment_simulator")
+
+
+class SimulatorConfig(BaseModel):
+    latency:        float = 2.0    # segundos hasta el evento final
+    jitter:         float = 1.0    # ± aleatorio sobre la latencia
+    failure_rate:   float = 0.0
+    duplicate_rate: float = 0.0
+    reorder_rate:   float = 0.0
+    max_attempts:   int = 5
+    secret:         str = os.getenv("PAYMENT_WEBHOOK_SECRET", "dev-webhook-secret")
+
+
+class ChargeIn(BaseModel):
+    charge_id:    str
+    amount:       int
+    currency:     str = "PEN"
+    callback_url: str
+    metadata:     dict = {}
+    simulate:     dict = {}
+
+
+def create_app(config: SimulatorConfig) -> FastAPI:
+    app = FastAPI(title="Payment simulator")
+    session = requests.Session()
+    stats = {"charges": 0, "webhooks": 0, "retries": 0, "gave_up": 0, "idempotent_replays": 0}
+    seen = {}   # Idempotency-Key → respuesta
+
+    def _post(url: str, body: bytes) -> int:
+        try:
+            return session.post(url, data=body, timeout=10, headers={
+                "Content-Type": "application/json", "X-Signature": sign(config.secret, body),
+            }).status_code
+        except requests.RequestException:
+            return 0
+
+    async def _deliver(url: str, event: dict):
+        body = json.dumps(event).encode()
+        for attempt in range(config.max_attempts):
+            status = await asyncio.to_thread(_post, url, body)
+            stats["webhooks"] += 1
+            if 200 <= status < 300:
+                return
+            stats["retries"] += 1
+            await asyncio.sleep(min(2 ** attempt * 0.5, 10))
+        stats["gave_up"] += 1
+        logger.warning("webhook %s %s sin 2xx tras %d intentos", event["type"], event["id"], config.max_attempts)
+
+    def _event(type_: str, charge: ChargeIn, provider_ref: str) -> dict:
+        return {
+            "id":      f"evt_{uuid.uuid4().hex}",
+            "type":    type_,
+            "created": time.time(),
+            "data":    {"charge_id": charge.charge_id, "provider_ref": provider_ref, "amount": charge.amount,
+                        "metadata": charge.metadata},
+        }
+
+    async def _settle(charge: ChargeIn, provider_ref: str):
+        processing = _event("charge.processing", charge, provider_ref)
+        failed = charge.simulate.get("status") == "failed" or random.random() < config.failure_rate
+        final = _event("charge.failed" if failed else "charge.succeeded", charge, provider_ref)
+        delay = max(0.0, config.latency + random.uniform(-config.jitter, config.jitter))
+
+        events = [processing, final]
+        if random.random() < config.reorder_rate:
+            events.reverse()   # el final llega antes que el informativo
+        await asyncio.sleep(delay)
+        for ev in events:
+            await _deliver(charge.callback_url, ev)
+        if random.random() < config.duplicate_rate:
+            await _deliver(charge.callback_url, final)   # mismo id: reentrega
+
+    @app.post("/v1/charges", status_code=202)
+    async def create_charge(charge: ChargeIn, idempotency_key: Optional[str] = Header(default=None)):
+        # como un proveedor real: la misma Idempotency-Key devuelve la respuesta original
+        if idempotency_key and idempotency_key in seen:
+            stats["idempotent_replays"] += 1
+            return seen[idempotency_key]
+        stats["charges"] += 1
+        provider_ref = f"pr_{uuid.uuid4().hex[:16]}"
+        asyncio.get_running_loop().create_task(_settle(charge, provider_ref))
+        out = {"id": provider_ref, "charge_id": charge.charge_id, "status": "pending"}
+        if idempotency_key:
+            seen[idempotency_key] = out
+        return out
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description="Simulador del proveedor de pagos")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8010)
+    ap.add_argument("--latency", type=float, default=2.0)
+    ap.add_argument("--jitter", type=float, default=1.0)
+    ap.add_argument("--failure-rate", type=float, default=0.0)
+    ap.add_argument("--duplicate-rate", type=float, default=0.0)
+    ap.add_argument("--reorder-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    config = SimulatorConfig(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                             duplicate_rate=args.duplicate_rate, reorder_rate=args.reorder_rate)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
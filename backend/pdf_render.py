@@ -0,0 +1,60 @@
+"""
+Render de vouchers a PDF con WeasyPrint, importado recién en el primer uso.
+
+`import weasyprint` carga Pango/cairo: cientos de ms y decenas de MB de RSS por
+worker, aunque ese worker nunca genere un PDF. Acá el import ocurre dentro del
+pool de render (la primera vez que alguien pide un PDF) y el render también
+corre en ese pool, fuera del event loop.
+
+available() no importa nada: responde con find_spec hasta que un import real
+haya fallado (p.ej. el paquete está pero faltan las librerías nativas).
+"""
+import asyncio
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+class PdfRenderer:
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._html_cls = None
+        self._import_error: Optional[str] = None
+
+    def available(self) -> bool:
+        if self._import_error is not None:
+            return False
+        return self._html_cls is not None or importlib.util.find_spec("weasyprint") is not None
+
+    def _load(self):
+        with self._lock:
+            if self._html_cls is None and self._import_error is None:
+                try:
+                    from weasyprint import HTML
+                    self._html_cls = HTML
+                except Exception as e:   # OSError si faltan pango/cairo
+                    self._import_error = str(e)
+        return self._html_cls
+
+    def _render(self, html: str) -> Optional[bytes]:
+        cls = self._load()
+        return cls(string=html).write_pdf() if cls else None
+
+    async def render(self, html: str) -> Optional[bytes]:
+        """Bytes del PDF, o None si WeasyPrint no está disponible."""
+        if not self.available():
+            return None
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._render, html)
+
+    def status(self) -> dict:
+        return {"available": self.available(), "loaded": self._html_cls is not None,
+                "error": self._import_error}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,210 @@
+"""
+Perfilado bajo demanda para el panel admin (nada corre si no se pide).
+
+- LoopLagMonitor: un latido en el event loop y un hilo vigía. Si el latido se
+  atrasa más que el umbral, el vigía toma el stack del hilo del loop en ese
+  momento: así se ve qué lo bloquea (WeasyPrint, bcrypt, serialización...) y no
+  solo que estuvo bloqueado. Con umbral 0 no hay tarea ni hilo.
+- StackSampler: muestreo de sys._current_frames() cada pocos ms desde un hilo
+  aparte; devuelve stacks colapsados ("a;b;c N") listos para flamegraph.pl /
+  speedscope.
+- RequestProfiler: perfila una sola petición (cProfile → pstats, o el sampler
+  → colapsados). cProfile ve todo lo que corre en el hilo del loop mientras
+  dura la petición, incluidas otras peticiones concurrentes: es para mirar en
+  un worker tranquilo o reproducir un caso, no para medir en plena carga.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional, Tuple
+
+from metrics_util import percentile
+
+logger = logging.getLogger("tennis_booking.profiling")
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse(frame) -> str:
+    """Stack de la raíz a la hoja, separado por ';' (formato de flamegraph.pl)."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def render_collapsed(samples: Counter) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in samples.most_common())
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float, interval: float = 0.1, max_stalls: int = 20):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self._lags = deque(maxlen=1000)
+        self._stalls = deque(maxlen=max_stalls)
+        self._stall_count = 0
+        self._max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._beat_at = 0.0
+        self._beat_seq = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self.running or self.threshold_ms <= 0:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat_at = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await asyncio.to_thread(self._thread.join, 1.0)
+        self._thread = None
+
+    async def _beat(self):
+        while True:
+            t0 = time.monotonic()
+            self._beat_at = t0
+            self._beat_seq += 1
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.monotonic() - t0 - self.interval) * 1000)
+            self._lags.append(lag_ms)
+            self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+
+    def _watch(self):
+        reported = -1
+        # el vigía revisa más seguido que el umbral para agarrar el stack mientras el bloqueo sigue
+        period = max(0.005, min(self.interval, self.threshold_ms / 1000) / 2)
+        while not self._stop.wait(period):
+            seq = self._beat_seq
+            blocked_ms = (time.monotonic() - self._beat_at - self.interval) * 1000
+            if blocked_ms < self.threshold_ms or seq == reported:
+                continue
+            reported = seq   # un reporte por bloqueo, no uno por vuelta del vigía
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame, limit=15) if frame is not None else []
+            self._stall_count += 1
+            self._stalls.append({
+                "at":         datetime.now(timezone.utc).isoformat(),
+                "blocked_ms": round(blocked_ms, 1),
+                "stack":      [line.rstrip() for line in stack],
+            })
+            logger.warning("event loop bloqueado %.0f ms; stack del loop:\n%s", blocked_ms, "".join(stack))
+
+    def stats(self) -> dict:
+        return {
+            "running":      self.running,
+            "threshold_ms": self.threshold_ms,
+            "p50_lag_ms":   round(percentile(self._lags, 50), 1),
+            "p99_lag_ms":   round(percentile(self._lags, 99), 1),
+            "max_lag_ms":   round(self._max_lag_ms, 1),
+            "stalls":       self._stall_count,
+            "recent":       list(self._stalls),
+        }
+
+
+class StackSampler:
+    """Muestrea un hilo (por defecto el que lo crea, o sea el del loop) o todos."""
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None, all_threads: bool = False):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.all_threads = all_threads
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()} if self.all_threads else {}
+        for tid, frame in sys._current_frames().items():
+            if tid == me or (not self.all_threads and tid != self.thread_id):
+                continue
+            stack = collapse(frame)
+            self.samples[f"{names.get(tid, tid)};{stack}" if self.all_threads else stack] += 1
+
+    def run(self, seconds: float) -> Counter:
+        """Bloqueante: llamarlo desde un hilo (asyncio.to_thread), nunca desde el loop."""
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            self._sample()
+            self._stop.wait(self.interval)
+        return self.samples
+
+    def stop(self):
+        self._stop.set()
+
+
+class RequestProfiler:
+    """Uno a la vez: cProfile no admite dos perfiles activos en el mismo proceso."""
+
+    MODES = ("cprofile", "collapsed")
+
+    def __init__(self, sort: str = "cumulative", top: int = 60, sample_interval: float = 0.002):
+        self.sort = sort
+        self.top = top
+        self.sample_interval = sample_interval
+        self._busy = False
+
+    def acquire(self):
+        if self._busy:
+            raise ProfilerBusy()
+        self._busy = True
+
+    def release(self):
+        self._busy = False
+
+    async def run(self, mode: str, fn: Callable[[], Awaitable]) -> Tuple[object, str]:
+        self.acquire()
+        try:
+            if mode == "cprofile":
+                prof = cProfile.Profile()
+                prof.enable()
+                try:
+                    result = await fn()
+                finally:
+                    prof.disable()
+                out = io.StringIO()
+                pstats.Stats(prof, stream=out).strip_dirs().sort_stats(self.sort).print_stats(self.top)
+                return result, out.getvalue()
+            sampler = StackSampler(self.sample_interval)
+            sampling = asyncio.get_running_loop().run_in_executor(None, sampler.run, 3600.0)
+            try:
+                result = await fn()
+            finally:
+                sampler.stop()
+                await sampling
+            return result, render_collapsed(sampler.samples)
+        finally:
+            self.release()
@@ -0,0 +1,107 @@
+"""
+Rate limiting por token bucket (por IP y por identidad) con costo por ruta.
+
+- TokenBucketLimiter: en memoria del proceso; cada bucket es una lista
+  [tokens, último_refill] en un dict. Los buckets que ya se rellenaron por
+  completo se barren periódicamente (no guardan información útil).
+- MongoRateLimiter: modo compartido entre workers sobre una colección con
+  índice TTL. Usa ventanas fijas de capacity/rate segundos (aproximación del
+  bucket que cabe en un solo $inc atómico); cuesta un round trip por petición.
+"""
+import math
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from pymongo import ReturnDocument
+
+
+@dataclass(frozen=True)
+class Bucket:
+    capacity: float
+    rate:     float   # tokens por segundo
+
+
+@dataclass(frozen=True)
+class RouteCost:
+    method:  str
+    pattern: Pattern
+    cost:    float
+    name:    str
+
+
+def route(method: str, path_regex: str, cost: float, name: str) -> RouteCost:
+    return RouteCost(method.upper(), re.compile(path_regex), cost, name)
+
+
+def match_route(rules: List[RouteCost], method: str, path: str) -> Optional[RouteCost]:
+    for rule in rules:
+        if (rule.method == "*" or rule.method == method) and rule.pattern.match(path):
+            return rule
+    return None
+
+
+class TokenBucketLimiter:
+    def __init__(self, sweep_every: float = 60.0):
+        self._buckets: Dict[str, list] = {}
+        self._sweep_every = sweep_every
+        self._swept_at = time.monotonic()
+        self.rejected = 0
+
+    async def hit(self, key: str, bucket: Bucket, cost: float) -> Tuple[bool, float]:
+        """(permitido, segundos hasta poder reintentar)."""
+        now = time.monotonic()
+        if now - self._swept_at >= self._sweep_every:
+            self._sweep(now)
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = [bucket.capacity, now, bucket]
+        else:
+            b[0] = min(bucket.capacity, b[0] + (now - b[1]) * bucket.rate)
+            b[1] = now
+        if b[0] >= cost:
+            b[0] -= cost
+            return True, 0.0
+        self.rejected += 1
+        return False, (cost - b[0]) / bucket.rate
+
+    def _sweep(self, now: float):
+        self._swept_at = now
+        full = [k for k, (tokens, ts, bucket) in self._buckets.items()
+                if tokens + (now - ts) * bucket.rate >= bucket.capacity]
+        for k in full:
+            del self._buckets[k]
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "buckets": len(self._buckets), "rejected": self.rejected}
+
+
+class MongoRateLimiter:
+    def __init__(self, collection):
+        self.collection = collection
+        self.rejected = 0
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def hit(self, key: str, bucket: Bucket, cost: float) -> Tuple[bool, float]:
+        window = max(1.0, bucket.capacity / bucket.rate)
+        now = time.time()
+        start = math.floor(now / window) * window
+        doc = await self.collection.find_one_and_update(
+            {"_id": f"{key}:{int(start)}"},
+            {"$inc": {"used": cost},
+             "$setOnInsert": {"expires_at": datetime.fromtimestamp(start + window, timezone.utc)
+                              + timedelta(seconds=5)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["used"] <= bucket.capacity:
+            return True, 0.0
+        self.rejected += 1
+        return False, start + window - now
+
+    def stats(self) -> dict:
+        return {"backend": "mongo", "rejected": self.rejected}
@@ -0,0 +1,140 @@
+"""
+Preferencia de lectura por endpoint y read-your-writes con sesiones causales.
+
+Cada lectura se hace bajo un nombre de ruta ("availability", "my_bookings",
+"admin_lists", "reports", "exports", "vouchers"). READ_PREFERENCES cambia el
+modo de cada ruta sin tocar código:
+
+    READ_PREFERENCES="availability=secondaryPreferred,vouchers=nearest"
+    READ_MAX_STALENESS_SECONDS=120      # mínimo 90 (lo exige el driver)
+
+"conflicts" (chequeos al reservar) queda fijo en primary y no se puede cambiar.
+
+Read-your-writes: las escrituras de un usuario se hacen en una sesión causal y
+se guarda su operationTime/clusterTime por identidad durante READ_YOUR_WRITES_SECONDS.
+Si ese usuario lee dentro de la ventana, la lectura va en una sesión que
+arranca desde ese punto (afterClusterTime): un secundario atrasado espera a
+ponerse al día en lugar de devolver datos viejos. Fuera de la ventana no se
+abre sesión. El registro es por proceso: con varios workers conviene afinidad
+por usuario en el balanceador, o dejar my_bookings en primary.
+"""
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from pymongo.read_preferences import (Nearest, Primary, PrimaryPreferred, Secondary,
+                                      SecondaryPreferred)
+
+MIN_MAX_STALENESS = 90
+
+DEFAULT_ROUTES = {
+    "availability": "secondaryPreferred",
+    "my_bookings":  "secondaryPreferred",
+    "admin_lists":  "secondaryPreferred",
+    "reports":      "secondaryPreferred",
+    "exports":      "secondaryPreferred",
+    "vouchers":     "primary",     # se abren justo después de pagar
+}
+PINNED_PRIMARY = frozenset({"conflicts"})
+
+_MODES = {
+    "primary":            Primary,
+    "primarypreferred":   PrimaryPreferred,
+    "secondary":          Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest":            Nearest,
+}
+
+
+def parse_routes(spec: Optional[str]) -> Dict[str, str]:
+    routes = dict(DEFAULT_ROUTES)
+    for part in (spec or "").split(","):
+        name, _, mode = part.strip().partition("=")
+        if not name:
+            continue
+        if mode.strip().lower() not in _MODES:
+            raise ValueError(f"Read preference desconocida para {name}: {mode}")
+        routes[name.strip()] = mode.strip()
+    return routes
+
+
+class ReadRouting:
+    def __init__(self, routes: Dict[str, str], max_staleness: int = MIN_MAX_STALENESS,
+                 ryw_window: float = 300.0):
+        self.max_staleness = max(MIN_MAX_STALENESS, int(max_staleness))
+        self.ryw_window = ryw_window
+        self._prefs = {name: self._build(mode) for name, mode in routes.items()}
+        self._writes: Dict[str, Tuple[float, object, Optional[dict]]] = {}
+        self._lock = threading.Lock()
+        self.causal_reads = 0
+
+    def _build(self, mode: str):
+        cls = _MODES[mode.lower()]
+        if cls is Primary:
+            return Primary()
+        return cls(max_staleness=self.max_staleness)
+
+    def preference(self, route: str):
+        if route in PINNED_PRIMARY:
+            return Primary()
+        return self._prefs.get(route) or Primary()
+
+    def collection(self, coll, route: str):
+        return coll.with_options(read_preference=self.preference(route))
+
+    # ── read-your-writes ────────────────────────────────────────────────────
+    def remember(self, key: str, session):
+        if session is None or session.operation_time is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._writes[key.lower()] = (now + self.ryw_window, session.operation_time, session.cluster_time)
+            if len(self._writes) > 1024:
+                for k in [k for k, v in self._writes.items() if v[0] < now]:
+                    del self._writes[k]
+
+    def _last_write(self, key: Optional[str]):
+        if not key:
+            return None
+        entry = self._writes.get(key.lower())
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry
+
+    @asynccontextmanager
+    async def write_session(self, client, key: Optional[str]):
+        """Sesión causal para una escritura; al salir recuerda su operationTime para `key`."""
+        if not key:
+            yield None
+            return
+        async with await client.start_session(causal_consistency=True) as session:
+            yield session
+            self.remember(key, session)
+
+    @asynccontextmanager
+    async def read_session(self, client, key: Optional[str], always: bool = False):
+        """
+        Sesión encadenada a la última escritura de `key`, o None si no hay una reciente.
+        Con always=True se abre una sesión causal igual (lecturas que deben ser coherentes entre sí).
+        """
+        entry = self._last_write(key)
+        if entry is None and not always:
+            yield None
+            return
+        async with await client.start_session(causal_consistency=True) as session:
+            if entry is not None:
+                _, operation_time, cluster_time = entry
+                if cluster_time:
+                    session.advance_cluster_time(cluster_time)
+                session.advance_operation_time(operation_time)
+                self.causal_reads += 1
+            yield session
+
+    def stats(self) -> dict:
+        return {
+            "routes":          {name: pref.mongos_mode for name, pref in self._prefs.items()},
+            "max_staleness":   self.max_staleness,
+            "tracked_writers": len(self._writes),
+            "causal_reads":    self.causal_reads,
+        }
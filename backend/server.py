@@ -1,30 +1,217 @@
 import os
 import re
 import io
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import socket
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from datetime import datetime, date, time, timedelta, timezone
-from typing import List, Optional, Literal
+from typing import List, Optional, Literal, Tuple
+from zoneinfo import ZoneInfo
 
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
 from pydantic import BaseModel, EmailStr, Field, validator
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from bson import ObjectId
-
-# PDF opcional (WeasyPrint)
-try:
-    from weasyprint import HTML as WeasyHTML
-    WEASY_AVAILABLE = True
-except Exception:
-    WEASY_AVAILABLE = False
+from bson import Binary, ObjectId, Int64
+from pymongo import ReplaceOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from event_log import EventLog, fold_events
+from free_index import FreeIntervalIndex, date_range, find_slots
+from auth_tokens import MongoRevocations, TokenError, TokenService, parse_keys
+from jobs import JobQueue, JobWorker, parse_concurrency
+from mongo_pool import PoolWaitMetrics, client_options, warm_connections
+from payment_gateway import TERMINAL_EVENTS, GatewayClient, verify as verify_signature
+from passwords import UNUSABLE_PASSWORD, PasswordService, PasswordServiceBusy
+from pdf_render import PdfRenderer
+from profiling import LoopLagMonitor, ProfilerBusy, RequestProfiler, StackSampler, render_collapsed
+from read_routing import ReadRouting, parse_routes
+from ratelimit import Bucket, MongoRateLimiter, TokenBucketLimiter, match_route, route
+from singleflight import SingleFlight
+from user_search import PrefixCache, mongo_filter, normalize, query_words, search_tokens
+from versions import VersionCache
+from venues import VenueConfig, VenueRegistry, hhmm_to_minutes, minutes_to_hhmm, occupancy_mask
 
 # ─────────────────────────────────────────────────────────────────────────────
 # App
 # ─────────────────────────────────────────────────────────────────────────────
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not JWT_SECRETS and not JWT_ALLOW_DEV_KEY:
+        # la clave por defecto sale de valores públicos: cualquiera podría firmar tokens de admin
+        raise RuntimeError("Falta JWT_SECRETS (o JWT_ALLOW_DEV_KEY=1 solo para desarrollo)")
+    await connect_mongo()
+    await ensure_rate_limit_indexes()
+    await ensure_token_indexes()
+    await ensure_venue_indexes()
+    await ensure_job_indexes()
+    if JOB_WORKER_IN_API:
+        start_job_worker()
+    start_version_poller()
+    loop_monitor.start()   # sin LOOP_LAG_THRESHOLD_MS no hace nada
+    events.start()
+    if PAYMENT_MODE == "gateway":
+        start_payment_dispatcher()
+    try:
+        yield
+    finally:
+        await stop_version_poller()
+        await stop_payment_dispatcher()
+        await stop_job_worker()
+        await loop_monitor.stop()
+        await events.stop()   # antes de cerrar Mongo: vacía lo pendiente
+        stop_worker_pools()
+        close_mongo()
+
+
+app = FastAPI(lifespan=lifespan)
+logger = logging.getLogger("tennis_booking")
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Rate limiting (token bucket por IP y por identidad; ver ratelimit.py)
+# Se registra antes que CORS para que CORS quede como middleware más externo
+# y las respuestas 429 también lleven sus cabeceras.
+# ─────────────────────────────────────────────────────────────────────────────
+RATE_LIMIT_ENABLED   = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_BACKEND   = os.getenv("RATE_LIMIT_BACKEND", "memory")   # 'memory' | 'mongo'
+RATE_LIMIT_TRUST_XFF = os.getenv("RATE_LIMIT_TRUST_XFF", "0") == "1"  # detrás de ngrok / proxy
+IP_BUCKET       = Bucket(capacity=float(os.getenv("RATE_LIMIT_IP_BURST", "60")),
+                         rate=float(os.getenv("RATE_LIMIT_IP_RATE", "1")))
+IDENTITY_BUCKET = Bucket(capacity=float(os.getenv("RATE_LIMIT_ID_BURST", "30")),
+                         rate=float(os.getenv("RATE_LIMIT_ID_RATE", "0.5")))
+# intentos de login por email (1 token por intento): frena el credential stuffing repartido en muchas IPs
+LOGIN_EMAIL_BUCKET = Bucket(capacity=float(os.getenv("RATE_LIMIT_LOGIN_BURST", "10")),
+                            rate=float(os.getenv("RATE_LIMIT_LOGIN_RATE", str(1 / 60))))
+
+# costo en tokens por ruta (la primera que coincide); rutas no listadas no se limitan
+RATE_LIMIT_ROUTES = [
+    route("POST", r"^/api/users/login$",      5, "login"),
+    route("POST", r"^/api/admin/login$",      5, "admin_login"),
+    route("POST", r"^/api/users/register$",   5, "register"),
+    route("POST", r"^/api/bookings$",         2, "booking"),
+    route("POST", r"^/api/bookings/series$",  5, "booking_series"),
+    route("POST", r"^/api/bookings/bulk-",    5, "booking_bulk"),
+    route("GET",  r"^/voucher/[^/]+\.pdf$",  10, "voucher_pdf"),
+    route("GET",  r"^/voucher/[^/]+$",        2, "voucher_html"),
+    route("GET",  r"^/api/availability/",     1, "availability"),
+    route("GET",  r"^/api/slots/search$",     2, "slot_search"),
+]
+
+rate_limiter = None   # se crea en el primer uso (el modo mongo necesita db)
+
+
+def _rate_limiter():
+    global rate_limiter
+    if rate_limiter is None:
+        rate_limiter = MongoRateLimiter(db.rate_limits) if RATE_LIMIT_BACKEND == "mongo" else TokenBucketLimiter()
+    return rate_limiter
+
+
+def _client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_XFF:
+        xff = request.headers.get("x-forwarded-for")
+        if xff:
+            return xff.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _token_subject(request: Request) -> Optional[str]:
+    auth = request.headers.get("authorization") or ""
+    if not auth.lower().startswith("bearer "):
+        return None
+    try:
+        return tokens.verify(auth[7:]).get("sub")
+    except TokenError:
+        return None
+
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    rule = match_route(RATE_LIMIT_ROUTES, request.method, request.url.path) if RATE_LIMIT_ENABLED else None
+    if rule is None:
+        return await call_next(request)
+    limiter = _rate_limiter()
+    checks = [(f"ip:{_client_ip(request)}", IP_BUCKET)]
+    subject = _token_subject(request)
+    if subject:
+        checks.append((f"id:{subject}", IDENTITY_BUCKET))
+    for key, bucket in checks:
+        allowed, retry_after = await limiter.hit(key, bucket, rule.cost)
+        if not allowed:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Demasiadas solicitudes, intenta más tarde"},
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
+    return await call_next(request)
+
+
+async def limit_login_attempts(venue_id: str, email: str):
+    """El middleware no ve el cuerpo: el límite por email se aplica dentro de los endpoints de login."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    allowed, retry_after = await _rate_limiter().hit(f"login:{venue_id}:{email.lower()}", LOGIN_EMAIL_BUCKET, 1)
+    if not allowed:
+        raise HTTPException(status_code=429, detail="Demasiados intentos, intenta más tarde",
+                            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Perfilado bajo demanda (solo admin; ver profiling.py)
+# PROFILE_REQUESTS=1 registra el middleware de la cabecera X-Profile: apagado no
+# suma ni un salto por petición. LOOP_LAG_THRESHOLD_MS > 0 arranca el monitor de
+# lag con el API; también se prende y apaga en caliente desde el admin.
+# ─────────────────────────────────────────────────────────────────────────────
+PROFILE_REQUESTS      = os.getenv("PROFILE_REQUESTS", "0") == "1"
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "0"))
+PROFILE_MAX_SECONDS   = 120
+
+request_profiler = RequestProfiler()
+loop_monitor = LoopLagMonitor(LOOP_LAG_THRESHOLD_MS)
+
+
+def _is_admin_request(request: Request) -> bool:
+    auth = request.headers.get("authorization") or ""
+    if not auth.lower().startswith("bearer "):
+        return False
+    try:
+        return tokens.verify(auth[7:]).get("role") == "admin"
+    except TokenError:
+        return False
+
+
+async def profile_request(request: Request, call_next):
+    """X-Profile: cprofile (pstats) | collapsed (stacks muestreados). Devuelve el perfil en vez del cuerpo."""
+    mode = request.headers.get("x-profile")
+    if mode not in RequestProfiler.MODES or not _is_admin_request(request):
+        return await call_next(request)
+
+    async def run():
+        response = await call_next(request)
+        # el cuerpo se consume dentro del perfil: las respuestas en streaming trabajan ahí
+        async for _ in response.body_iterator:
+            pass
+        return response.status_code
+
+    try:
+        status, report = await request_profiler.run(mode, run)
+    except ProfilerBusy:
+        return JSONResponse(status_code=409, content={"detail": "Ya hay un perfilado en curso"})
+    return Response(report, media_type="text/plain; charset=utf-8", headers={"X-Profiled-Status": str(status)})
+
+
+if PROFILE_REQUESTS:
+    app.middleware("http")(profile_request)
+
 
 # CORS dinámico (útil para ngrok). Puedes pasar varios orígenes separados por coma.
 ALLOWED_ORIGINS = [
@@ -42,28 +229,141 @@ app.add_middleware(
 )
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # MongoDB
 # ─────────────────────────────────────────────────────────────────────────────
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME   = os.getenv("DB_NAME",   "tennis_booking_db")
-client    = AsyncIOMotorClient(MONGO_URL)
-db        = client[DB_NAME]
+MONGO_OPTIONS = client_options()   # pool / compresión desde env (ver mongo_pool.py)
+pool_metrics  = PoolWaitMetrics()
+
+# se crean en el lifespan (o con connect_mongo() desde manage.py / scripts)
+client = None
+db     = None
+
+
+async def connect_mongo(warm: bool = True):
+    """Crea el cliente con el pool configurado y, si warm, abre conexiones antes de recibir tráfico."""
+    global client, db
+    if client is not None:
+        return
+    client = AsyncIOMotorClient(MONGO_URL, event_listeners=[pool_metrics], **MONGO_OPTIONS)
+    db = client[DB_NAME]
+    if warm:
+        # pings concurrentes: cada uno toma una conexión distinta del pool
+        n = warm_connections(MONGO_OPTIONS)
+        t0 = asyncio.get_running_loop().time()
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(n)))
+        logger.info("Mongo: %d conexiones precalentadas en %.0f ms", n,
+                    (asyncio.get_running_loop().time() - t0) * 1000)
+
+
+def close_mongo():
+    global client, db, job_queue
+    if client is not None:
+        client.close()
+    client = db = job_queue = None
+    _venue_dbs.clear()
+
+# Multi-local. Todos los documentos llevan venue_id y los índices empiezan por él.
+#   shared    → una sola base (DB_NAME) para todos los locales
+#   per_venue → cada local en su propia base "{DB_NAME}_{venue_id}" (el local por defecto usa DB_NAME)
+VENUE_DB_MODE = os.getenv("VENUE_DB_MODE", "shared")
+_venue_dbs: dict = {}
+
+
+def venue_db(venue_id: str):
+    if VENUE_DB_MODE != "per_venue" or venue_id == venue_registry.default_id:
+        return db
+    vdb = _venue_dbs.get(venue_id)
+    if vdb is None:
+        vdb = _venue_dbs[venue_id] = client[f"{DB_NAME}_{venue_id}"]
+    return vdb
+
+
+# Lecturas por endpoint: primary / secondaryPreferred + maxStalenessSeconds (ver read_routing.py)
+reads = ReadRouting(
+    parse_routes(os.getenv("READ_PREFERENCES")),
+    max_staleness=int(os.getenv("READ_MAX_STALENESS_SECONDS", "90")),
+    ryw_window=float(os.getenv("READ_YOUR_WRITES_SECONDS", "300")),
+)
+
+
+def read_coll(venue_id: str, name: str, route: str):
+    return reads.collection(venue_db(venue_id)[name], route)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Admin / Config
 # ─────────────────────────────────────────────────────────────────────────────
 ADMIN_EMAIL    = os.getenv("ADMIN_EMAIL", "admin@tenniscourt.com")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
-ADMIN_TOKEN    = os.getenv("ADMIN_TOKEN", "admin123token")
+ADMIN_TOKEN    = os.getenv("ADMIN_TOKEN", "admin123token")   # solo semilla de la clave JWT por defecto
+
+# Sesiones: JWT firmados (ver auth_tokens.py). Verificación en memoria, sin lecturas a Mongo.
+# Sin JWT_SECRETS el API no arranca, salvo JWT_ALLOW_DEV_KEY=1 (clave derivada de ADMIN_TOKEN).
+JWT_SECRETS       = os.getenv("JWT_SECRETS")
+JWT_ALLOW_DEV_KEY = os.getenv("JWT_ALLOW_DEV_KEY", "0") == "1"
+tokens = TokenService(
+    parse_keys(JWT_SECRETS, fallback_seed=f"{ADMIN_TOKEN}:{ADMIN_PASSWORD}"),
+    access_ttl=int(os.getenv("ACCESS_TOKEN_TTL", "3600")),
+    refresh_ttl=int(os.getenv("REFRESH_TOKEN_TTL", str(14 * 86400))),
+)
 
-PAYMENT_MODE   = os.getenv("PAYMENT_MODE", "mock")  # 'mock'
+# Hash de contraseñas en pool de hilos acotado (ver passwords.py)
+_argon2_params = {
+    f"argon2__{k}": int(os.environ[env])
+    for k, env in (("time_cost", "ARGON2_TIME_COST"), ("memory_cost", "ARGON2_MEMORY_COST"),
+                   ("parallelism", "ARGON2_PARALLELISM"))
+    if os.getenv(env)
+}
+passwords = PasswordService(
+    schemes=[x.strip() for x in os.getenv("PASSWORD_SCHEMES", "argon2,pbkdf2_sha256").split(",") if x.strip()],
+    max_workers=int(os.getenv("PASSWORD_WORKERS", "4")),
+    max_pending=int(os.getenv("PASSWORD_MAX_PENDING", "64")),
+    **_argon2_params,
+)
+
+PAYMENT_MODE   = os.getenv("PAYMENT_MODE", "mock")  # 'mock' (se liquida en el acto) | 'gateway' (pending + webhook)
 PRICE_PER_HOUR = float(os.getenv("PRICE_PER_HOUR", "35"))
 MOCK_DB        = {"charges": {}}  # cache en memoria (opcional)
 
+# Proveedor de pagos (modo gateway; en desarrollo: payment_simulator.py)
+PAYMENT_GATEWAY_URL    = os.getenv("PAYMENT_GATEWAY_URL", "http://localhost:8010")
+PAYMENT_WEBHOOK_URL    = os.getenv("PAYMENT_WEBHOOK_URL", "http://localhost:8001/api/payments/webhook")
+PAYMENT_WEBHOOK_SECRET = os.getenv("PAYMENT_WEBHOOK_SECRET", "dev-webhook-secret")
+PAYMENT_DISPATCHERS    = int(os.getenv("PAYMENT_DISPATCHERS", "4"))
+gateway = GatewayClient(PAYMENT_GATEWAY_URL, timeout=float(os.getenv("PAYMENT_GATEWAY_TIMEOUT", "5")),
+                        max_workers=PAYMENT_DISPATCHERS)
+
 VOUCHER_ADDRESS = "Tomas Marsano 2175, Surquillo"  # Dirección demo impresa en el voucher
 
+# PDF opcional (WeasyPrint se importa recién al primer voucher en PDF; ver pdf_render.py)
+pdf = PdfRenderer(max_workers=int(os.getenv("PDF_WORKERS", "2")))
+
+# Canchas / horario / tarifas (ver venues.py). Se recarga solo si cambia el archivo.
+venue_registry = VenueRegistry(os.getenv("VENUE_CONFIG"), PRICE_PER_HOUR, VOUCHER_ADDRESS)
+
+
+# lecturas idénticas concurrentes (misma fecha / mismo voucher) comparten una sola consulta
+singleflight = SingleFlight()
+
+
+def get_venue(request: Request) -> VenueConfig:
+    # ruteo por local: cabecera X-Venue-Id o ?venue=; sin ninguno → local por defecto
+    venue_id = request.headers.get("X-Venue-Id") or request.query_params.get("venue")
+    venue = venue_registry.get(venue_id)
+    if venue is None:
+        raise HTTPException(status_code=404, detail="Local no encontrado")
+    return venue
+
+
+def _voucher_url(venue: VenueConfig, charge_id: str) -> str:
+    if venue.id == venue_registry.default_id:
+        return f"/voucher/{charge_id}"
+    return f"/voucher/{charge_id}?venue={venue.id}"
+
 
 def now_iso():
     return datetime.now(timezone.utc).isoformat()
@@ -76,18 +376,25 @@ def soles_a_centimos(monto: float) -> int:
 # ─────────────────────────────────────────────────────────────────────────────
 # Models
 # ─────────────────────────────────────────────────────────────────────────────
-class User(BaseModel):
+def _check_phone(v: str) -> str:
+    digits = re.sub(r"\D", "", v)
+    if len(digits) != 9:
+        raise ValueError("El teléfono debe tener exactamente 9 dígitos")
+    return v.strip()
+
+
+class UserProfile(BaseModel):
     customer_name: str = Field(..., min_length=1)
     email:         EmailStr
     phone:         str
-    password:      str = Field(..., min_length=6)
 
     @validator("phone")
     def validate_phone(cls, v):
-        digits = re.sub(r"\D", "", v)
-        if len(digits) != 9:
-            raise ValueError("El teléfono debe tener exactamente 9 dígitos")
-        return v.strip()
+        return _check_phone(v)
+
+
+class User(UserProfile):
+    password:      str = Field(..., min_length=6)
 
 
 class UserLogin(BaseModel):
@@ -102,13 +409,24 @@ class PublicUser(BaseModel):
     phone:         str
 
 
+class UserSession(PublicUser):
+    access_token:  str
+    refresh_token: str
+    token_type:    str = "bearer"
+    expires_in:    int
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class Booking(BaseModel):
     customer_name: str
     email:         EmailStr
     phone:         str
     booking_date:  date
     start_time:    time
-    court_number:  int = Field(..., ge=1, le=3)
+    court_number:  int = Field(..., ge=1)   # se valida contra la config del local
     admin_comment: Optional[str] = Field(default=None, max_length=200)
     voucher_url:   Optional[str] = None   # ej: /voucher/ch_mock_xxx
     charge_id:     Optional[str] = None   # ej: ch_mock_xxx
@@ -127,18 +445,83 @@ class BookingInDB(BaseModel):
     admin_comment: Optional[str] = None
     voucher_url:   Optional[str] = None
     charge_id:     Optional[str] = None
+    series_id:     Optional[str] = None
 
     class Config:
         orm_mode = True
 
 
+class Reservation(BaseModel):
+    """Bloque contiguo de turnos (lo que el cliente reservó de una vez)."""
+    booking_date:  str
+    court_number:  int
+    start_time:    str
+    end_time:      str
+    hours:         float
+    status:        str
+    price_cents:   int
+    charge_id:     Optional[str] = None
+    voucher_url:   Optional[str] = None
+    admin_comment: Optional[str] = None
+    payment_type:  Optional[str] = None
+    booking_ids:   List[str]
+
+
+class BookingSeries(BaseModel):
+    customer_name: str
+    email:         EmailStr
+    phone:         str
+    court_number:  int = Field(..., ge=1)
+    start_time:    time
+    first_date:    date
+    frequency:     Literal["weekly", "biweekly"] = "weekly"
+    until:         Optional[date] = None                       # fin por fecha…
+    count:         Optional[int] = Field(default=None, ge=1)   # …o por cantidad
+    admin_comment: Optional[str] = Field(default=None, max_length=200)
+
+
+class BulkBookingFilter(BaseModel):
+    date_from:     date
+    date_to:       Optional[date] = None        # por defecto: solo date_from
+    court_numbers: Optional[List[int]] = None   # por defecto: todas las canchas
+    start_time:    Optional[time] = None        # franja [start_time, end_time); por defecto: todo el día
+    end_time:      Optional[time] = None
+    reason:        Optional[str] = Field(default=None, max_length=200)
+
+
+class BookingSeriesUpdate(BaseModel):
+    customer_name: Optional[str] = Field(default=None, min_length=1)
+    phone:         Optional[str] = None
+    admin_comment: Optional[str] = Field(default=None, max_length=200)
+    from_date:     Optional[date] = None   # por defecto: desde hoy
+
+    # las mismas reglas que el perfil: el update_many los copia tal cual a todas las reservas
+    @validator("customer_name", "phone")
+    def not_null(cls, v):
+        if v is None:
+            raise ValueError("No puede ser nulo")
+        return v
+
+    @validator("phone")
+    def validate_phone(cls, v):
+        return _check_phone(v)
+
+
+class WaitlistEntry(BaseModel):
+    customer_name: Optional[str] = None
+    email:         EmailStr
+    booking_date:  date
+    start_time:    time
+    court_number:  int = Field(..., ge=1)
+
+
 class AdminLogin(BaseModel):
     email:    EmailStr
     password: str
 
 
 class PaymentRequest(BaseModel):
-    amount_soles: float
+    amount_soles: Optional[float] = None   # si viene, tiene que coincidir con la tarifa del turno
     email: EmailStr
     method: Literal["card", "yape"] = "card"
     description: Optional[str] = "Pago de reserva (demo)"
@@ -149,25 +532,576 @@ class PaymentRequest(BaseModel):
 # ─────────────────────────────────────────────────────────────────────────────
 # Auth dep
 # ─────────────────────────────────────────────────────────────────────────────
+class Principal(BaseModel):
+    sub:   str            # email
+    role:  Literal["user", "admin"]
+    venue: str
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+
+def _principal(credentials: Optional[HTTPAuthorizationCredentials]) -> Principal:
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        claims = tokens.verify(credentials.credentials)
+    except TokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return Principal(sub=claims["sub"], role=claims["role"], venue=claims["venue"])
+
+
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> Principal:
+    principal = _principal(credentials)
+    # un usuario solo opera en su local; el admin en cualquiera
+    venue_id = request.headers.get("X-Venue-Id") or request.query_params.get("venue") or venue_registry.default_id
+    if not principal.is_admin and principal.venue != venue_id:
+        raise HTTPException(status_code=403, detail="Token de otro local")
+    return principal
+
+
+async def get_optional_user(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> Optional[Principal]:
+    if credentials is None:
+        return None
+    return await get_current_user(request, credentials)
+
+
 async def get_current_admin(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    if credentials.credentials != ADMIN_TOKEN:
+    principal = _principal(credentials)
+    if not principal.is_admin:
         raise HTTPException(status_code=401, detail="Invalid admin token")
     return True
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Daily summaries — un documento por (local, fecha) mantenido con $inc/$bit
+#   { venue_id, date, booked_hours, revenue_cents, cancellations, blocked_hours,
+#     courts: { "1": {mask, hours, blocked_hours}, ... } }
+# Los bloqueos de mantenimiento (blocked=True) ocupan la máscara pero no suman horas
+# reservadas ni cancelaciones: van aparte en blocked_hours.
+# mask: bit i = franja de 30 min (venues.MASK_UNIT_MINUTES) que empieza en i*30 desde 00:00
+# ─────────────────────────────────────────────────────────────────────────────
+def _booking_minutes(booking: dict, venue: VenueConfig) -> int:
+    if booking.get("end_time"):
+        return hhmm_to_minutes(booking["end_time"]) - hhmm_to_minutes(booking["start_time"])
+    return venue.slot_minutes
+
+
+def _booking_mask(booking: dict, venue: VenueConfig) -> int:
+    return occupancy_mask(hhmm_to_minutes(booking["start_time"]), _booking_minutes(booking, venue))
+
+
+def _booking_price_cents(booking: dict, venue: VenueConfig) -> int:
+    # el precio se congela al reservar; las reservas antiguas se valoran con la tarifa actual
+    if booking.get("price_cents") is not None:
+        return int(booking["price_cents"])
+    return venue.price_cents(date.fromisoformat(booking["booking_date"]), booking["start_time"])
+
+
+def _summary_update(venue: VenueConfig, booking: dict, added: bool = True):
+    """(filtro, update) para sumar o restar una reserva del resumen de su día."""
+    court = str(booking["court_number"])
+    sign = 1 if added else -1
+    hours = sign * _booking_minutes(booking, venue) / 60
+    mask = _booking_mask(booking, venue)
+    if booking.get("blocked"):
+        inc = {f"courts.{court}.blocked_hours": hours, "blocked_hours": hours}
+    else:
+        inc = {
+            f"courts.{court}.hours": hours,
+            "booked_hours": hours,
+            "revenue_cents": sign * _booking_price_cents(booking, venue),
+        }
+        if not added:
+            inc["cancellations"] = 1
+    return (
+        {"venue_id": venue.id, "date": booking["booking_date"]},
+        {
+            "$bit": {f"courts.{court}.mask": {"or": Int64(mask)} if added else {"and": Int64(~mask)}},
+            "$inc": inc,
+            "$set": {"updated_at": now_iso()},
+        },
+    )
+
+
+async def _summary_add_booking(venue: VenueConfig, booking: dict):
+    await venue_db(venue.id).daily_summaries.update_one(*_summary_update(venue, booking, True), upsert=True)
+    _index_apply(venue, [booking], True)
+    await _bump_versions(venue, [booking])
+
+
+async def _summary_remove_booking(venue: VenueConfig, booking: dict):
+    await venue_db(venue.id).daily_summaries.update_one(*_summary_update(venue, booking, False), upsert=True)
+    _index_apply(venue, [booking], False)
+    await _bump_versions(venue, [booking])
+
+
+async def _summary_apply_many(venue: VenueConfig, bookings: List[dict], added: bool):
+    # varias reservas → un solo bulk_write
+    if added:
+        await _summary_apply_changes(venue, [], bookings)
+    else:
+        await _summary_apply_changes(venue, bookings, [])
+
+
+async def _summary_apply_changes(venue: VenueConfig, removed: List[dict], added: List[dict]):
+    # bajas y altas de una misma operación → un bulk_write y un solo bump de versiones
+    ops = [UpdateOne(*_summary_update(venue, b, False), upsert=True) for b in removed]
+    ops += [UpdateOne(*_summary_update(venue, b, True), upsert=True) for b in added]
+    if ops:
+        # con bajas y altas sobre el mismo turno el orden importa (el $bit de la alta va después)
+        await venue_db(venue.id).daily_summaries.bulk_write(ops, ordered=bool(removed and added))
+        _index_apply(venue, removed, False)
+        _index_apply(venue, added, True)
+        await _bump_versions(venue, removed + added)
+
+
+def _index_apply(venue: VenueConfig, bookings: List[dict], added: bool):
+    for b in bookings:
+        free_index.apply(venue.id, b["booking_date"], int(b["court_number"]), _booking_mask(b, venue), added)
+
+
+async def _load_summary(venue: VenueConfig, booking_date: str, route: str = "availability",
+                        session=None) -> Optional[dict]:
+    return await read_coll(venue.id, "daily_summaries", route).find_one(
+        {"venue_id": venue.id, "date": booking_date}, {"_id": 0}, session=session
+    )
+
+
+def _court_mask(summary: Optional[dict], court: int) -> int:
+    if not summary:
+        return 0
+    return int(((summary.get("courts") or {}).get(str(court)) or {}).get("mask") or 0)
+
+
+async def rebuild_daily_summaries(venue: VenueConfig, date_from: Optional[str] = None,
+                                  date_to: Optional[str] = None) -> int:
+    """
+    Recalcula daily_summaries de un local desde sus reservas (backfill / reparación).
+    Devuelve la cantidad de fechas escritas.
+    """
+    vdb = venue_db(venue.id)
+    rng = {}
+    if date_from:
+        rng["$gte"] = date_from
+    if date_to:
+        rng["$lte"] = date_to
+    match = {"venue_id": venue.id}
+    if rng:
+        match["booking_date"] = rng
+
+    summaries: dict = {}
+    projection = {"booking_date": 1, "start_time": 1, "end_time": 1,
+                  "court_number": 1, "status": 1, "price_cents": 1, "blocked": 1}
+    # las fechas archivadas siguen contando: se leen también de bookings_archive
+    async for b in _iter_with_archive(vdb, "bookings", match, projection):
+        s = summaries.setdefault(b["booking_date"], {
+            "venue_id": venue.id, "date": b["booking_date"], "booked_hours": 0, "revenue_cents": 0,
+            "cancellations": 0, "blocked_hours": 0, "courts": {},
+        })
+        if b.get("status") == "cancelled":
+            if not b.get("blocked"):
+                s["cancellations"] += 1
+            continue
+        c = s["courts"].setdefault(str(b["court_number"]), {"mask": 0, "hours": 0, "blocked_hours": 0})
+        hours = _booking_minutes(b, venue) / 60
+        c["mask"] |= _booking_mask(b, venue)
+        if b.get("blocked"):
+            c["blocked_hours"] += hours
+            s["blocked_hours"] += hours
+            continue
+        c["hours"] += hours
+        s["booked_hours"] += hours
+        s["revenue_cents"] += _booking_price_cents(b, venue)
+
+    ops = []
+    for d, s in summaries.items():
+        for c in s["courts"].values():
+            c["mask"] = Int64(c["mask"])
+        s["updated_at"] = now_iso()
+        ops.append(ReplaceOne({"venue_id": venue.id, "date": d}, s, upsert=True))
+    if ops:
+        await vdb.daily_summaries.bulk_write(ops, ordered=False)
+    # fechas del rango que ya no tienen reservas
+    stale = {"venue_id": venue.id, "date": {"$nin": list(summaries.keys())}}
+    if rng:
+        stale["date"].update(rng)
+    stale_dates = await vdb.daily_summaries.distinct("date", stale)
+    await vdb.daily_summaries.delete_many(stale)
+    for d in list(summaries) + stale_dates:
+        free_index.invalidate(venue.id, d)
+    await _bump_keys(venue, {_date_key(d) for d in list(summaries) + stale_dates})
+    return len(ops)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Versiones para ETags — colección versions: {venue_id, key, version, updated_at}
+#   key "date:YYYY-MM-DD" → disponibilidad / reservas del día
+#   key "email:<email>"   → mis reservas
+# Toda escritura de reservas pasa por _summary_* y sube las versiones afectadas.
+# ─────────────────────────────────────────────────────────────────────────────
+CACHE_PAST_SECONDS   = int(os.getenv("CACHE_PAST_SECONDS", "300"))     # fechas pasadas: cache compartida
+VERSION_POLL_SECONDS = float(os.getenv("VERSION_POLL_SECONDS", "2"))    # cambios de otros workers
+versions = VersionCache()
+_version_task: Optional[asyncio.Task] = None
+
+
+def _date_key(booking_date: str) -> str:
+    return f"date:{booking_date}"
+
+
+def _email_key(email: str) -> str:
+    return f"email:{email.lower()}"
+
+
+async def _bump_keys(venue: VenueConfig, keys):
+    if not keys:
+        return
+    now = now_iso()
+    await venue_db(venue.id).versions.bulk_write([
+        UpdateOne({"venue_id": venue.id, "key": k}, {"$inc": {"version": 1}, "$set": {"updated_at": now}},
+                  upsert=True)
+        for k in sorted(keys)
+    ], ordered=False)
+    for k in keys:
+        versions.forget(venue.id, k)   # se recarga en la próxima lectura
+
+
+async def _bump_versions(venue: VenueConfig, bookings: List[dict]):
+    keys = {_date_key(b["booking_date"]) for b in bookings}
+    keys |= {_email_key(b["email"]) for b in bookings if b.get("email")}
+    await _bump_keys(venue, keys)
+
+
+async def _read_version(venue: VenueConfig, key: str, session=None) -> int:
+    # desde el primario y en la misma sesión causal que el contenido: el contenido
+    # leído después (aunque venga de un secundario) es al menos tan nuevo como la versión
+    doc = await venue_db(venue.id).versions.find_one({"venue_id": venue.id, "key": key},
+                                                     {"_id": 0, "version": 1}, session=session)
+    version = int(doc["version"]) if doc else 0
+    versions.put(venue.id, key, version)
+    return version
+
+
+@lru_cache(maxsize=64)
+def _venue_tag(venue: VenueConfig) -> str:
+    # la grilla depende de la config: si cambia, cambian los ETags aunque no haya reservas nuevas
+    return hashlib.sha1(repr(venue.public()).encode()).hexdigest()[:8]
+
+
+def _etag(venue: VenueConfig, kind: str, version: int) -> str:
+    return f'"{kind}{version}-{_venue_tag(venue)}"'
+
+
+def _cache_control(booking_date: Optional[date], private: bool) -> str:
+    scope = "private" if private else "public"
+    if booking_date is not None and booking_date < date.today():
+        return f"{scope}, max-age={CACHE_PAST_SECONDS}"
+    return f"{scope}, no-cache"   # se puede guardar, pero se revalida siempre con If-None-Match
+
+
+def _cache_headers(venue: VenueConfig, kind: str, version: int, booking_date: Optional[date],
+                   private: bool) -> dict:
+    headers = {"ETag": _etag(venue, kind, version), "Cache-Control": _cache_control(booking_date, private)}
+    if not private:
+        headers["Vary"] = "X-Venue-Id"
+    return headers
+
+
+def _not_modified(request: Request, venue: VenueConfig, kind: str, key: str,
+                  booking_date: Optional[date], private: bool) -> Optional[Response]:
+    """304 solo con la versión en memoria (sin ir a Mongo); None si hay que responder completo."""
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return None
+    version = versions.get(venue.id, key)
+    if version is None:
+        return None
+    headers = _cache_headers(venue, kind, version, booking_date, private)
+    tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+    if headers["ETag"] in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+async def _version_poller():
+    since = datetime.now(timezone.utc)
+    while True:
+        await asyncio.sleep(VERSION_POLL_SECONDS)
+        try:
+            # margen de 5 s por relojes desfasados entre workers
+            query_from = (since - timedelta(seconds=5)).isoformat()
+            since = datetime.now(timezone.utc)
+            for venue in venue_registry.all():
+                cursor = venue_db(venue.id).versions.find(
+                    {"venue_id": venue.id, "updated_at": {"$gt": query_from}}, {"_id": 0, "key": 1, "version": 1}
+                )
+                async for doc in cursor:
+                    versions.update(venue.id, doc["key"], int(doc["version"]))
+                    if doc["key"].startswith("date:"):
+                        free_index.invalidate(venue.id, doc["key"][5:])   # se recarga al buscar
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("version poller")
+
+
+def start_version_poller():
+    global _version_task
+    _version_task = asyncio.create_task(_version_poller())
+
+
+async def stop_version_poller():
+    global _version_task
+    if _version_task:
+        _version_task.cancel()
+        try:
+            await _version_task
+        except asyncio.CancelledError:
+            pass
+        _version_task = None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Bitácora de eventos — colección booking_events (append-only, ver event_log.py)
+#   {_id, venue_id, type, booking_id, at, data}
+# Los handlers solo encolan; el insert_many va en lotes desde una tarea de fondo.
+# Un evento puede perderse si el proceso muere entre el emit y el flush.
+# ─────────────────────────────────────────────────────────────────────────────
+EVENT_BATCH_SIZE    = int(os.getenv("EVENT_BATCH_SIZE", "200"))
+EVENT_FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "0.5"))
+EVENT_MAX_BUFFER    = int(os.getenv("EVENT_MAX_BUFFER", "50000"))
+
+
+async def _write_events(batch: List[dict]):
+    by_db: dict = {}
+    for ev in batch:
+        vdb = venue_db(ev["venue_id"])
+        by_db.setdefault(vdb.name, (vdb, []))[1].append(ev)
+    for vdb, docs in by_db.values():
+        try:
+            await vdb.booking_events.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            # reintento de un lote que ya entró en parte: los duplicados se ignoran
+            if any(e.get("code") != 11000 for e in exc.details.get("writeErrors", [])):
+                raise
+
+
+events = EventLog(_write_events, max_batch=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_SECONDS,
+                  max_buffer=EVENT_MAX_BUFFER)
+
+
+def _booking_snapshot(b: dict) -> dict:
+    return {k: v for k, v in b.items() if k not in ("_id", "id")}
+
+
+def _emit_bookings(venue: VenueConfig, type_: str, bookings: List[dict], actor: str, **data):
+    for b in bookings:
+        booking_id = b.get("id") or str(b["_id"])
+        if type_ == "booking_created":
+            data["booking"] = _booking_snapshot(b)
+        events.emit(venue.id, type_, booking_id, actor=actor, **data)
+
+
+async def replay_events(venue: VenueConfig, into: str = "bookings_replayed", verify: bool = False) -> dict:
+    """
+    Reconstruye el estado de las reservas desde booking_events en la colección `into`.
+    Con verify compara contra bookings (+ archivo) y devuelve los ids que no coinciden.
+    """
+    vdb = venue_db(venue.id)
+    cursor = vdb.booking_events.find(
+        {"venue_id": venue.id, "booking_id": {"$ne": None}}, {"type": 1, "booking_id": 1, "data": 1}
+    ).sort([("at", 1), ("_id", 1)])
+    state = fold_events([ev async for ev in cursor])
+    target = vdb[into]
+    await target.delete_many({"venue_id": venue.id})
+    ids = list(state)
+    for i in range(0, len(ids), 500):
+        await target.insert_many([dict(state[bid], _id=ObjectId(bid)) for bid in ids[i:i + 500]], ordered=False)
+    out = {"bookings": len(state), "mismatches": []}
+    if verify:
+        live = {}
+        async for doc in _iter_with_archive(vdb, "bookings", {"_id": {"$in": [ObjectId(b) for b in ids]}}):
+            live[str(doc["_id"])] = doc
+        for bid, replayed in state.items():
+            doc = live.get(bid)
+            if doc is None or any(doc.get(k) != v for k, v in replayed.items()):
+                out["mismatches"].append(bid)
+    return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Archivo hot/cold — reservas y cobros viejos pasan a bookings_archive / charges_archive
+# Cada lote se copia (upsert por _id) y recién después se borra del hot: si el
+# proceso se corta, volver a correrlo retoma donde quedó sin duplicar ni perder.
+# Los lotes salen en orden (campo de edad, _id): todo lo archivado es anterior a
+# lo que queda en el hot, salvo el lote a medio mover que está en los dos.
+# ─────────────────────────────────────────────────────────────────────────────
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_FIELDS = {"bookings": "booking_date", "charges": "created_at"}   # campo que decide la edad
+
+
+def archive_cutoff(days: Optional[int] = None) -> str:
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    return (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+
+
+async def archive_collection(venue: VenueConfig, name: str, cutoff: str, batch_size: int = 500,
+                             pause: float = 0.1) -> int:
+    """Mueve los documentos de `name` anteriores a cutoff a `{name}_archive`. Devuelve cuántos movió."""
+    vdb = venue_db(venue.id)
+    hot, cold = vdb[name], vdb[f"{name}_archive"]
+    match = {"venue_id": venue.id, ARCHIVE_FIELDS[name]: {"$lt": cutoff}}
+    order = [(ARCHIVE_FIELDS[name], 1), ("_id", 1)]
+    moved = 0
+    while True:
+        docs = await hot.find(match).sort(order).limit(batch_size).to_list(None)
+        if not docs:
+            return moved
+        archived_at = now_iso()
+        await cold.bulk_write([ReplaceOne({"_id": d["_id"]}, dict(d, archived_at=archived_at), upsert=True)
+                               for d in docs], ordered=False)
+        res = await hot.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        moved += res.deleted_count
+        logger.info("archivo %s/%s: %d movidos", venue.id, name, moved)
+        if pause:
+            await asyncio.sleep(pause)   # deja respirar al primario y a la replicación
+
+
+async def _iter_with_archive(vdb, name: str, query: dict, projection: Optional[dict] = None,
+                             sort: Optional[list] = None, archive_first: bool = False):
+    """Documentos de `name` y de `{name}_archive` (el archivo primero si se listan en orden ascendente).
+    Un lote copiado al archivo y todavía no borrado del hot está en las dos: sale una sola vez."""
+    colls = [vdb[name], vdb[f"{name}_archive"]]
+    if archive_first:
+        colls.reverse()
+    seen = set()
+    for i, coll in enumerate(colls):
+        cursor = coll.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        async for doc in cursor:
+            if i == 0:
+                seen.add(doc["_id"])
+            elif doc["_id"] in seen:
+                continue
+            yield doc
+
+
+async def _drop_hot_copies(vdb, name: str, docs: List[dict]) -> List[dict]:
+    """Saca de una página de `{name}_archive` lo que sigue en `name` (archivo a medias): ya salió del hot."""
+    if not docs:
+        return docs
+    hot = {d["_id"] async for d in vdb[name].find({"_id": {"$in": [d["_id"] for d in docs]}}, {"_id": 1})}
+    return [d for d in docs if d["_id"] not in hot]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Índices (todos empiezan por venue_id: sirven también como shard keys)
+# ─────────────────────────────────────────────────────────────────────────────
+SHARD_KEYS = {
+    "bookings":        {"venue_id": 1, "booking_date": 1},
+    "charges":         {"venue_id": 1, "id": 1},
+    "users":           {"venue_id": 1, "email": 1},
+    "daily_summaries": {"venue_id": 1, "date": 1},
+}
+
+
+async def ensure_indexes(vdb):
+    await vdb.bookings.create_index(
+        [("venue_id", 1), ("booking_date", 1), ("court_number", 1), ("start_time", 1), ("status", 1)]
+    )
+    await vdb.bookings.create_index([("venue_id", 1), ("email", 1), ("booking_date", 1), ("start_time", 1)])
+    await vdb.bookings.create_index([("venue_id", 1), ("charge_id", 1)])
+    await vdb.bookings.create_index([("venue_id", 1), ("series_id", 1), ("booking_date", 1)])
+    await vdb.bookings.create_index([("venue_id", 1), ("bulk_op", 1)], sparse=True)
+    # un solo turno confirmado por cancha: los find_one previos son el atajo, la garantía es este índice
+    await vdb.bookings.create_index(
+        [("venue_id", 1), ("booking_date", 1), ("court_number", 1), ("start_time", 1)],
+        unique=True, partialFilterExpression={"status": "confirmed"},
+    )
+    await vdb.charges.create_index([("venue_id", 1), ("id", 1)], unique=True)
+    await vdb.charges.create_index([("venue_id", 1), ("created_at", -1)])
+    # libro de cobros: keyset (created_at, _id) y filtro por cliente
+    await vdb.charges.create_index([("venue_id", 1), ("created_at", -1), ("_id", -1)])
+    await vdb.charges.create_index([("venue_id", 1), ("email", 1), ("created_at", -1)])
+    await vdb.charges.create_index([("venue_id", 1), ("status", 1), ("created_at", 1)])
+    # webhooks del proveedor: un registro por evento (las reentregas chocan con el único)
+    await vdb.payment_events.create_index([("venue_id", 1), ("event_id", 1)], unique=True)
+    await vdb.users.create_index([("venue_id", 1), ("email", 1)], unique=True)
+    # autocompletado del admin: regex anclado ("^juan") sobre el multikey de tokens (ver user_search.py)
+    await vdb.users.create_index([("venue_id", 1), ("search_tokens", 1)])
+    # cola por turno: el primero en espera sale por índice, sin ordenar en memoria
+    await vdb.waitlist.create_index(
+        [("venue_id", 1), ("booking_date", 1), ("court_number", 1), ("start_time", 1),
+         ("status", 1), ("created_at", 1)]
+    )
+    await vdb.waitlist.create_index(
+        [("venue_id", 1), ("booking_date", 1), ("court_number", 1), ("start_time", 1), ("email", 1)],
+        unique=True, partialFilterExpression={"status": "waiting"},
+    )
+    await vdb.waitlist.create_index([("venue_id", 1), ("email", 1), ("status", 1)])
+    await vdb.outbox.create_index([("venue_id", 1), ("status", 1), ("created_at", 1)])
+    await vdb.voucher_files.create_index([("venue_id", 1), ("charge_id", 1)], unique=True)
+    await vdb.versions.create_index([("venue_id", 1), ("key", 1)], unique=True)
+    # límite diario: el único es el que hace atómico el $inc condicionado (ver _reserve_daily_hours)
+    await vdb.daily_limits.create_index([("venue_id", 1), ("email", 1), ("date", 1), ("court", 1)], unique=True)
+    await vdb.daily_limits.create_index("expires_at", expireAfterSeconds=0)
+    await vdb.versions.create_index([("venue_id", 1), ("updated_at", 1)])
+    # único por (local, fecha): evita duplicados cuando dos upserts llegan a la vez
+    if "date_1" in await vdb.daily_summaries.index_information():
+        await vdb.daily_summaries.drop_index("date_1")   # índice previo a multi-local
+    await vdb.daily_summaries.create_index([("venue_id", 1), ("date", 1)], unique=True)
+    # archivo: solo lo que usan vouchers y exportaciones
+    await vdb.bookings_archive.create_index([("venue_id", 1), ("booking_date", 1), ("start_time", 1)])
+    await vdb.bookings_archive.create_index([("venue_id", 1), ("charge_id", 1)])
+    await vdb.charges_archive.create_index([("venue_id", 1), ("id", 1)], unique=True)
+    await vdb.charges_archive.create_index([("venue_id", 1), ("created_at", -1), ("_id", -1)])
+    # bitácora: historia de una reserva y replay en orden
+    await vdb.booking_events.create_index([("venue_id", 1), ("booking_id", 1), ("at", 1)])
+    await vdb.booking_events.create_index([("venue_id", 1), ("at", 1), ("_id", 1)])
+
+
+async def ensure_rate_limit_indexes():
+    limiter = _rate_limiter()
+    if isinstance(limiter, MongoRateLimiter):
+        await limiter.ensure_indexes()
+
+
+async def ensure_token_indexes():
+    await _revocations().ensure_indexes()
+
+
+async def ensure_venue_indexes():
+    seen = set()
+    for venue in venue_registry.all():
+        vdb = venue_db(venue.id)
+        if vdb.name not in seen:
+            seen.add(vdb.name)
+            await ensure_indexes(vdb)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Health
 # ─────────────────────────────────────────────────────────────────────────────
 @app.get("/health")
-async def health():
-    charges_count = await db.charges.count_documents({})
+async def health(venue: VenueConfig = Depends(get_venue)):
+    charges_count = await venue_db(venue.id).charges.count_documents({"venue_id": venue.id})
     return {
         "ok": True,
         "payment_mode": PAYMENT_MODE,
-        "price_per_hour": PRICE_PER_HOUR,
-        "pdf": WEASY_AVAILABLE,
+        "price_per_hour": venue.pricing.off_peak,
+        "venue": venue.public(),
+        "pdf": pdf.available(),
         "allowed_origins": ALLOWED_ORIGINS,
         "charges_in_db": charges_count
     }
@@ -176,80 +1110,445 @@ async def health():
 # ─────────────────────────────────────────────────────────────────────────────
 # Users
 # ─────────────────────────────────────────────────────────────────────────────
-@app.post("/api/users/register", response_model=PublicUser, status_code=201)
-async def register_user(user: User):
+async def _hash_password(password: str) -> str:
+    try:
+        return await passwords.hash(password)
+    except PasswordServiceBusy:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, intenta de nuevo")
+
+
+def stop_worker_pools():
+    passwords.shutdown()
+    pdf.shutdown()
+    gateway.shutdown()
+
+
+@app.post("/api/users/register", response_model=UserSession, status_code=201)
+async def register_user(user: User, venue: VenueConfig = Depends(get_venue)):
     if user.email.lower() == ADMIN_EMAIL.lower():
         raise HTTPException(status_code=400, detail="El correo pertenece a una cuenta de administrador")
-    exists = await db.users.find_one({"email": user.email})
+    vdb = venue_db(venue.id)
+    exists = await vdb.users.find_one({"venue_id": venue.id, "email": user.email})
     if exists:
         raise HTTPException(status_code=400, detail="Email ya registrado")
     data = jsonable_encoder(user)
-    res = await db.users.insert_one(data)
-    return PublicUser(
+    data["venue_id"] = venue.id
+    data["password_hash"] = await _hash_password(data.pop("password"))
+    data["search_tokens"] = search_tokens(user.customer_name, user.email, user.phone)
+    res = await vdb.users.insert_one(data)
+    user_cache.add(venue.id, _user_summary({**data, "_id": res.inserted_id}), data["search_tokens"])
+    return UserSession(
         id=str(res.inserted_id),
         customer_name=user.customer_name,
         email=user.email,
-        phone=user.phone
+        phone=user.phone,
+        **tokens.issue(user.email, "user", venue.id),
     )
 
 
-@app.post("/api/users/login", response_model=PublicUser)
-async def login_user(form: UserLogin):
-    doc = await db.users.find_one({"email": form.email})
-    if not doc or doc.get("password") != form.password:
+@app.post("/api/users/login", response_model=UserSession)
+async def login_user(form: UserLogin, venue: VenueConfig = Depends(get_venue)):
+    await limit_login_attempts(venue.id, form.email)
+    vdb = venue_db(venue.id)
+    doc = await vdb.users.find_one({"venue_id": venue.id, "email": form.email})
+    if not doc or doc.get("password_hash") == UNUSABLE_PASSWORD or \
+            not (doc.get("password_hash") or doc.get("password")):
+        # sin contraseña asignada no hay con qué comparar: nunca entra
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
-    return PublicUser(
+    try:
+        if doc.get("password_hash"):
+            ok, new_hash = await passwords.verify(form.password, doc["password_hash"])
+        else:
+            # registro anterior al hash: se migra en el primer login correcto
+            ok, new_hash = await passwords.verify_legacy(form.password, doc.get("password"))
+    except PasswordServiceBusy:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, intenta de nuevo")
+    if not ok:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    if new_hash:
+        await vdb.users.update_one(
+            {"_id": doc["_id"]}, {"$set": {"password_hash": new_hash}, "$unset": {"password": ""}}
+        )
+    return UserSession(
         id=str(doc["_id"]),
         customer_name=doc["customer_name"],
         email=doc["email"],
         phone=doc["phone"],
+        **tokens.issue(doc["email"], "user", venue.id),
     )
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Búsqueda de clientes (autocompletado del admin, ver user_search.py)
+# ─────────────────────────────────────────────────────────────────────────────
+USER_SEARCH_MAX       = 20
+USER_SEARCH_DB_LIMIT  = int(os.getenv("USER_SEARCH_DB_LIMIT", "50"))
+USER_CACHE_SEED       = int(os.getenv("USER_CACHE_SEED", "1000"))   # clientes más recientes por local
+
+user_cache = PrefixCache(
+    max_users=int(os.getenv("USER_CACHE_SIZE", "5000")),
+    complete_ttl=float(os.getenv("USER_SEARCH_COMPLETE_TTL", "60")),
+)
+_user_cache_seeded = set()
+
+_USER_PROJECTION = {"customer_name": 1, "email": 1, "phone": 1, "search_tokens": 1}
+
+
+def _user_summary(doc: dict) -> dict:
+    return {"id": str(doc["_id"]), "customer_name": doc["customer_name"], "email": doc["email"],
+            "phone": doc.get("phone")}
+
+
+def _doc_tokens(doc: dict) -> List[str]:
+    return doc.get("search_tokens") or search_tokens(doc["customer_name"], doc["email"], doc.get("phone"))
+
+
+async def _seed_user_cache(venue: VenueConfig):
+    async def load():
+        cursor = read_coll(venue.id, "users", "admin_lists")\
+            .find({"venue_id": venue.id}, _USER_PROJECTION).sort([("_id", -1)]).limit(USER_CACHE_SEED)
+        docs = await cursor.to_list(None)
+        # de más viejo a más nuevo: los recientes quedan al final del LRU
+        for doc in reversed(docs):
+            user_cache.add(venue.id, _user_summary(doc), _doc_tokens(doc))
+        _user_cache_seeded.add(venue.id)
+
+    if venue.id not in _user_cache_seeded:
+        await singleflight.do("user_cache_seed", venue.id, load)
+
+
+async def backfill_user_search(venue: VenueConfig, batch_size: int = 500) -> int:
+    """Completa search_tokens en usuarios registrados antes del autocompletado."""
+    coll = venue_db(venue.id).users
+    total, ops = 0, []
+    async for doc in coll.find({"venue_id": venue.id, "search_tokens": {"$exists": False}}, _USER_PROJECTION):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"search_tokens": _doc_tokens(doc)}}))
+        if len(ops) >= batch_size:
+            total += (await coll.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        total += (await coll.bulk_write(ops, ordered=False)).modified_count
+    return total
+
+
+@app.get("/api/admin/users/search")
+async def search_users(q: str, limit: int = 10, admin: bool = Depends(get_current_admin),
+                       venue: VenueConfig = Depends(get_venue)):
+    """Nombre, email o teléfono por prefijo ("juan p", "juan.pe", "98765"). Sin tildes ni mayúsculas."""
+    limit = max(1, min(limit, USER_SEARCH_MAX))
+    norm, words = normalize(q), query_words(q)
+    if len(norm) < 2:
+        return {"results": [], "source": "cache"}
+    await _seed_user_cache(venue)
+    results = user_cache.search(venue.id, words, limit)
+    if len(results) >= limit or user_cache.is_complete(venue.id, norm):
+        return {"results": results, "source": "cache"}
+
+    docs = await read_coll(venue.id, "users", "admin_lists")\
+        .find(mongo_filter(venue.id, words), _USER_PROJECTION).limit(USER_SEARCH_DB_LIMIT).to_list(None)
+    for doc in docs:
+        user_cache.add(venue.id, _user_summary(doc), _doc_tokens(doc))
+    if len(docs) < USER_SEARCH_DB_LIMIT:
+        # Mongo devolvió todo lo que hay: lo que extienda este prefijo ya se contesta en memoria
+        user_cache.mark_complete(venue.id, norm)
+    return {"results": user_cache.search(venue.id, words, limit), "source": "db"}
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Admin login
 # ─────────────────────────────────────────────────────────────────────────────
 @app.post("/api/admin/login")
-async def admin_login(admin: AdminLogin):
+async def admin_login(admin: AdminLogin, venue: VenueConfig = Depends(get_venue)):
+    await limit_login_attempts(venue.id, admin.email)
     if admin.email.lower() == ADMIN_EMAIL.lower() and admin.password == ADMIN_PASSWORD:
-        return {"access_token": ADMIN_TOKEN, "email": ADMIN_EMAIL}
+        return {**tokens.issue(ADMIN_EMAIL, "admin", venue.id), "email": ADMIN_EMAIL}
     raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Sessions (refresh / logout)
+# ─────────────────────────────────────────────────────────────────────────────
+# La rotación y el logout del refresh token pasan por revoked_tokens (compartida entre
+# workers): el set en memoria de TokenService solo lo ve el proceso que revocó.
+revocations = None   # se crea en el primer uso (necesita db)
+
+
+def _revocations() -> MongoRevocations:
+    global revocations
+    if revocations is None:
+        revocations = MongoRevocations(db.revoked_tokens)
+    return revocations
+
+
+@app.post("/api/auth/refresh")
+async def refresh_session(body: RefreshRequest):
+    try:
+        claims = tokens.verify(body.refresh_token, typ="refresh")
+    except TokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    # insert con único por jti: de dos refresh concurrentes (en cualquier worker) gana uno solo
+    if not await _revocations().claim(claims):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    tokens.revoke(claims)
+    return tokens.issue(claims["sub"], claims["role"], claims["venue"])
+
+
+@app.post("/api/auth/logout")
+async def logout(body: Optional[RefreshRequest] = None,
+                 credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    for token, typ in ((credentials.credentials if credentials else None, "access"),
+                       (body.refresh_token if body else None, "refresh")):
+        if token:
+            try:
+                claims = tokens.verify(token, typ=typ)
+            except TokenError:
+                continue
+            tokens.revoke(claims)
+            if typ == "refresh":
+                await _revocations().claim(claims)   # el access token es corto: basta con el de este worker
+    return {"detail": "Logged out"}
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Availability
 # ─────────────────────────────────────────────────────────────────────────────
+@app.get("/api/venues")
+async def list_venues():
+    return [v.public() for v in venue_registry.all()]
+
+
+@app.get("/api/venue")
+async def venue_info(venue: VenueConfig = Depends(get_venue)):
+    return venue.public()
+
+
+@app.post("/api/admin/venue/reload")
+async def reload_venue(admin: bool = Depends(get_current_admin)):
+    try:
+        venue_registry.reload()
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Config inválida: {e}")
+    return [v.public() for v in venue_registry.all()]
+
+
 @app.get("/api/availability/{booking_date}")
-async def get_availability(booking_date: date):
+async def get_availability(booking_date: date, request: Request, response: Response,
+                           venue: VenueConfig = Depends(get_venue)):
+    key = _date_key(booking_date.isoformat())
+    not_modified = _not_modified(request, venue, "a", key, booking_date, private=False)
+    if not_modified:
+        return not_modified
+    version, payload = await singleflight.do(
+        "availability", (venue.id, booking_date), lambda: _compute_availability(venue, booking_date)
+    )
+    response.headers.update(_cache_headers(venue, "a", version, booking_date, private=False))
+    return payload
+
+
+async def _compute_availability(venue: VenueConfig, booking_date: date) -> Tuple[int, dict]:
+    # un solo documento (daily_summaries) en lugar de una consulta por celda
+    async with reads.read_session(client, None, always=True) as session:
+        version = await _read_version(venue, _date_key(booking_date.isoformat()), session)
+        summary = await _load_summary(venue, booking_date.isoformat(), session=session)
+    masks = {court: _court_mask(summary, court) for court in venue.courts}
     slots = []
-    start  = datetime.combine(booking_date, time(hour=6))
-    end_dt = datetime.combine(booking_date, time(hour=22))
-    curr   = start
-    while curr < end_dt:
-        t_iso = curr.time().strftime("%H:%M")
-        for court in (1, 2, 3):
-            exists = await db.bookings.find_one({
-                "booking_date": booking_date.isoformat(),
-                "start_time":   t_iso,
-                "court_number": court,
-                "status":       "confirmed"
-            })
+    for slot in venue.slots_for(booking_date):
+        for court in venue.courts:
             slots.append({
-                "time":         t_iso,
+                "time":         slot.start,
                 "court_number": court,
-                "available":    exists is None
+                "available":    not (masks[court] & slot.mask),
+                "price_cents":  slot.price_cents,
             })
-        curr += timedelta(hours=1)
-    return {"date": booking_date.isoformat(), "slots": slots}
+    return version, {
+        "date":         booking_date.isoformat(),
+        "slot_minutes": venue.slot_minutes,
+        "courts":       list(venue.courts),
+        "slots":        slots,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Búsqueda del próximo turno libre (índice de huecos en memoria; ver free_index.py)
+# ─────────────────────────────────────────────────────────────────────────────
+SEARCH_DEFAULT_DAYS = 14
+SEARCH_MAX_DAYS     = 62
+free_index = FreeIntervalIndex()
+
+
+async def _ensure_indexed(venue: VenueConfig, dates: List[date]):
+    missing = free_index.missing(venue.id, [d.isoformat() for d in dates])
+    if missing:
+        await singleflight.do("free_index", (venue.id, missing[0], missing[-1]),
+                              lambda: _load_free_index(venue, missing))
+
+
+async def _load_free_index(venue: VenueConfig, missing: List[str]):
+    # una sola consulta por rango para todas las fechas que faltan. Desde el primario: lo cargado
+    # queda en memoria hasta la próxima escritura de la fecha, y un secundario atrasado lo dejaría viejo
+    cursor = read_coll(venue.id, "daily_summaries", "conflicts").find(
+        {"venue_id": venue.id, "date": {"$gte": missing[0], "$lte": missing[-1]}},
+        {"_id": 0, "date": 1, "courts": 1},
+    )
+    found = {}
+    async for doc in cursor:
+        found[doc["date"]] = {int(c): int(v.get("mask") or 0) for c, v in (doc.get("courts") or {}).items()}
+    for d in missing:
+        free_index.load(venue.id, d, found.get(d, {}))
+    free_index.loads += 1
+
+
+def _hhmm_param(value: str, name: str) -> int:
+    if not re.fullmatch(r"\d{2}:[0-5]\d", value or "") or hhmm_to_minutes(value) > 24 * 60:
+        raise HTTPException(status_code=400, detail=f"{name} debe tener formato HH:MM")
+    return hhmm_to_minutes(value)
+
+
+@app.get("/api/slots/search")
+async def search_slots(duration: Optional[int] = None, date_from: Optional[date] = None,
+                       date_to: Optional[date] = None, earliest: str = "00:00", latest: str = "24:00",
+                       court: Optional[int] = None, limit: int = 5, venue: VenueConfig = Depends(get_venue)):
+    duration = duration or venue.slot_minutes
+    if duration <= 0 or duration % venue.slot_minutes:
+        raise HTTPException(status_code=400, detail=f"La duración debe ser múltiplo de {venue.slot_minutes} minutos")
+    if court is not None and not venue.has_court(court):
+        raise HTTPException(status_code=400, detail="Cancha inválida")
+    # todo se valida antes de tocar la base: un parámetro malo no debe costar la carga del índice
+    earliest_min, latest_min = _hhmm_param(earliest, "earliest"), _hhmm_param(latest, "latest")
+    now = datetime.now()
+    date_from = max(date_from or now.date(), now.date())
+    date_to = date_to or date_from + timedelta(days=SEARCH_DEFAULT_DAYS - 1)
+    if date_to < date_from or (date_to - date_from).days >= SEARCH_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Rango de fechas inválido (máximo {SEARCH_MAX_DAYS} días)")
+    dates = date_range(date_from, date_to)
+    await _ensure_indexed(venue, dates)
+    results = find_slots(
+        free_index, venue, dates, duration,
+        earliest=earliest_min, latest=latest_min,
+        courts=[court] if court is not None else None, limit=max(1, min(limit, 50)),
+        not_before=(now.date(), now.hour * 60 + now.minute),
+    )
+    return {
+        "date_from": date_from.isoformat(),
+        "date_to":   date_to.isoformat(),
+        "duration":  duration,
+        "results":   results,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Límite diario de horas por cliente — daily_limits: {venue_id, email, date, court, hours}
+# Una reserva suma con un $inc condicionado (hours <= límite - lo que suma): o entra
+# entera o no entra, sin count_documents previo ni carrera entre peticiones paralelas.
+# Si el documento existe y no cumple la condición, el upsert choca con el índice
+# único y se reintenta sin upsert; ese segundo $inc es el que decide.
+# ─────────────────────────────────────────────────────────────────────────────
+DAILY_HOURS_LIMIT = float(os.getenv("DAILY_HOURS_LIMIT", "2"))
+
+
+def _limit_key(venue: VenueConfig, b: dict) -> dict:
+    return {"venue_id": venue.id, "email": b["email"].lower(), "date": b["booking_date"],
+            "court": int(b["court_number"])}
+
+
+def _limit_expires(booking_date: str) -> datetime:
+    # pasado el día el contador ya no sirve: lo borra el TTL
+    return datetime.combine(date.fromisoformat(booking_date) + timedelta(days=2), time.min)
+
+
+def _counts_for_limit(b: dict) -> bool:
+    return bool(b.get("email")) and b["email"].lower() != ADMIN_EMAIL.lower()
+
+
+async def _reserve_daily_hours(venue: VenueConfig, booking: dict) -> bool:
+    coll = venue_db(venue.id).daily_limits
+    hours = _booking_minutes(booking, venue) / 60
+    if hours > DAILY_HOURS_LIMIT:
+        # sin contador previo el upsert inserta sin evaluar la condición: se corta antes
+        return False
+    cond = {**_limit_key(venue, booking), "hours": {"$lte": DAILY_HOURS_LIMIT - hours}}
+    update = {"$inc": {"hours": hours}, "$setOnInsert": {"expires_at": _limit_expires(booking["booking_date"])}}
+    try:
+        await coll.update_one(cond, update, upsert=True)
+        return True
+    except DuplicateKeyError:
+        res = await coll.update_one(cond, {"$inc": {"hours": hours}})
+        return res.modified_count == 1
+
+
+async def _apply_daily_hours(venue: VenueConfig, bookings: List[dict], added: bool):
+    """Sin condición: reservas que el admin crea en bloque (series) y bajas de cualquier origen."""
+    ops = []
+    for b in bookings:
+        if not _counts_for_limit(b):
+            continue
+        hours = _booking_minutes(b, venue) / 60
+        if added:
+            ops.append(UpdateOne(_limit_key(venue, b), {"$inc": {"hours": hours},
+                                 "$setOnInsert": {"expires_at": _limit_expires(b["booking_date"])}}, upsert=True))
+        else:
+            ops.append(UpdateOne({**_limit_key(venue, b), "hours": {"$gte": hours}}, {"$inc": {"hours": -hours}}))
+    if ops:
+        await venue_db(venue.id).daily_limits.bulk_write(ops, ordered=False)
+
+
+async def rebuild_daily_limits(venue: VenueConfig, date_from: Optional[str] = None) -> int:
+    """Recalcula los contadores desde bookings (backfill al activar el límite, o tras una importación)."""
+    vdb = venue_db(venue.id)
+    date_from = date_from or date.today().isoformat()
+    hours: dict = {}
+    cursor = vdb.bookings.find(
+        {"venue_id": venue.id, "booking_date": {"$gte": date_from}, "status": "confirmed"},
+        {"email": 1, "booking_date": 1, "court_number": 1, "start_time": 1, "end_time": 1},
+    )
+    async for b in cursor:
+        if _counts_for_limit(b):
+            key = tuple(_limit_key(venue, b).values())
+            hours[key] = hours.get(key, 0) + _booking_minutes(b, venue) / 60
+    await vdb.daily_limits.delete_many({"venue_id": venue.id, "date": {"$gte": date_from}})
+    docs = [{"venue_id": v, "email": e, "date": d, "court": c, "hours": h, "expires_at": _limit_expires(d)}
+            for (v, e, d, c), h in hours.items()]
+    for i in range(0, len(docs), 1000):
+        await vdb.daily_limits.insert_many(docs[i:i + 1000], ordered=False)
+    return len(docs)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Create booking
 # ─────────────────────────────────────────────────────────────────────────────
+async def _insert_bookings(vdb, docs: List[dict]) -> List[dict]:
+    """insert_many(ordered=False) de reservas. Pone "id" a las escritas y devuelve las que chocaron
+    con el índice único de turno (otra reserva confirmada en esa cancha y horario)."""
+    taken = set()
+    try:
+        await vdb.bookings.insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        errors = exc.details.get("writeErrors", [])
+        if any(e.get("code") != 11000 for e in errors):
+            raise
+        taken = {e["index"] for e in errors}
+    for i, doc in enumerate(docs):
+        if i not in taken:
+            doc["id"] = str(doc["_id"])
+    return [docs[i] for i in sorted(taken)]
+
+
 @app.post("/api/bookings", response_model=BookingInDB, status_code=201)
-async def create_booking(booking: Booking):
+async def create_booking(booking: Booking, venue: VenueConfig = Depends(get_venue),
+                         principal: Optional[Principal] = Depends(get_optional_user)):
+    if principal and not principal.is_admin and booking.email.lower() != principal.sub.lower():
+        raise HTTPException(status_code=403, detail="Solo puedes reservar a tu nombre")
+    vdb = venue_db(venue.id)
+    primary_bookings = read_coll(venue.id, "bookings", "conflicts")   # nunca desde un secundario
+    if not venue.has_court(booking.court_number):
+        raise HTTPException(status_code=400, detail="Cancha inválida")
+    slot = venue.slot_at(booking.booking_date, booking.start_time.strftime("%H:%M"))
+    if slot is None:
+        raise HTTPException(status_code=400, detail="Horario fuera de la grilla de atención")
+
     # conflicto
-    conflict = await db.bookings.find_one({
+    conflict = await primary_bookings.find_one({
+        "venue_id":     venue.id,
         "booking_date": booking.booking_date.isoformat(),
         "start_time":   booking.start_time.strftime("%H:%M"),
         "court_number": booking.court_number,
@@ -258,18 +1557,6 @@ async def create_booking(booking: Booking):
     if conflict:
         raise HTTPException(status_code=400, detail="Ese horario ya está reservado para esa cancha")
 
-    # límite 2h (no admin)
-    is_admin_email = booking.email.lower() == ADMIN_EMAIL.lower()
-    if not is_admin_email:
-        existing_count = await db.bookings.count_documents({
-            "email":        booking.email,
-            "booking_date": booking.booking_date.isoformat(),
-            "court_number": booking.court_number,
-            "status":       "confirmed"
-        })
-        if existing_count >= 2:
-            raise HTTPException(status_code=400, detail="Límite de 2 horas por cancha y día alcanzado para este usuario")
-
     # inserción
     data = jsonable_encoder(booking)
     if isinstance(data["start_time"], str) and len(data["start_time"]) >= 5:
@@ -281,62 +1568,844 @@ async def create_booking(booking: Booking):
         if m:
             data["charge_id"] = m.group(1)
 
-    start_dt = datetime.fromisoformat(f"{data['booking_date']}T{data['start_time']}")
-    data["end_time"]   = (start_dt + timedelta(hours=1)).time().strftime("%H:%M")
-    data["status"]     = "confirmed"
+    if PAYMENT_MODE == "gateway" and data.get("charge_id"):
+        # el cobro puede seguir pending: el webhook marca la reserva pagada (o la cancela)
+        charge = await vdb.charges.find_one(
+            {"venue_id": venue.id, "id": data["charge_id"]}, {"status": 1}
+        )
+        if charge and charge["status"] == "failed":
+            raise HTTPException(status_code=402, detail="El pago fue rechazado")
+        if charge:
+            data["payment_status"] = charge["status"]
+
+    data["venue_id"]    = venue.id
+    data["end_time"]    = slot.end
+    data["price_cents"] = slot.price_cents
+    data["status"]      = "confirmed"
     data["created_at"] = now_iso()
 
-    res = await db.bookings.insert_one(data)
+    # límite de horas por cancha y día (no admin): se descuenta del contador antes de insertar
+    limited = _counts_for_limit(data)
+    if limited and not await _reserve_daily_hours(venue, data):
+        raise HTTPException(status_code=400,
+                            detail=f"Límite de {DAILY_HOURS_LIMIT:g} horas por cancha y día alcanzado para este usuario")
+
+    # sesión causal: el próximo "mis reservas" de quien reservó ya ve esta reserva
+    try:
+        async with reads.write_session(client, principal.sub if principal else booking.email) as session:
+            res = await vdb.bookings.insert_one(data, session=session)
+    except DuplicateKeyError:
+        # otra reserva ganó el turno entre el find_one y el insert: la frena el índice único
+        if limited:
+            await _apply_daily_hours(venue, [data], added=False)
+        raise HTTPException(status_code=409, detail="Ese horario ya está reservado para esa cancha")
+    except Exception:
+        if limited:
+            await _apply_daily_hours(venue, [data], added=False)
+        raise
     data["id"] = str(res.inserted_id)
+    await _summary_add_booking(venue, data)
+    _emit_bookings(venue, "booking_created", [data], principal.sub if principal else booking.email)
     return data
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # My bookings / Admin
 # ─────────────────────────────────────────────────────────────────────────────
+@app.get("/api/my-bookings", response_model=List[BookingInDB])
+async def get_my_bookings(request: Request, response: Response, principal: Principal = Depends(get_current_user),
+                          venue: VenueConfig = Depends(get_venue)):
+    return await _client_bookings(request, response, venue, principal.sub, principal.sub)
+
+
 @app.get("/api/my-bookings/{email}", response_model=List[BookingInDB])
-async def get_client_bookings(email: str):
-    cursor = db.bookings.find({"email": email}).sort([("booking_date", 1), ("start_time", 1)])
-    out = []
-    async for doc in cursor:
-        doc["id"] = str(doc["_id"])
-        out.append(doc)
+async def get_client_bookings(email: str, request: Request, response: Response,
+                              principal: Principal = Depends(get_current_user),
+                              venue: VenueConfig = Depends(get_venue)):
+    if not principal.is_admin and email.lower() != principal.sub.lower():
+        raise HTTPException(status_code=403, detail="Solo puedes ver tus propias reservas")
+    return await _client_bookings(request, response, venue, email, principal.sub)
+
+
+async def _client_bookings(request: Request, response: Response, venue: VenueConfig, email: str, reader: str):
+    key = _email_key(email)
+    not_modified = _not_modified(request, venue, "m", key, None, private=True)
+    if not_modified:
+        return not_modified
+    async with reads.read_session(client, reader, always=True) as session:
+        version = await _read_version(venue, key, session)
+        response.headers.update(_cache_headers(venue, "m", version, None, private=True))
+        cursor = read_coll(venue.id, "bookings", "my_bookings")\
+            .find({"venue_id": venue.id, "email": email}, session=session)\
+            .sort([("booking_date", 1), ("start_time", 1)])
+        out = []
+        async for doc in cursor:
+            doc["id"] = str(doc["_id"])
+            out.append(doc)
     return out
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Reservas del cliente — turnos contiguos agrupados en bloques por el servidor
+# Una agregación agrupa por (fecha, cancha, estado, charge_id); dentro de cada grupo
+# se corta donde hay huecos, y recién los bloques resultantes se ordenan y se limitan.
+# ─────────────────────────────────────────────────────────────────────────────
+MAX_RESERVATIONS = 500
+
+
+@app.get("/api/my-reservations", response_model=List[Reservation])
+async def get_my_reservations(request: Request, response: Response, include_past: bool = False,
+                              limit: int = 50, principal: Principal = Depends(get_current_user),
+                              venue: VenueConfig = Depends(get_venue)):
+    return await _client_reservations(request, response, venue, principal.sub, principal.sub,
+                                      include_past, limit)
+
+
+@app.get("/api/my-reservations/{email}", response_model=List[Reservation])
+async def get_client_reservations(email: str, request: Request, response: Response,
+                                  include_past: bool = False, limit: int = 50,
+                                  principal: Principal = Depends(get_current_user),
+                                  venue: VenueConfig = Depends(get_venue)):
+    if not principal.is_admin and email.lower() != principal.sub.lower():
+        raise HTTPException(status_code=403, detail="Solo puedes ver tus propias reservas")
+    return await _client_reservations(request, response, venue, email, principal.sub, include_past, limit)
+
+
+async def _client_reservations(request: Request, response: Response, venue: VenueConfig, email: str,
+                               reader: str, include_past: bool, limit: int):
+    key = _email_key(email)
+    not_modified = _not_modified(request, venue, "r", key, None, private=True)
+    if not_modified:
+        return not_modified
+    limit = max(1, min(limit, MAX_RESERVATIONS))
+    match = {"venue_id": venue.id, "email": email}
+    if not include_past:
+        match["booking_date"] = {"$gte": date.today().isoformat()}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"booking_date": 1, "court_number": 1, "start_time": 1}},
+        {"$group": {
+            "_id": {"date": "$booking_date", "court": "$court_number", "status": "$status",
+                    "charge": {"$ifNull": ["$charge_id", None]}},
+            "slots":         {"$push": {"id": "$_id", "start_time": "$start_time", "end_time": "$end_time",
+                                        "booking_date": "$booking_date", "price_cents": "$price_cents"}},
+            "voucher_url":   {"$max": "$voucher_url"},
+            "admin_comment": {"$max": "$admin_comment"},
+            "payment_type":  {"$max": "$payment_type"},
+        }},
+    ]
+    async with reads.read_session(client, reader, always=True) as session:
+        version = await _read_version(venue, key, session)
+        groups = await read_coll(venue.id, "bookings", "my_bookings")\
+            .aggregate(pipeline, session=session).to_list(None)
+    response.headers.update(_cache_headers(venue, "r", version, None, private=True))
+    out = []
+    for g in groups:
+        out.extend(_split_contiguous(g, venue))
+    # un grupo con huecos da varios bloques: el orden y el límite valen por bloque, no por grupo
+    out.sort(key=lambda b: (b["booking_date"], b["start_time"], b["court_number"]))
+    return out[:limit]
+
+
+def _split_contiguous(group: dict, venue: VenueConfig) -> List[dict]:
+    blocks = []
+    for slot in sorted(group["slots"], key=lambda x: x["start_time"]):
+        start = slot["start_time"]
+        end = slot.get("end_time") or minutes_to_hhmm(hhmm_to_minutes(start) + _booking_minutes(slot, venue))
+        last = blocks[-1] if blocks else None
+        if last and last["end_time"] == start:
+            last["end_time"] = end
+            last["hours"] += _booking_minutes(slot, venue) / 60
+            last["price_cents"] += _booking_price_cents(slot, venue)
+            last["booking_ids"].append(str(slot["id"]))
+            continue
+        blocks.append({
+            "booking_date":  group["_id"]["date"],
+            "court_number":  group["_id"]["court"],
+            "start_time":    start,
+            "end_time":      end,
+            "hours":         _booking_minutes(slot, venue) / 60,
+            "status":        group["_id"]["status"],
+            "price_cents":   _booking_price_cents(slot, venue),
+            "charge_id":     group["_id"]["charge"],
+            "voucher_url":   group.get("voucher_url"),
+            "admin_comment": group.get("admin_comment"),
+            "payment_type":  group.get("payment_type"),
+            "booking_ids":   [str(slot["id"])],
+        })
+    return blocks
+
+
 @app.get("/api/bookings/day/{booking_date}", response_model=List[BookingInDB])
-async def list_day_bookings(booking_date: date, admin: bool = Depends(get_current_admin)):
-    cursor = db.bookings.find({"booking_date": booking_date.isoformat(), "status": {"$ne":"cancelled"}})\
-                        .sort([("court_number",1), ("start_time",1)])
+async def list_day_bookings(booking_date: date, request: Request, response: Response,
+                            admin: bool = Depends(get_current_admin),
+                            venue: VenueConfig = Depends(get_venue)):
+    key = _date_key(booking_date.isoformat())
+    not_modified = _not_modified(request, venue, "d", key, booking_date, private=True)
+    if not_modified:
+        return not_modified
+    async with reads.read_session(client, ADMIN_EMAIL) as session:
+        if session is not None:
+            # el admin acaba de escribir: lectura propia encadenada a esa escritura
+            version, out = await _fetch_day_bookings(venue, booking_date, session)
+        else:
+            version, out = await singleflight.do(
+                "day_bookings", (venue.id, booking_date), lambda: _fetch_day_bookings(venue, booking_date)
+            )
+    response.headers.update(_cache_headers(venue, "d", version, booking_date, private=True))
+    return out
+
+
+async def _fetch_day_bookings(venue: VenueConfig, booking_date: date, session=None) -> Tuple[int, List[dict]]:
+    if session is None:
+        async with reads.read_session(client, None, always=True) as own:
+            return await _fetch_day_bookings(venue, booking_date, own)
+    version = await _read_version(venue, _date_key(booking_date.isoformat()), session)
+    summary = await _load_summary(venue, booking_date.isoformat(), "admin_lists", session)
+    if summary is not None and summary.get("booked_hours", 0) + summary.get("blocked_hours", 0) <= 0:
+        return version, []
+    cursor = read_coll(venue.id, "bookings", "admin_lists")\
+        .find({"venue_id": venue.id, "booking_date": booking_date.isoformat(),
+               "status": {"$ne":"cancelled"}}, session=session)\
+        .sort([("court_number",1), ("start_time",1)])
     out = []
     async for doc in cursor:
         doc["id"] = str(doc["_id"])
         out.append(doc)
-    return out
+    return version, out
 
 
 @app.get("/api/bookings", response_model=List[BookingInDB])
-async def list_bookings(admin: bool = Depends(get_current_admin)):
-    cursor = db.bookings.find({"status": {"$ne":"cancelled"}}).sort([("booking_date",1), ("start_time",1)])
+async def list_bookings(admin: bool = Depends(get_current_admin), venue: VenueConfig = Depends(get_venue)):
+    vdb = venue_db(venue.id).with_options(read_preference=reads.preference("exports"))
     out = []
-    async for doc in cursor:
+    async for doc in _iter_with_archive(vdb, "bookings", {"venue_id": venue.id, "status": {"$ne":"cancelled"}},
+                                        sort=[("booking_date",1), ("start_time",1)], archive_first=True):
         doc["id"] = str(doc["_id"])
         out.append(doc)
     return out
 
 
 @app.post("/api/bookings/{booking_id}/cancel")
-async def cancel_booking(booking_id: str, admin: bool = Depends(get_current_admin)):
+async def cancel_booking(booking_id: str, admin: bool = Depends(get_current_admin),
+                         venue: VenueConfig = Depends(get_venue)):
     try:
         oid = ObjectId(booking_id)
     except:
         raise HTTPException(status_code=400, detail="Invalid booking id")
-    res = await db.bookings.update_one({"_id": oid}, {"$set": {"status":"cancelled"}})
-    if res.matched_count == 0:
+    async with reads.write_session(client, ADMIN_EMAIL) as session:
+        prev = await venue_db(venue.id).bookings.find_one_and_update(
+            {"_id": oid, "venue_id": venue.id}, {"$set": {"status":"cancelled"}}, session=session
+        )
+        if prev is not None:
+            reads.remember(prev.get("email") or "", session)   # el cliente también lee lo suyo
+    if prev is None:
         raise HTTPException(status_code=404, detail="Booking not found")
+    if prev.get("status") == "confirmed":
+        await _summary_remove_booking(venue, prev)
+        await _apply_daily_hours(venue, [prev], added=False)
+        await _slots_freed(venue, [prev])
+        _emit_bookings(venue, "booking_cancelled", [prev], ADMIN_EMAIL)
     return {"detail": "Booking cancelled"}
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Recurring series — expansión en bloque (1 consulta de conflictos + 1 insert_many)
+# ─────────────────────────────────────────────────────────────────────────────
+MAX_SERIES_OCCURRENCES = int(os.getenv("MAX_SERIES_OCCURRENCES", "104"))   # ~2 años semanales
+
+
+def _series_dates(series: BookingSeries) -> List[date]:
+    step = timedelta(weeks=1 if series.frequency == "weekly" else 2)
+    limit = min(series.count or MAX_SERIES_OCCURRENCES, MAX_SERIES_OCCURRENCES)
+    out, d = [], series.first_date
+    while len(out) < limit and (series.until is None or d <= series.until):
+        out.append(d)
+        d += step
+    return out
+
+
+def _series_oid(series_id: str) -> ObjectId:
+    try:
+        return ObjectId(series_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid series id")
+
+
+@app.post("/api/bookings/series", status_code=201)
+async def create_booking_series(series: BookingSeries, admin: bool = Depends(get_current_admin),
+                                venue: VenueConfig = Depends(get_venue)):
+    if series.until is None and series.count is None:
+        raise HTTPException(status_code=400, detail="Indica 'until' o 'count'")
+    if not venue.has_court(series.court_number):
+        raise HTTPException(status_code=400, detail="Cancha inválida")
+    vdb = venue_db(venue.id)
+    start = series.start_time.strftime("%H:%M")
+    dates = _series_dates(series)
+    iso_dates = [d.isoformat() for d in dates]
+    is_admin_email = series.email.lower() == ADMIN_EMAIL.lower()
+
+    # una sola consulta: ocupación del turno + horas del cliente en esa cancha, para todas las fechas
+    taken, hours_by_date = set(), {}
+    cursor = vdb.bookings.find({
+        "venue_id":     venue.id,
+        "court_number": series.court_number,
+        "booking_date": {"$in": iso_dates},
+        "status":       "confirmed",
+        "$or":          [{"start_time": start}, {"email": series.email}],
+    }, {"booking_date": 1, "start_time": 1, "end_time": 1, "email": 1})
+    async for b in cursor:
+        if b["start_time"] == start:
+            taken.add(b["booking_date"])
+        if b.get("email") == series.email:
+            iso = b["booking_date"]
+            hours_by_date[iso] = hours_by_date.get(iso, 0) + _booking_minutes(b, venue) / 60
+
+    series_oid = ObjectId()
+    series_id = str(series_oid)
+    created_at = now_iso()
+    docs, conflicts = [], []
+    for d, iso in zip(dates, iso_dates):
+        slot = venue.slot_at(d, start)
+        reason = None
+        if slot is None:
+            reason = "closed"
+        elif iso in taken:
+            reason = "occupied"
+        elif not is_admin_email and hours_by_date.get(iso, 0) + venue.slot_minutes / 60 > DAILY_HOURS_LIMIT:
+            reason = "limit"
+        if reason:
+            conflicts.append({"booking_date": iso, "start_time": start, "reason": reason})
+            continue
+        docs.append({
+            "venue_id":      venue.id,
+            "customer_name": series.customer_name,
+            "email":         series.email,
+            "phone":         series.phone,
+            "booking_date":  iso,
+            "start_time":    start,
+            "end_time":      slot.end,
+            "court_number":  series.court_number,
+            "admin_comment": series.admin_comment,
+            "voucher_url":   None,
+            "charge_id":     None,
+            "series_id":     series_id,
+            "price_cents":   slot.price_cents,
+            "status":        "confirmed",
+            "created_at":    created_at,
+        })
+
+    if docs:
+        for doc in await _insert_bookings(vdb, docs):
+            # tomado entre la consulta y el insert
+            conflicts.append({"booking_date": doc["booking_date"], "start_time": start, "reason": "occupied"})
+        conflicts.sort(key=lambda x: x["booking_date"])
+        docs = [doc for doc in docs if "id" in doc]
+    if docs:
+        await _summary_apply_many(venue, docs, added=True)
+        await _apply_daily_hours(venue, docs, added=True)
+        _emit_bookings(venue, "booking_created", docs, ADMIN_EMAIL)
+
+    await vdb.booking_series.insert_one({
+        "_id":         series_oid,
+        "venue_id":    venue.id,
+        **jsonable_encoder(series),
+        "start_time":  start,
+        "status":      "active",
+        "occurrences": len(docs),
+        "created_at":  created_at,
+    })
+    return {
+        "series_id": series_id,
+        "created":   [BookingInDB(**d) for d in docs],
+        "conflicts": conflicts,
+    }
+
+
+@app.post("/api/bookings/series/{series_id}/cancel")
+async def cancel_booking_series(series_id: str, from_date: Optional[date] = None,
+                                admin: bool = Depends(get_current_admin),
+                                venue: VenueConfig = Depends(get_venue)):
+    oid = _series_oid(series_id)
+    vdb = venue_db(venue.id)
+    if not await vdb.booking_series.find_one({"_id": oid, "venue_id": venue.id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Series not found")
+    match = {"venue_id": venue.id, "series_id": series_id, "status": "confirmed"}
+    if from_date:
+        match["booking_date"] = {"$gte": from_date.isoformat()}
+    # los documentos hacen falta para descontar el resumen diario
+    docs = await vdb.bookings.find(match).to_list(None)
+    if docs:
+        await vdb.bookings.update_many(
+            {"_id": {"$in": [d["_id"] for d in docs]}, "status": "confirmed"},
+            {"$set": {"status": "cancelled"}},
+        )
+        await _summary_apply_many(venue, docs, added=False)
+        await _apply_daily_hours(venue, docs, added=False)
+        await _slots_freed(venue, docs)
+        _emit_bookings(venue, "booking_cancelled", docs, ADMIN_EMAIL, series_id=series_id)
+    if from_date is None:
+        await vdb.booking_series.update_one({"_id": oid}, {"$set": {"status": "cancelled"}})
+    return {"detail": "Series cancelled", "cancelled": len(docs)}
+
+
+@app.patch("/api/bookings/series/{series_id}")
+async def update_booking_series(series_id: str, changes: BookingSeriesUpdate,
+                                admin: bool = Depends(get_current_admin),
+                                venue: VenueConfig = Depends(get_venue)):
+    oid = _series_oid(series_id)
+    vdb = venue_db(venue.id)
+    fields = changes.dict(exclude_unset=True)
+    from_date = fields.pop("from_date", None) or date.today()
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nada que actualizar")
+    res = await vdb.booking_series.update_one({"_id": oid, "venue_id": venue.id}, {"$set": fields})
+    if res.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Series not found")
+    match = {"venue_id": venue.id, "series_id": series_id, "status": "confirmed",
+             "booking_date": {"$gte": from_date.isoformat()}}
+    upd = await vdb.bookings.update_many(match, {"$set": fields})
+    if upd.modified_count:
+        affected = await vdb.bookings.find(match, {"booking_date": 1, "email": 1}).to_list(None)
+        await _bump_versions(venue, affected)
+        _emit_bookings(venue, "booking_updated", affected, ADMIN_EMAIL, fields=jsonable_encoder(fields))
+    return {"detail": "Series updated", "updated": upd.modified_count}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Operaciones en bloque (lluvia, mantenimiento) — un update_many para cancelar,
+# un insert_many para los bloqueos y un solo bulk_write de resúmenes/versiones.
+# ─────────────────────────────────────────────────────────────────────────────
+MAX_BULK_DAYS = int(os.getenv("MAX_BULK_DAYS", "62"))
+
+
+def _bulk_range(venue: VenueConfig, flt: BulkBookingFilter) -> Tuple[List[date], List[int], str, str]:
+    date_to = flt.date_to or flt.date_from
+    if date_to < flt.date_from:
+        raise HTTPException(status_code=400, detail="date_to debe ser >= date_from")
+    if (date_to - flt.date_from).days >= MAX_BULK_DAYS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BULK_DAYS} días por operación")
+    courts = sorted(set(flt.court_numbers)) if flt.court_numbers else list(venue.courts)
+    if not all(venue.has_court(c) for c in courts):
+        raise HTTPException(status_code=400, detail="Cancha inválida")
+    start = flt.start_time.strftime("%H:%M") if flt.start_time else "00:00"
+    end = flt.end_time.strftime("%H:%M") if flt.end_time else "24:00"
+    if start >= end:
+        raise HTTPException(status_code=400, detail="end_time debe ser posterior a start_time")
+    return date_range(flt.date_from, date_to), courts, start, end
+
+
+async def _bulk_cancel(venue: VenueConfig, flt: BulkBookingFilter, block: bool) -> dict:
+    vdb = venue_db(venue.id)
+    dates, courts, start, end = _bulk_range(venue, flt)
+    match = {
+        "venue_id":     venue.id,
+        "booking_date": {"$gte": dates[0].isoformat(), "$lte": dates[-1].isoformat()},
+        "court_number": {"$in": courts},
+        "start_time":   {"$gte": start, "$lt": end},
+        "status":       "confirmed",
+    }
+    # un solo update_many con el filtro: lo que se inserte mientras corre o cae adentro o no se toca.
+    # Las reservas afectadas (resumen, cobros a reembolsar) se releen por la marca de esta operación
+    op_id = str(ObjectId())
+    cancel = {"$set": {"status": "cancelled", "cancelled_reason": flt.reason, "bulk_op": op_id}}
+    await vdb.bookings.update_many(match, cancel)
+
+    blocks = []
+    if block:
+        created_at = now_iso()
+        for d in dates:
+            iso = d.isoformat()
+            for slot in venue.slots_for(d):
+                if not start <= slot.start < end:
+                    continue
+                for court in courts:
+                    blocks.append({
+                        "venue_id":      venue.id,
+                        "customer_name": "Bloqueo",
+                        "email":         ADMIN_EMAIL,
+                        "phone":         "",
+                        "booking_date":  iso,
+                        "start_time":    slot.start,
+                        "end_time":      slot.end,
+                        "court_number":  court,
+                        "admin_comment": flt.reason,
+                        "voucher_url":   None,
+                        "charge_id":     None,
+                        "price_cents":   0,
+                        "blocked":       True,
+                        "status":        "confirmed",
+                        "created_at":    created_at,
+                    })
+        pending = blocks
+        for _ in range(3):
+            pending = await _insert_bookings(vdb, pending) if pending else []
+            if not pending:
+                break
+            # alguien reservó después del update_many: se cancela con la misma marca (sin tocar
+            # los bloqueos recién puestos) y se reintenta
+            mine = [b["_id"] for b in blocks if "id" in b]
+            await vdb.bookings.update_many({**match, "_id": {"$nin": mine}}, cancel)
+        blocks = [b for b in blocks if "id" in b]
+
+    docs = await vdb.bookings.find({"venue_id": venue.id, "bulk_op": op_id}).to_list(None)
+    await _summary_apply_changes(venue, docs, blocks)
+    await _apply_daily_hours(venue, docs, added=False)   # los bloqueos van a nombre del admin: no suman
+    if not block:
+        await _slots_freed(venue, docs)   # con bloqueo el turno no queda libre: la cola sigue esperando
+    _emit_bookings(venue, "booking_cancelled", docs, ADMIN_EMAIL, reason=flt.reason)
+    _emit_bookings(venue, "booking_created", blocks, ADMIN_EMAIL)
+    return {
+        "cancelled":  len(docs),
+        "blocked":    len(blocks),
+        "charge_ids": sorted({d["charge_id"] for d in docs if d.get("charge_id")}),
+    }
+
+
+@app.post("/api/bookings/bulk-cancel")
+async def bulk_cancel_bookings(flt: BulkBookingFilter, admin: bool = Depends(get_current_admin),
+                               venue: VenueConfig = Depends(get_venue)):
+    return {"detail": "Bookings cancelled", **await _bulk_cancel(venue, flt, block=False)}
+
+
+@app.post("/api/bookings/bulk-block")
+async def bulk_block_bookings(flt: BulkBookingFilter, admin: bool = Depends(get_current_admin),
+                              venue: VenueConfig = Depends(get_venue)):
+    """Cancela lo reservado en el rango y ocupa cada turno con un bloqueo (cancha cerrada)."""
+    return {"detail": "Courts blocked", **await _bulk_cancel(venue, flt, block=True)}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Waitlist — cola por turno (índice venue/fecha/cancha/hora/estado/created_at).
+# Al liberarse un turno, un trabajo waitlist_promote avisa al primero de la cola vía outbox.
+# El avisado tiene WAITLIST_HOLD_MINUTES para reservar: después un trabajo waitlist_expire
+# lo marca expired y avisa al siguiente (si el turno sigue libre).
+# ─────────────────────────────────────────────────────────────────────────────
+WAITLIST_HOLD_MINUTES = float(os.getenv("WAITLIST_HOLD_MINUTES", "30"))
+
+
+async def _slots_freed(venue: VenueConfig, bookings: List[dict]):
+    # no bloquea la cancelación: la promoción la hace el worker de trabajos
+    await _jobs().enqueue_many(
+        ("waitlist_promote", {"booking_date": b["booking_date"], "court_number": b["court_number"],
+                              "start_time": b["start_time"]}, venue.id)
+        for b in bookings
+    )
+
+
+async def _promote_next_waiter(venue: VenueConfig, booking_date: str, court: int, start_time: str):
+    vdb = venue_db(venue.id)
+    # si alguien ya volvió a reservar el turno, la cola sigue esperando
+    summary = await _load_summary(venue, booking_date, "conflicts")
+    slot = venue.slot_at(date.fromisoformat(booking_date), start_time)
+    if slot and _court_mask(summary, court) & slot.mask:
+        return None
+    queue = {"venue_id": venue.id, "booking_date": booking_date, "court_number": court,
+             "start_time": start_time, "status": "waiting"}
+    for _ in range(5):
+        entry = await vdb.waitlist.find_one(queue, sort=[("created_at", 1)])
+        if entry is None:
+            return None
+        # outbox y vencimiento antes de marcar la entrada, con _id derivado de ella: si el proceso
+        # se corta en el medio, el reintento del trabajo elige la misma entrada y no duplica el aviso
+        outbox_id = f"waitlist:{entry['_id']}"
+        await vdb.outbox.update_one({"_id": outbox_id}, {"$setOnInsert": {
+            "venue_id":   venue.id,
+            "type":       "waitlist_slot_available",
+            "email":      entry["email"],
+            "payload":    {"booking_date": booking_date, "court_number": court, "start_time": start_time,
+                           "customer_name": entry.get("customer_name")},
+            "status":     "pending",
+            "created_at": now_iso(),
+        }}, upsert=True)
+        await _jobs().enqueue("waitlist_expire", {"entry_id": str(entry["_id"])}, venue.id,
+                              delay=WAITLIST_HOLD_MINUTES * 60)
+        # atómico sobre la entrada elegida: dos cancelaciones concurrentes nunca toman al mismo cliente
+        notified = await vdb.waitlist.find_one_and_update(
+            {"_id": entry["_id"], "status": "waiting"},
+            {"$set": {"status": "notified", "notified_at": now_iso()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if notified is not None:
+            return notified
+        # se salió de la cola entre medio: su aviso ya no corresponde (si lo tomó otra promoción, queda)
+        if (await vdb.waitlist.find_one({"_id": entry["_id"]}, {"status": 1}) or {}).get("status") != "notified":
+            await vdb.outbox.delete_one({"_id": outbox_id, "status": "pending"})
+    return None
+
+
+async def _expire_waiter(venue: VenueConfig, entry_id: str):
+    """Venció el plazo del avisado: sale de la cola y, si el turno sigue libre, se avisa al siguiente."""
+    entry = await venue_db(venue.id).waitlist.find_one_and_update(
+        {"_id": ObjectId(entry_id), "venue_id": venue.id, "status": "notified"},
+        {"$set": {"status": "expired", "expired_at": now_iso()}},
+    )
+    if entry is not None:
+        await _promote_next_waiter(venue, entry["booking_date"], entry["court_number"], entry["start_time"])
+
+
+@app.post("/api/waitlist", status_code=201)
+async def join_waitlist(entry: WaitlistEntry, principal: Principal = Depends(get_current_user),
+                        venue: VenueConfig = Depends(get_venue)):
+    if not principal.is_admin:
+        entry.email = principal.sub
+    vdb = venue_db(venue.id)
+    start = entry.start_time.strftime("%H:%M")
+    slot = venue.slot_at(entry.booking_date, start)
+    if slot is None or not venue.has_court(entry.court_number):
+        raise HTTPException(status_code=400, detail="Horario fuera de la grilla de atención")
+    summary = await _load_summary(venue, entry.booking_date.isoformat(), "conflicts")
+    if not _court_mask(summary, entry.court_number) & slot.mask:
+        raise HTTPException(status_code=400, detail="El horario está libre: resérvalo directamente")
+    doc = {
+        "venue_id":      venue.id,
+        "booking_date":  entry.booking_date.isoformat(),
+        "court_number":  entry.court_number,
+        "start_time":    start,
+        "email":         entry.email,
+        "customer_name": entry.customer_name,
+        "status":        "waiting",
+        "created_at":    now_iso(),
+    }
+    try:
+        res = await vdb.waitlist.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ya estás en la lista de espera de ese horario")
+    position = await vdb.waitlist.count_documents({
+        "venue_id": venue.id, "booking_date": doc["booking_date"], "court_number": entry.court_number,
+        "start_time": start, "status": "waiting", "created_at": {"$lte": doc["created_at"]},
+    })
+    doc["id"] = str(res.inserted_id)
+    doc.pop("_id", None)
+    return {**doc, "position": position}
+
+
+@app.get("/api/waitlist")
+async def list_waitlist(principal: Principal = Depends(get_current_user), venue: VenueConfig = Depends(get_venue)):
+    cursor = venue_db(venue.id).waitlist.find(
+        {"venue_id": venue.id, "email": principal.sub, "status": {"$in": ["waiting", "notified"]}}
+    ).sort([("booking_date", 1), ("start_time", 1)])
+    out = []
+    async for doc in cursor:
+        doc["id"] = str(doc.pop("_id"))
+        out.append(doc)
+    return out
+
+
+@app.delete("/api/waitlist/{entry_id}")
+async def leave_waitlist(entry_id: str, principal: Principal = Depends(get_current_user),
+                         venue: VenueConfig = Depends(get_venue)):
+    try:
+        oid = ObjectId(entry_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid waitlist id")
+    res = await venue_db(venue.id).waitlist.update_one(
+        {"_id": oid, "venue_id": venue.id, "email": principal.sub, "status": "waiting"},
+        {"$set": {"status": "cancelled"}},
+    )
+    if res.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+    return {"detail": "Waitlist entry cancelled"}
+
+
+@app.get("/api/admin/outbox")
+async def list_outbox(status: str = "pending", admin: bool = Depends(get_current_admin),
+                      venue: VenueConfig = Depends(get_venue)):
+    cursor = venue_db(venue.id).outbox.find({"venue_id": venue.id, "status": status}).sort([("created_at", 1)])
+    out = []
+    async for doc in cursor:
+        doc["id"] = str(doc.pop("_id"))
+        out.append(doc)
+    return out
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Trabajos en segundo plano — colección jobs en la base principal (ver jobs.py)
+# En producción: JOB_WORKER_IN_API=0 y `python manage.py worker` como proceso aparte,
+# así la latencia del API no depende del trabajo lateral.
+# ─────────────────────────────────────────────────────────────────────────────
+JOB_WORKER_IN_API   = os.getenv("JOB_WORKER_IN_API", "1") == "1"
+JOB_CONCURRENCY     = parse_concurrency(os.getenv("JOB_CONCURRENCY", ""),
+                                        {"waitlist_promote": 2, "waitlist_expire": 1, "voucher_pdf": 1})
+JOB_VISIBILITY      = {"waitlist_promote": 30.0, "waitlist_expire": 30.0,
+                       "voucher_pdf": 120.0}   # segundos antes de reintentar
+JOB_POLL_SECONDS    = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_MAX_ATTEMPTS    = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+
+job_queue = None    # se crea en el primer uso (necesita db)
+job_worker: Optional[JobWorker] = None
+
+
+def _jobs() -> JobQueue:
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(db.jobs, max_attempts=JOB_MAX_ATTEMPTS)
+    return job_queue
+
+
+async def ensure_job_indexes():
+    await _jobs().ensure_indexes()
+
+
+def _job_venue(job: dict) -> VenueConfig:
+    venue = venue_registry.get(job.get("venue_id") or venue_registry.default_id)
+    if venue is None:
+        raise RuntimeError(f"local desconocido: {job.get('venue_id')}")
+    return venue
+
+
+async def _job_waitlist_promote(job: dict):
+    p = job["payload"]
+    await _promote_next_waiter(_job_venue(job), p["booking_date"], p["court_number"], p["start_time"])
+
+
+async def _job_waitlist_expire(job: dict):
+    await _expire_waiter(_job_venue(job), job["payload"]["entry_id"])
+
+
+async def _job_voucher_pdf(job: dict):
+    # pre-render del voucher pagado: GET /voucher/{id}.pdf lo sirve sin pasar por WeasyPrint
+    venue = _job_venue(job)
+    charge_id = job["payload"]["charge_id"]
+    charge = await _load_charge(venue, charge_id)
+    if charge is None:
+        raise RuntimeError(f"cobro {charge_id} no encontrado")
+    pdf_bytes = await pdf.render(_build_voucher_html(charge, venue))
+    if pdf_bytes is None:
+        return   # sin WeasyPrint en este worker: el endpoint cae al HTML
+    await venue_db(venue.id).voucher_files.update_one(
+        {"venue_id": venue.id, "charge_id": charge_id},
+        {"$set": {"pdf": Binary(pdf_bytes), "created_at": now_iso()}}, upsert=True,
+    )
+
+
+JOB_HANDLERS = {
+    "waitlist_promote": _job_waitlist_promote,
+    "waitlist_expire":  _job_waitlist_expire,
+    "voucher_pdf":      _job_voucher_pdf,
+}
+
+
+def make_job_worker(types: Optional[List[str]] = None, concurrency: Optional[dict] = None) -> JobWorker:
+    handlers = {t: h for t, h in JOB_HANDLERS.items() if not types or t in types}
+    return JobWorker(_jobs(), handlers, concurrency or JOB_CONCURRENCY, JOB_VISIBILITY,
+                     poll_interval=JOB_POLL_SECONDS)
+
+
+def start_job_worker():
+    global job_worker
+    job_worker = make_job_worker()
+    job_worker.start()
+
+
+async def stop_job_worker():
+    global job_worker
+    if job_worker:
+        await job_worker.stop()
+        job_worker = None
+
+
+@app.get("/api/admin/jobs")
+async def list_jobs(status: str = "dead", job_type: Optional[str] = None, limit: int = 50,
+                    admin: bool = Depends(get_current_admin)):
+    match = {"status": status}
+    if job_type:
+        match["type"] = job_type
+    cursor = _jobs().coll.find(match).sort([("run_at", -1)]).limit(max(1, min(limit, 500)))
+    out = []
+    async for job in cursor:
+        job["id"] = str(job.pop("_id"))
+        out.append(job)
+    return out
+
+
+@app.post("/api/admin/jobs/retry")
+async def retry_dead_jobs(job_type: Optional[str] = None, admin: bool = Depends(get_current_admin)):
+    return {"requeued": await _jobs().retry_dead(job_type)}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Perfilado (admin). Afecta solo al worker que recibe la petición.
+# ─────────────────────────────────────────────────────────────────────────────
+@app.post("/api/admin/profile/sample")
+async def profile_sample(seconds: float = 10.0, interval_ms: float = 5.0, all_threads: bool = False,
+                         admin: bool = Depends(get_current_admin)):
+    """Muestrea el hilo del loop (o todos) durante N segundos; responde stacks colapsados."""
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+    sampler = StackSampler(max(0.001, interval_ms / 1000), all_threads=all_threads)
+    try:
+        request_profiler.acquire()
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Ya hay un perfilado en curso")
+    try:
+        samples = await asyncio.to_thread(sampler.run, seconds)
+    finally:
+        request_profiler.release()
+    return Response(render_collapsed(samples), media_type="text/plain; charset=utf-8")
+
+
+@app.post("/api/admin/profile/loop-lag")
+async def profile_loop_lag(threshold_ms: float, admin: bool = Depends(get_current_admin)):
+    """Prende el monitor de lag con este umbral; 0 lo apaga."""
+    await loop_monitor.stop()
+    loop_monitor.threshold_ms = max(0.0, threshold_ms)
+    loop_monitor.start()
+    return loop_monitor.stats()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Metrics (admin)
+# ─────────────────────────────────────────────────────────────────────────────
+@app.get("/api/admin/metrics")
+async def admin_metrics(admin: bool = Depends(get_current_admin)):
+    return {
+        "singleflight": singleflight.stats(),
+        "rate_limit":   _rate_limiter().stats(),
+        "pdf":          pdf.status(),
+        "mongo_pool":   pool_metrics.stats(),
+        "reads":        reads.stats(),
+        "etags":        versions.stats(),
+        "free_index":   free_index.stats(),
+        "events":       events.stats(),
+        "user_search":  user_cache.stats(),
+        "loop_lag":     loop_monitor.stats(),
+        "payments":     {"mode": PAYMENT_MODE, "queued": _charges_to_submit.qsize(), **gateway.stats()},
+        "jobs":         {"depth": await _jobs().depth(), "worker": job_worker.stats() if job_worker else None},
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reports (desde daily_summaries)
+# ─────────────────────────────────────────────────────────────────────────────
+@app.get("/api/reports/day/{booking_date}")
+async def day_report(booking_date: date, admin: bool = Depends(get_current_admin),
+                     venue: VenueConfig = Depends(get_venue)):
+    summary = await _load_summary(venue, booking_date.isoformat(), "reports") or {}
+    courts = []
+    for court in venue.courts:
+        mask = _court_mask(summary, court)
+        slots = venue.slots_for(booking_date)
+        courts.append({
+            "court_number": court,
+            "hours":        ((summary.get("courts") or {}).get(str(court)) or {}).get("hours", 0),
+            "blocked_hours": ((summary.get("courts") or {}).get(str(court)) or {}).get("blocked_hours", 0),
+            "occupied":     [s.start for s in slots if mask & s.mask],
+            "free":         [s.start for s in slots if not mask & s.mask],
+        })
+    revenue_cents = summary.get("revenue_cents", 0)
+    return {
+        "date":          booking_date.isoformat(),
+        "booked_hours":  summary.get("booked_hours", 0),
+        "revenue_cents": revenue_cents,
+        "revenue_soles": round(revenue_cents / 100, 2),
+        "cancellations": summary.get("cancellations", 0),
+        "blocked_hours": summary.get("blocked_hours", 0),
+        "free_courts":   [c["court_number"] for c in courts if c["hours"] == 0],
+        "courts":        courts,
+    }
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Payments (mock) — guarda charge en Mongo para persistencia
 # ─────────────────────────────────────────────────────────────────────────────
@@ -356,73 +2425,404 @@ async def create_payment_session(body: dict = None):
     return {"ok": True, "session": session}
 
 
+def _charge_amount_cents(venue: VenueConfig, req: PaymentRequest) -> int:
+    """El monto sale de la config del local (turnos de metadata.date/start/end), no del cliente."""
+    meta = req.metadata or {}
+    try:
+        cents = venue.range_price_cents(date.fromisoformat(str(meta["date"])), str(meta["start"]), str(meta["end"]))
+    except (KeyError, ValueError, TypeError):
+        cents = None
+    if cents is None or ("court" in meta and not venue.has_court(int(meta["court"]))):
+        raise HTTPException(status_code=400, detail="El cobro debe indicar un turno válido (metadata.date, start, end)")
+    if req.amount_soles is not None and soles_a_centimos(req.amount_soles) != cents:
+        raise HTTPException(status_code=400,
+                            detail=f"El monto no coincide con la tarifa del turno (S/ {cents / 100:.2f})")
+    return cents
+
+
 @app.post("/api/payments/charge")
-async def mock_charge(req: PaymentRequest):
-    if PAYMENT_MODE != "mock":
-        raise HTTPException(status_code=400, detail="PAYMENT_MODE debe ser 'mock' para usar pagos demo.")
+async def mock_charge(req: PaymentRequest, venue: VenueConfig = Depends(get_venue)):
+    if PAYMENT_MODE not in ("mock", "gateway"):
+        raise HTTPException(status_code=400, detail="PAYMENT_MODE debe ser 'mock' o 'gateway' para usar pagos demo.")
+    amount_cents = _charge_amount_cents(venue, req)
 
     status = "paid"
-    if (req.simulate or {}).get("status") == "failed":
+    if PAYMENT_MODE == "gateway":
+        status = "pending"   # lo confirma el webhook del proveedor
+    elif (req.simulate or {}).get("status") == "failed":
         status = "failed"
 
     charge_id = f"ch_mock_{ObjectId()}"
     charge_obj = {
         "id": charge_id,
+        "venue_id": venue.id,
         "status": status,
-        "amount": soles_a_centimos(req.amount_soles),
-        "amount_soles": float(round(req.amount_soles, 2)),
+        "amount": amount_cents,
+        "amount_soles": amount_cents / 100,
         "currency": "PEN",
         "email": str(req.email),
         "method": req.method,  # "card" | "yape"
         "description": req.description or "Pago de reserva (demo)",
         "metadata": req.metadata or {},  # aquí puede venir 'admin_comment'
         "created_at": now_iso(),
-        "voucher_url": f"/voucher/{charge_id}"
+        "voucher_url": _voucher_url(venue, charge_id)
     }
+    if status == "pending":
+        await venue_db(venue.id).charges.insert_one(dict(charge_obj))
+        _charges_to_submit.put_nowait((charge_obj, req.simulate or {}, 0))
+        return {"ok": True, "charge": charge_obj}
+
     # memoria + persistencia en Mongo
     MOCK_DB["charges"][charge_id] = charge_obj
-    await db.charges.update_one({"id": charge_id}, {"$set": charge_obj}, upsert=True)
+    await venue_db(venue.id).charges.update_one(
+        {"venue_id": venue.id, "id": charge_id}, {"$set": charge_obj}, upsert=True
+    )
 
     ok = status == "paid"
+    if ok:
+        await _jobs().enqueue("voucher_pdf", {"charge_id": charge_id}, venue.id)
+    events.emit(venue.id, "charge_paid" if ok else "charge_failed", None, actor=str(req.email),
+                charge_id=charge_id, amount=charge_obj["amount"], method=req.method)
     return {"ok": ok, "charge": charge_obj}
 
 
+@app.get("/api/payments/charge/{charge_id}")
+async def get_charge_status(charge_id: str, venue: VenueConfig = Depends(get_venue)):
+    # el checkout consulta acá mientras el cobro está pending (desde el primario: lo escribe el webhook)
+    charge = await venue_db(venue.id).charges.find_one(
+        {"venue_id": venue.id, "id": charge_id},
+        {"_id": 0, "id": 1, "status": 1, "amount": 1, "amount_soles": 1, "voucher_url": 1},
+    )
+    if charge is None:
+        raise HTTPException(status_code=404, detail="Charge not found")
+    return {"ok": charge["status"] == "paid", "charge": charge}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Pipeline de pagos (PAYMENT_MODE=gateway; ver payment_gateway.py)
+#   charge → pending → worker lo envía al proveedor → webhook liquida cobro y reservas
+# El webhook es idempotente: el cambio de estado es condicional (solo desde pending),
+# así reentregas y eventos en desorden no hacen nada la segunda vez.
+# ─────────────────────────────────────────────────────────────────────────────
+PAYMENT_SUBMIT_ATTEMPTS = 5
+PAYMENT_SUBMIT_LEASE    = float(os.getenv("PAYMENT_SUBMIT_LEASE_SECONDS", "60"))
+PAYMENT_RESUBMIT_EVERY  = float(os.getenv("PAYMENT_RESUBMIT_SECONDS", "60"))
+_PAYMENT_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_charges_to_submit: asyncio.Queue = asyncio.Queue()
+_payment_tasks: List[asyncio.Task] = []
+
+
+async def _claim_charge(charge: dict, renew: bool = False) -> bool:
+    """Toma el envío de un cobro (lease): con varios procesos solo uno lo manda al proveedor.
+    renew=True extiende el lease propio entre reintentos; si otro lo tomó al vencer, False."""
+    now = datetime.now(timezone.utc)
+    owner = ({"submit_owner": _PAYMENT_OWNER} if renew else
+             {"$or": [{"submit_lease_until": {"$exists": False}},
+                      {"submit_lease_until": {"$lt": now.isoformat()}}]})
+    res = await venue_db(charge["venue_id"]).charges.update_one(
+        {"venue_id": charge["venue_id"], "id": charge["id"], "status": "pending",
+         "submitted_at": {"$exists": False}, **owner},
+        {"$set": {"submit_owner": _PAYMENT_OWNER,
+                  "submit_lease_until": (now + timedelta(seconds=PAYMENT_SUBMIT_LEASE)).isoformat()}},
+    )
+    return res.modified_count == 1
+
+
+async def _submit_charge(charge: dict, simulate: dict, attempt: int):
+    if not await _claim_charge(charge, renew=attempt > 0):
+        return   # ya enviado, liquidado o en manos de otro proceso
+    coll = venue_db(charge["venue_id"]).charges
+    try:
+        # el id del cobro va como Idempotency-Key: un reenvío tras un timeout no crea otro cobro
+        out = await gateway.submit(charge, PAYMENT_WEBHOOK_URL, simulate)
+    except Exception:
+        if attempt + 1 >= PAYMENT_SUBMIT_ATTEMPTS:
+            # queda pending sin submitted_at y sin lease: el próximo barrido lo reintenta
+            logger.exception("pagos: no se pudo enviar %s al proveedor", charge["id"])
+            await coll.update_one({"venue_id": charge["venue_id"], "id": charge["id"], "submit_owner": _PAYMENT_OWNER},
+                                  {"$unset": {"submit_owner": "", "submit_lease_until": ""}})
+            return
+        asyncio.get_running_loop().call_later(
+            2 ** attempt, _charges_to_submit.put_nowait, (charge, simulate, attempt + 1)
+        )
+        return
+    await coll.update_one(
+        {"venue_id": charge["venue_id"], "id": charge["id"]},
+        {"$set": {"provider_ref": out.get("id"), "submitted_at": now_iso()},
+         "$unset": {"submit_owner": "", "submit_lease_until": ""}},
+    )
+
+
+async def _payment_dispatcher():
+    while True:
+        charge, simulate, attempt = await _charges_to_submit.get()
+        try:
+            await _submit_charge(charge, simulate, attempt)
+        except Exception:
+            logger.exception("pagos: envío de %s", charge.get("id"))
+        finally:
+            _charges_to_submit.task_done()
+
+
+async def _resubmit_unsent_charges():
+    # cobros que quedaron en la cola de un proceso que se cayó antes de enviarlos (lease vencido).
+    # Todos los procesos barren: _claim_charge decide cuál de ellos lo envía.
+    while True:
+        now = now_iso()
+        for venue in venue_registry.all():
+            cursor = venue_db(venue.id).charges.find(
+                {"venue_id": venue.id, "status": "pending", "submitted_at": {"$exists": False},
+                 "$or": [{"submit_lease_until": {"$exists": False}}, {"submit_lease_until": {"$lt": now}}]},
+                {"_id": 0},
+            )
+            async for charge in cursor:
+                _charges_to_submit.put_nowait((charge, {}, 0))
+        await asyncio.sleep(PAYMENT_RESUBMIT_EVERY)
+
+
+def start_payment_dispatcher():
+    _payment_tasks.extend(asyncio.create_task(_payment_dispatcher()) for _ in range(PAYMENT_DISPATCHERS))
+    _payment_tasks.append(asyncio.create_task(_resubmit_unsent_charges()))
+
+
+async def stop_payment_dispatcher():
+    for task in _payment_tasks:
+        task.cancel()
+    await asyncio.gather(*_payment_tasks, return_exceptions=True)
+    _payment_tasks.clear()
+
+
+async def _settle_charge(venue: VenueConfig, charge_id: str, status: str, provider_ref: Optional[str]) -> bool:
+    """pending → paid/failed y sus reservas. False si ya estaba liquidado (o no existe)."""
+    vdb = venue_db(venue.id)
+    charge = await vdb.charges.find_one_and_update(
+        {"venue_id": venue.id, "id": charge_id, "status": "pending"},
+        {"$set": {"status": status, "settled_at": now_iso(), "provider_ref": provider_ref}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if charge is None:
+        return False
+    events.emit(venue.id, "charge_paid" if status == "paid" else "charge_failed", None, actor="gateway",
+                charge_id=charge_id, amount=charge.get("amount"), method=charge.get("method"))
+    if status == "paid":
+        await _jobs().enqueue("voucher_pdf", {"charge_id": charge_id}, venue.id)
+        docs = await vdb.bookings.find(
+            {"venue_id": venue.id, "charge_id": charge_id, "payment_status": "pending"}, {"_id": 1}
+        ).to_list(None)
+        if docs:
+            await vdb.bookings.update_many(
+                {"_id": {"$in": [d["_id"] for d in docs]}, "payment_status": "pending"},
+                {"$set": {"payment_status": "paid"}},
+            )
+            # sin evento, replay-events --verify vería payment_status desactualizado
+            _emit_bookings(venue, "booking_updated", docs, "gateway", fields={"payment_status": "paid"})
+        return True
+    # pago rechazado: se liberan los turnos que se reservaron mientras estaba pending
+    docs = await vdb.bookings.find({"venue_id": venue.id, "charge_id": charge_id, "status": "confirmed"}).to_list(None)
+    if docs:
+        await vdb.bookings.update_many(
+            {"_id": {"$in": [d["_id"] for d in docs]}, "status": "confirmed"},
+            {"$set": {"status": "cancelled", "payment_status": "failed"}},
+        )
+        await _summary_apply_many(venue, docs, added=False)
+        await _apply_daily_hours(venue, docs, added=False)
+        await _slots_freed(venue, docs)
+        _emit_bookings(venue, "booking_cancelled", docs, "gateway", reason="payment_failed",
+                       fields={"payment_status": "failed"})
+    return True
+
+
+@app.post("/api/payments/webhook")
+async def payment_webhook(request: Request):
+    body = await request.body()
+    if not verify_signature(PAYMENT_WEBHOOK_SECRET, body, request.headers.get("x-signature")):
+        raise HTTPException(status_code=401, detail="Firma inválida")
+    try:
+        event = json.loads(body)
+        data = event["data"]
+        charge_id = data["charge_id"]
+        event_id = event["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Evento inválido")
+    venue = venue_registry.get((data.get("metadata") or {}).get("venue_id") or venue_registry.default_id)
+    if venue is None:
+        raise HTTPException(status_code=400, detail="Local desconocido")
+
+    try:
+        res = await venue_db(venue.id).payment_events.update_one(
+            {"venue_id": venue.id, "event_id": event_id},
+            {"$setOnInsert": {"type": event.get("type"), "charge_id": charge_id, "received_at": now_iso()}},
+            upsert=True,
+        )
+        duplicate = res.upserted_id is None
+    except DuplicateKeyError:
+        duplicate = True   # dos entregas del mismo evento a la vez
+    # se aplica aunque sea reentrega: si la primera vez falló a mitad, esta la completa
+    settled = False
+    status = TERMINAL_EVENTS.get(event.get("type"))
+    if status:
+        settled = await _settle_charge(venue, charge_id, status, data.get("provider_ref"))
+    return {"ok": True, "duplicate": duplicate, "settled": settled}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Libro de cobros (admin) — keyset sobre (created_at, _id) descendente.
+# El cursor es opaco: el último (created_at, _id) de la página anterior. Primero
+# se recorre charges y al agotarse charges_archive (todo lo archivado es más viejo).
+# ─────────────────────────────────────────────────────────────────────────────
+MAX_LEDGER_PAGE = 500
+
+
+def _encode_cursor(doc: dict) -> str:
+    raw = f"{doc['created_at']}|{doc['_id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, oid = raw.rsplit("|", 1)
+        return created_at, ObjectId(oid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def _charge_filter(venue: VenueConfig, status: Optional[str], method: Optional[str], email: Optional[str],
+                   date_from: Optional[date], date_to: Optional[date]) -> dict:
+    match = {"venue_id": venue.id}
+    if status:
+        match["status"] = status
+    if method:
+        match["method"] = method
+    if email:
+        match["email"] = email
+    # created_at es ISO en UTC; los días son los del local (medianoche en Lima = 05:00 UTC)
+    tz = ZoneInfo(venue.timezone)
+
+    def midnight(d: date) -> str:
+        return datetime.combine(d, time(0), tzinfo=tz).astimezone(timezone.utc).isoformat()
+
+    rng = {}
+    if date_from:
+        rng["$gte"] = midnight(date_from)
+    if date_to:
+        rng["$lt"] = midnight(date_to + timedelta(days=1))
+    if rng:
+        match["created_at"] = rng
+    return match
+
+
 @app.get("/api/payments/charges")
-async def list_mock_charges():
-    cursor = db.charges.find({}).sort([("created_at", -1)])
-    out = []
-    async for c in cursor:
-        c["mongo_id"] = str(c["_id"])
-        out.append(c)
-    return {"ok": True, "charges": out}
+async def list_mock_charges(status: Optional[str] = None, method: Optional[str] = None,
+                            email: Optional[str] = None, date_from: Optional[date] = None,
+                            date_to: Optional[date] = None, cursor: Optional[str] = None, limit: int = 50,
+                            admin: bool = Depends(get_current_admin), venue: VenueConfig = Depends(get_venue)):
+    vdb = venue_db(venue.id).with_options(read_preference=reads.preference("exports"))
+    limit = max(1, min(limit, MAX_LEDGER_PAGE))
+    match = _charge_filter(venue, status, method, email, date_from, date_to)
+    if cursor:
+        created_at, oid = _decode_cursor(cursor)
+        match = {"$and": [match, {"$or": [{"created_at": {"$lt": created_at}},
+                                          {"created_at": created_at, "_id": {"$lt": oid}}]}]}
+    order = [("created_at", -1), ("_id", -1)]
+    out = await vdb.charges.find(match).sort(order).limit(limit + 1).to_list(None)
+    archived = vdb.charges_archive.find(match).sort(order)
+    while len(out) <= limit:
+        docs = await archived.to_list(limit - len(out) + 1)
+        if not docs:
+            break
+        out.extend(await _drop_hot_copies(vdb, "charges", docs))
+    has_more = len(out) > limit
+    out = out[:limit]
+    next_cursor = _encode_cursor(out[-1]) if has_more else None
+    for c in out:
+        c["mongo_id"] = str(c.pop("_id"))
+    return {"ok": True, "charges": out, "next_cursor": next_cursor}
+
+
+@app.get("/api/payments/charges/totals")
+async def charge_totals(status: Optional[str] = None, method: Optional[str] = None,
+                        email: Optional[str] = None, date_from: Optional[date] = None,
+                        date_to: Optional[date] = None, admin: bool = Depends(get_current_admin),
+                        venue: VenueConfig = Depends(get_venue)):
+    """Totales por día (del local), método y estado: un $group en Mongo por colección, no sumas en el cliente."""
+    vdb = venue_db(venue.id).with_options(read_preference=reads.preference("reports"))
+    match = _charge_filter(venue, status, method, email, date_from, date_to)
+    group = {"$group": {
+        "_id":          {"day": {"$dateToString": {"format": "%Y-%m-%d", "timezone": venue.timezone,
+                                                   "date": {"$dateFromString": {"dateString": "$created_at"}}}},
+                         "method": "$method", "status": "$status"},
+        "count":        {"$sum": 1},
+        "amount_cents": {"$sum": "$amount"},
+    }}
+    # corte por la frontera del archivo: el cobro más viejo que sigue en el hot. Del hot va todo
+    # (created_at >= corte) y del archivo solo lo anterior al corte; un lote a medio mover está
+    # en los dos pero cae del lado del hot y se cuenta una vez, sin cruzar documento por documento
+    oldest = await vdb.charges.find({"venue_id": venue.id}, {"created_at": 1})\
+        .sort([("created_at", 1), ("_id", 1)]).limit(1).to_list(1)
+    archived = match
+    if oldest:
+        cut, cut_id = oldest[0]["created_at"], oldest[0]["_id"]
+        archived = {"$and": [match, {"$or": [{"created_at": {"$lt": cut}},
+                                             {"created_at": cut, "_id": {"$lt": cut_id}}]}]}
+    rows: dict = {}
+    for coll, stages in ((vdb.charges, [{"$match": match}, group]),
+                         (vdb.charges_archive, [{"$match": archived}, group])):
+        async for r in coll.aggregate(stages):
+            key = (r["_id"]["day"], r["_id"].get("method"), r["_id"].get("status"))
+            row = rows.setdefault(key, {"count": 0, "amount_cents": 0})
+            row["count"] += r["count"]
+            row["amount_cents"] += r["amount_cents"]
+
+    def rollup(index: int) -> dict:
+        out: dict = {}
+        for key, row in rows.items():
+            acc = out.setdefault(key[index], {"count": 0, "amount_cents": 0})
+            acc["count"] += row["count"]
+            acc["amount_cents"] += row["amount_cents"]
+        return out
+
+    return {
+        "days":      [{"date": k[0], "method": k[1], "status": k[2], **row} for k, row in sorted(rows.items())],
+        "by_day":    rollup(0),
+        "by_method": rollup(1),
+        "by_status": rollup(2),
+        "total":     {"count": sum(r["count"] for r in rows.values()),
+                      "amount_cents": sum(r["amount_cents"] for r in rows.values())},
+    }
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Voucher helpers (reconstrucción por charge_id/voucher_url)
 # ─────────────────────────────────────────────────────────────────────────────
-async def _load_charge(charge_id: str) -> Optional[dict]:
+async def _load_charge(venue: VenueConfig, charge_id: str) -> Optional[dict]:
+    # un link de voucher compartido abierto por muchos a la vez → una sola búsqueda
+    return await singleflight.do("charge", (venue.id, charge_id), lambda: _fetch_charge(venue, charge_id))
+
+
+async def _fetch_charge(venue: VenueConfig, charge_id: str) -> Optional[dict]:
+    vdb = venue_db(venue.id).with_options(read_preference=reads.preference("vouchers"))
     # 1) memoria
     ch = MOCK_DB["charges"].get(charge_id)
-    if ch:
+    if ch and ch.get("venue_id", venue.id) == venue.id:
         return ch
-    # 2) Mongo (charges)
-    doc = await db.charges.find_one({"id": charge_id})
-    if doc:
-        return doc
-    # 3) Reconstrucción desde reservas por charge_id
-    bookings = [b async for b in db.bookings.find({"charge_id": charge_id}).sort([("booking_date", 1), ("start_time", 1)])]
-    if not bookings:
-        # 4) Respaldo: por voucher_url exacto y regex (pudo guardarse con URL absoluta)
-        vurl = f"/voucher/{charge_id}"
-        bookings = [b async for b in db.bookings.find({"voucher_url": vurl}).sort([("booking_date", 1), ("start_time", 1)])]
-        if not bookings:
-            bookings = [b async for b in db.bookings.find({"voucher_url": {"$regex": charge_id}}).sort([("booking_date", 1), ("start_time", 1)])]
-    if not bookings:
+    # 2) Mongo (charges, y si ya se archivó, charges_archive)
+    for coll in (vdb.charges, vdb.charges_archive):
+        doc = await coll.find_one({"venue_id": venue.id, "id": charge_id})
+        if doc:
+            return doc
+    # 3) Reconstrucción desde reservas (hot y luego archivo)
+    for coll in (vdb.bookings, vdb.bookings_archive):
+        bookings = await _voucher_bookings(coll, venue, charge_id)
+        if bookings:
+            break
+    else:
         return None
 
     first = bookings[0]
     last  = bookings[-1]
     n_hours = len(bookings)
+    amount_cents = sum(_booking_price_cents(b, venue) for b in bookings)
 
     court   = first.get("court_number")
     date_   = first.get("booking_date")
@@ -446,24 +2846,43 @@ async def _load_charge(charge_id: str) -> Optional[dict]:
     charge_obj = {
         "id": charge_id,
         "status": "paid",
-        "amount": int(PRICE_PER_HOUR * 100 * n_hours),
-        "amount_soles": float(PRICE_PER_HOUR * n_hours),
+        "amount": amount_cents,
+        "amount_soles": amount_cents / 100,
         "currency": "PEN",
         "email": email,
         "method": "mock",
         "description": f"Reserva Cancha {court} | {start}–{end} ({n_hours}h)",
         "metadata": meta,
         "created_at": now_iso(),
-        "voucher_url": f"/voucher/{charge_id}",
+        "voucher_url": _voucher_url(venue, charge_id),
     }
     return charge_obj
 
 
-def _build_voucher_html(charge: dict) -> str:
+async def _voucher_bookings(coll, venue: VenueConfig, charge_id: str) -> List[dict]:
+    order = [("booking_date", 1), ("start_time", 1)]
+    bookings = [b async for b in coll.find({"venue_id": venue.id, "charge_id": charge_id}).sort(order)]
+    if not bookings:
+        # Respaldo: por voucher_url exacto y regex (pudo guardarse con URL absoluta)
+        vurl = _voucher_url(venue, charge_id)
+        bookings = [b async for b in coll.find({"venue_id": venue.id, "voucher_url": vurl}).sort(order)]
+        if not bookings:
+            bookings = [b async for b in coll.find({"venue_id": venue.id,
+                                                    "voucher_url": {"$regex": charge_id}}).sort(order)]
+    return bookings
+
+
+VOUCHER_STATES = {
+    "paid":    ("PAGADO", "ok"),
+    "pending": ("PENDIENTE", "pending"),
+    "failed":  ("RECHAZADO", "fail"),
+}
+
+
+def _build_voucher_html(charge: dict, venue: VenueConfig) -> str:
     r = charge.get("metadata") or {}
-    status_ok = (charge["status"] == "paid")
-    status_label = "PAGADO" if status_ok else "RECHAZADO"
-    state_class  = "ok" if status_ok else "fail"
+    # con el proveedor asíncrono un cobro puede seguir pending: no se muestra como rechazado
+    status_label, state_class = VOUCHER_STATES.get(charge["status"], VOUCHER_STATES["failed"])
 
     cancha   = r.get("court", "-")
     fecha    = r.get("date", "-")
@@ -512,6 +2931,7 @@ def _build_voucher_html(charge: dict) -> str:
   .state {{ position:absolute; right:12px; top:12px; font-size:12px; padding:4px 8px; border-radius:999px; background: rgba(255,255,255,.2); }}
   .ok {{ border:1px solid rgba(255,255,255,.5) }}
   .fail {{ background:#ef4444 }}
+  .pending {{ background:#f59e0b }}
   .amount {{
     font-size: 24px; font-weight: 800; margin-top: 8px;
   }}
@@ -555,7 +2975,7 @@ def _build_voucher_html(charge: dict) -> str:
       <div class="row"><div class="label">Cancha</div><div class="strong">{cancha}</div></div>
       <div class="row"><div class="label">Día</div><div class="strong">{fecha}</div></div>
       <div class="row"><div class="label">Horario</div><div class="strong">{inicio} – {fin}</div></div>
-      <div class="row"><div class="label">Dirección</div><div class="strong">{VOUCHER_ADDRESS}</div></div>
+      <div class="row"><div class="label">Dirección</div><div class="strong">{venue.address or VOUCHER_ADDRESS}</div></div>
       {comment_row}
     </div>
 
@@ -571,7 +2991,7 @@ def _build_voucher_html(charge: dict) -> str:
 """.strip()
 
 
-def _fallback_charge_from_query(charge_id: str, qp) -> Optional[dict]:
+def _fallback_charge_from_query(venue: VenueConfig, charge_id: str, qp) -> Optional[dict]:
     """
     Construye un 'charge' sintético a partir de los query params si no se encontró en DB.
     Requiere: court, date (YYYY-MM-DD), start (HH:MM), end (HH:MM), name o email.
@@ -591,10 +3011,18 @@ def _fallback_charge_from_query(charge_id: str, qp) -> Optional[dict]:
         return None
 
     try:
-        hh0 = int(start.split(":")[0]); hh1 = int(end.split(":")[0])
-        n_hours = max(1, min(6, hh1 - hh0))
+        d = date.fromisoformat(date_)
+        t0 = hhmm_to_minutes(start); t1 = hhmm_to_minutes(end)
+        t1 = max(t0 + venue.slot_minutes, min(t0 + 6 * 60, t1))
+        amount_cents = sum(
+            venue.price_cents(d, s.start) for s in venue.slots_for(d)
+            if t0 <= hhmm_to_minutes(s.start) and hhmm_to_minutes(s.end) <= t1
+        ) or venue.price_cents(d, start)
+        n_hours = (t1 - t0) / 60
     except Exception:
+        amount_cents = soles_a_centimos(venue.pricing.off_peak)
         n_hours = 1
+    n_hours = int(n_hours) if float(n_hours).is_integer() else n_hours
 
     meta = {
         "court": int(court),
@@ -609,42 +3037,39 @@ def _fallback_charge_from_query(charge_id: str, qp) -> Optional[dict]:
     return {
         "id": charge_id,
         "status": "paid",
-        "amount": int(PRICE_PER_HOUR * 100 * n_hours),
-        "amount_soles": float(PRICE_PER_HOUR * n_hours),
+        "amount": amount_cents,
+        "amount_soles": amount_cents / 100,
         "currency": "PEN",
         "email": email or "demo@example.com",
         "method": "mock",  # para el flujo "Otro" (sin pasar por /charge)
         "description": f"Reserva Cancha {court} | {start}–{end} ({n_hours}h)",
         "metadata": meta,
         "created_at": now_iso(),
-        "voucher_url": f"/voucher/{charge_id}",
+        "voucher_url": _voucher_url(venue, charge_id),
     }
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Voucher endpoints
 # ─────────────────────────────────────────────────────────────────────────────
-@app.get("/voucher/{charge_id}", response_class=HTMLResponse)
-async def voucher_html(charge_id: str, request: Request):
-    charge = await _load_charge(charge_id)
-    if not charge:
-        charge = _fallback_charge_from_query(charge_id, request.query_params)
-    if not charge:
-        raise HTTPException(status_code=404, detail="Voucher no encontrado")
-    html = _build_voucher_html(charge)
-    return HTMLResponse(content=html, status_code=200)
-
-
+# el .pdf va primero: si no, /voucher/{charge_id} lo captura con charge_id="….pdf"
 @app.get("/voucher/{charge_id}.pdf")
-async def voucher_pdf(charge_id: str, request: Request):
-    charge = await _load_charge(charge_id)
+async def voucher_pdf(charge_id: str, request: Request, venue: VenueConfig = Depends(get_venue)):
+    stored = await venue_db(venue.id).voucher_files.find_one({"venue_id": venue.id, "charge_id": charge_id})
+    if stored:
+        events.emit(venue.id, "voucher_rendered", None, charge_id=charge_id, format="pdf")
+        return Response(content=bytes(stored["pdf"]), media_type="application/pdf",
+                        headers={"Content-Disposition": f'inline; filename="voucher_{charge_id}.pdf"'})
+    charge = await _load_charge(venue, charge_id)
     if not charge:
-        charge = _fallback_charge_from_query(charge_id, request.query_params)
+        charge = _fallback_charge_from_query(venue, charge_id, request.query_params)
     if not charge:
         raise HTTPException(status_code=404, detail="Voucher no encontrado")
-    html = _build_voucher_html(charge)
-    if WEASY_AVAILABLE:
-        pdf_bytes = WeasyHTML(string=html).write_pdf()
+    html = _build_voucher_html(charge, venue)
+    pdf_bytes = await pdf.render(html)
+    events.emit(venue.id, "voucher_rendered", None, charge_id=charge_id,
+                format="pdf" if pdf_bytes is not None else "html")
+    if pdf_bytes is not None:
         return StreamingResponse(
             io.BytesIO(pdf_bytes),
             media_type="application/pdf",
@@ -652,3 +3077,15 @@ async def voucher_pdf(charge_id: str, request: Request):
         )
     # Fallback a HTML si no hay WeasyPrint
     return HTMLResponse(content=html, status_code=200)
+
+
+@app.get("/voucher/{charge_id}", response_class=HTMLResponse)
+async def voucher_html(charge_id: str, request: Request, venue: VenueConfig = Depends(get_venue)):
+    charge = await _load_charge(venue, charge_id)
+    if not charge:
+        charge = _fallback_charge_from_query(venue, charge_id, request.query_params)
+    if not charge:
+        raise HTTPException(status_code=404, detail="Voucher no encontrado")
+    html = _build_voucher_html(charge, venue)
+    events.emit(venue.id, "voucher_rendered", None, charge_id=charge_id, format="html")
+    return HTMLResponse(content=html, status_code=200)
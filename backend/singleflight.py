@@ -0,0 +1,43 @@
+"""
+Single-flight: peticiones concurrentes con la misma clave esperan una sola
+ejecución en curso y comparten su resultado (no es una caché: al terminar
+la ejecución la clave se libera).
+
+Los resultados se comparten entre todos los que esperaban: no mutarlos.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, name: str, field: str):
+        stats = self._stats.setdefault(name, {"calls": 0, "executions": 0, "collapsed": 0})
+        stats[field] += 1
+
+    async def do(self, name: str, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._count(name, "calls")
+        full_key = (name, key)
+        fut = self._inflight.get(full_key)
+        if fut is None:
+            self._count(name, "executions")
+            # tarea propia: si el primer llamador se cancela, los demás igual reciben el resultado
+            fut = asyncio.ensure_future(fn())
+            self._inflight[full_key] = fut
+            fut.add_done_callback(lambda f: self._release(full_key, f))
+        else:
+            self._count(name, "collapsed")
+        return await asyncio.shield(fut)
+
+    def _release(self, full_key, fut: asyncio.Future):
+        if self._inflight.get(full_key) is fut:
+            del self._inflight[full_key]
+        if not fut.cancelled():
+            fut.exception()   # evita "exception was never retrieved" si nadie esperaba ya
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(s, inflight=sum(1 for k in self._inflight if k[0] == name))
+                for name, s in self._stats.items()}
@@ -0,0 +1,125 @@
+"""
+Búsqueda de clientes para el autocompletado del panel admin.
+
+Cada usuario guarda `search_tokens`: palabras del nombre sin tildes en minúscula,
+el email completo y sus partes, y los dígitos del teléfono. Con un índice
+multikey (venue_id, search_tokens), un regex anclado ("^juan") se resuelve con
+rangos del índice y no recorre la colección.
+
+Encima va un PrefixCache en memoria de clientes recientes (prefijo → ids) que
+contesta en microsegundos mientras el admin escribe. Cuando Mongo devuelve
+menos resultados que el tope para un prefijo, ese prefijo queda marcado como
+"completo": todo lo que lo extienda ("juan" → "juan p") se contesta solo con
+la cache, sin volver a la base, hasta que vence la marca.
+"""
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+MAX_PREFIX = 24   # prefijos más largos se filtran contra los tokens completos
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+def search_tokens(customer_name: str, email: str, phone: str) -> List[str]:
+    email = (email or "").lower()
+    tokens = set(normalize(customer_name).split())
+    if email:
+        tokens.add(email)
+        tokens.update(t for t in re.split(r"[@._+\-]", email.split("@")[0]) if t)
+    digits = re.sub(r"\D", "", phone or "")
+    if digits:
+        tokens.add(digits)
+    return sorted(tokens)
+
+
+def query_words(q: str, max_words: int = 4) -> List[str]:
+    return normalize(q).split()[:max_words]
+
+
+def mongo_filter(venue_id: str, words: List[str]) -> dict:
+    return {"venue_id": venue_id, "search_tokens": {"$all": [re.compile("^" + re.escape(w)) for w in words]}}
+
+
+class PrefixCache:
+    def __init__(self, max_users: int = 5000, complete_ttl: float = 60.0, max_complete: int = 5000):
+        self.max_users = max_users
+        self.complete_ttl = complete_ttl
+        self.max_complete = max_complete
+        # uid → (venue_id, resumen, tokens); orden = uso reciente
+        self._users: "OrderedDict[str, Tuple[str, dict, List[str]]]" = OrderedDict()
+        self._prefixes: Dict[Tuple[str, str], Set[str]] = {}
+        self._complete: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._users
+
+    def add(self, venue_id: str, user: dict, tokens: List[str]):
+        uid = user["id"]
+        if uid in self._users:
+            self._users.move_to_end(uid)
+            return
+        self._users[uid] = (venue_id, user, tokens)
+        for token in tokens:
+            for i in range(1, min(len(token), MAX_PREFIX) + 1):
+                self._prefixes.setdefault((venue_id, token[:i]), set()).add(uid)
+        while len(self._users) > self.max_users:
+            self._evict()
+
+    def _evict(self):
+        uid, (venue_id, _, tokens) = self._users.popitem(last=False)
+        for token in tokens:
+            for i in range(1, min(len(token), MAX_PREFIX) + 1):
+                ids = self._prefixes.get((venue_id, token[:i]))
+                if ids is not None:
+                    ids.discard(uid)
+                    if not ids:
+                        del self._prefixes[(venue_id, token[:i])]
+        # un prefijo "completo" podía incluir a este usuario: ya no se puede confiar en ninguno del local
+        for key in [k for k in self._complete if k[0] == venue_id]:
+            del self._complete[key]
+
+    def search(self, venue_id: str, words: List[str], limit: int) -> List[dict]:
+        ids: Optional[Set[str]] = None
+        for w in words:
+            found = self._prefixes.get((venue_id, w[:MAX_PREFIX]), set())
+            ids = set(found) if ids is None else ids & found
+            if not ids:
+                return []
+        out = []
+        for uid in ids or ():
+            _, user, tokens = self._users[uid]
+            if all(any(t.startswith(w) for t in tokens) for w in words if len(w) > MAX_PREFIX):
+                out.append(user)
+        out.sort(key=lambda u: (normalize(u["customer_name"]), u["email"]))
+        return out[:limit]
+
+    def mark_complete(self, venue_id: str, norm_query: str):
+        key = (venue_id, norm_query)
+        self._complete[key] = time.monotonic() + self.complete_ttl
+        self._complete.move_to_end(key)
+        while len(self._complete) > self.max_complete:
+            self._complete.popitem(last=False)
+
+    def is_complete(self, venue_id: str, norm_query: str) -> bool:
+        """¿Algún prefijo de la consulta ya se trajo entero de Mongo? (y no venció)."""
+        now = time.monotonic()
+        for i in range(1, len(norm_query) + 1):
+            expires = self._complete.get((venue_id, norm_query[:i].rstrip()))
+            if expires is not None and expires > now:
+                self.hits += 1
+                return True
+        self.misses += 1
+        return False
+
+    def stats(self) -> dict:
+        return {"users": len(self._users), "prefixes": len(self._prefixes), "complete": len(self._complete),
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,276 @@
+"""
+Configuración del local (canchas, horario de atención, duración de turno y tarifas).
+
+Se lee una sola vez desde el JSON indicado en VENUE_CONFIG y queda en memoria;
+si el archivo cambia se recarga solo (se revisa el mtime cada pocos segundos).
+Sin archivo se usa la grilla clásica: 3 canchas, 06:00–22:00, turnos de 1h
+y tarifa plana PRICE_PER_HOUR.
+
+Formato:
+{
+  "id": "default",
+  "name": "Tennis Court",
+  "address": "Tomas Marsano 2175, Surquillo",
+  "timezone": "America/Lima",
+  "courts": [1, 2, 3],
+  "slot_minutes": 60,
+  "opening_hours": {"default": ["06:00", "22:00"], "sun": ["08:00", "20:00"], "mon": null},
+  "pricing": {"off_peak": 35, "peak": 45, "peak_hours": ["18:00", "22:00"],
+              "peak_days": ["mon", "tue", "wed", "thu", "fri"]}
+}
+Los precios son por hora; un turno de 30 min cuesta la mitad. La zona horaria
+(America/Lima si no se indica) define qué es "un día" en los reportes de cobros.
+
+Varios locales en un mismo despliegue: {"venues": [{...}, {...}]}; el primero es
+el local por defecto (el que atiende las peticiones sin X-Venue-Id).
+"""
+import json
+import os
+import threading
+import time as _time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+MASK_UNIT_MINUTES = 30   # granularidad de los bitmasks de ocupación
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DEFAULT_TIMEZONE = "America/Lima"
+
+
+def hhmm_to_minutes(hhmm: str) -> int:
+    hh, mm = hhmm[:5].split(":")
+    return int(hh) * 60 + int(mm)
+
+
+def minutes_to_hhmm(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def occupancy_mask(start_min: int, minutes: int) -> int:
+    first = start_min // MASK_UNIT_MINUTES
+    n = max(1, minutes // MASK_UNIT_MINUTES)
+    return ((1 << n) - 1) << first
+
+
+class Slot(NamedTuple):
+    start:       str
+    end:         str
+    mask:        int
+    price_cents: int
+
+
+@dataclass(frozen=True)
+class Pricing:
+    off_peak:   float
+    peak:       float
+    peak_start: int = 0          # minutos desde 00:00
+    peak_end:   int = 0
+    peak_days:  frozenset = frozenset()
+
+    def per_hour(self, weekday: int, start_min: int) -> float:
+        if weekday in self.peak_days and self.peak_start <= start_min < self.peak_end:
+            return self.peak
+        return self.off_peak
+
+
+@dataclass(frozen=True)
+class VenueConfig:
+    id:            str
+    name:          str
+    address:       str
+    courts:        Tuple[int, ...]
+    slot_minutes:  int
+    opening:       Tuple[Optional[Tuple[int, int]], ...]   # por weekday (0=lunes)
+    pricing:       Pricing
+    timezone:      str = DEFAULT_TIMEZONE
+    templates:     Tuple[Tuple[Slot, ...], ...] = field(default=(), compare=False)
+    _by_start:     Tuple[Dict[str, Slot], ...] = field(default=(), compare=False, repr=False)
+
+    def __post_init__(self):
+        templates = []
+        for wd in range(7):
+            slots = []
+            hours = self.opening[wd]
+            if hours:
+                t, close = hours
+                while t + self.slot_minutes <= close:
+                    price = self.pricing.per_hour(wd, t) * self.slot_minutes / 60
+                    slots.append(Slot(
+                        start=minutes_to_hhmm(t),
+                        end=minutes_to_hhmm(t + self.slot_minutes),
+                        mask=occupancy_mask(t, self.slot_minutes),
+                        price_cents=int(round(price * 100)),
+                    ))
+                    t += self.slot_minutes
+            templates.append(tuple(slots))
+        object.__setattr__(self, "templates", tuple(templates))
+        object.__setattr__(self, "_by_start", tuple({s.start: s for s in t} for t in templates))
+
+    def slots_for(self, d: date) -> Tuple[Slot, ...]:
+        return self.templates[d.weekday()]
+
+    def slot_at(self, d: date, start: str) -> Optional[Slot]:
+        return self._by_start[d.weekday()].get(start[:5])
+
+    def has_court(self, court: int) -> bool:
+        return court in self.courts
+
+    def price_cents(self, d: date, start: str) -> int:
+        slot = self.slot_at(d, start)
+        if slot:
+            return slot.price_cents
+        # turno fuera de la grilla actual (p.ej. reservas antiguas): tarifa por hora
+        per_hour = self.pricing.per_hour(d.weekday(), hhmm_to_minutes(start))
+        return int(round(per_hour * self.slot_minutes / 60 * 100))
+
+    def range_price_cents(self, d: date, start: str, end: str) -> Optional[int]:
+        """Precio de [start, end) sumando los turnos de la grilla; None si el rango no calza con ella."""
+        lo, hi = hhmm_to_minutes(start), hhmm_to_minutes(end)
+        slots = [s for s in self.slots_for(d) if lo <= hhmm_to_minutes(s.start) and hhmm_to_minutes(s.end) <= hi]
+        if hi <= lo or len(slots) * self.slot_minutes != hi - lo:
+            return None
+        return sum(s.price_cents for s in slots)
+
+    def public(self) -> dict:
+        return {
+            "id":            self.id,
+            "name":          self.name,
+            "address":       self.address,
+            "courts":        list(self.courts),
+            "slot_minutes":  self.slot_minutes,
+            "timezone":      self.timezone,
+            "opening_hours": {
+                WEEKDAYS[wd]: ([minutes_to_hhmm(h[0]), minutes_to_hhmm(h[1])] if h else None)
+                for wd, h in enumerate(self.opening)
+            },
+            "pricing": {
+                "off_peak":   self.pricing.off_peak,
+                "peak":       self.pricing.peak,
+                "peak_hours": [minutes_to_hhmm(self.pricing.peak_start), minutes_to_hhmm(self.pricing.peak_end)],
+                "peak_days":  [WEEKDAYS[wd] for wd in sorted(self.pricing.peak_days)],
+            },
+        }
+
+
+def _parse_range(value) -> Optional[Tuple[int, int]]:
+    if not value:
+        return None
+    start, end = (hhmm_to_minutes(v) for v in value)
+    if end <= start:
+        raise ValueError(f"Horario inválido: {value}")
+    if start % MASK_UNIT_MINUTES or end % MASK_UNIT_MINUTES:
+        # la ocupación es una máscara de bits por bloque: un horario a mitad de bloque no se puede representar
+        raise ValueError(f"Horario {value} no calza con bloques de {MASK_UNIT_MINUTES} minutos")
+    return start, end
+
+
+def parse_venue(raw: dict, default_price: float) -> VenueConfig:
+    slot_minutes = int(raw.get("slot_minutes", 60))
+    if slot_minutes <= 0 or slot_minutes % MASK_UNIT_MINUTES:
+        raise ValueError(f"slot_minutes debe ser múltiplo de {MASK_UNIT_MINUTES}")
+
+    courts = []
+    for c in raw.get("courts") or [1, 2, 3]:
+        courts.append(int(c["number"] if isinstance(c, dict) else c))
+
+    hours = raw.get("opening_hours") or {}
+    default_hours = hours.get("default", ["06:00", "22:00"])
+    opening = tuple(_parse_range(hours.get(wd, default_hours)) for wd in WEEKDAYS)
+
+    tz = raw.get("timezone") or DEFAULT_TIMEZONE
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Zona horaria desconocida: {tz}")
+
+    p = raw.get("pricing") or {}
+    off_peak = float(p.get("off_peak", default_price))
+    peak_hours = p.get("peak_hours") or ["00:00", "00:00"]
+    pricing = Pricing(
+        off_peak=off_peak,
+        peak=float(p.get("peak", off_peak)),
+        peak_start=hhmm_to_minutes(peak_hours[0]),
+        peak_end=hhmm_to_minutes(peak_hours[1]),
+        peak_days=frozenset(WEEKDAYS.index(d) for d in p.get("peak_days", WEEKDAYS)),
+    )
+    return VenueConfig(
+        id=str(raw.get("id", "default")),
+        name=raw.get("name", "Tennis Court"),
+        address=raw.get("address", ""),
+        courts=tuple(sorted(courts)),
+        slot_minutes=slot_minutes,
+        opening=opening,
+        pricing=pricing,
+        timezone=tz,
+    )
+
+
+def parse_venues(raw: dict, default_price: float, default_address: str = "") -> List[VenueConfig]:
+    items = raw.get("venues") if "venues" in raw else [raw]
+    venues = []
+    for item in items:
+        item = dict(item)
+        item.setdefault("address", default_address)
+        venues.append(parse_venue(item, default_price))
+    if not venues:
+        raise ValueError("La config no define ningún local")
+    ids = [v.id for v in venues]
+    if len(set(ids)) != len(ids):
+        raise ValueError("IDs de local repetidos")
+    return venues
+
+
+class VenueRegistry:
+    """Config de todos los locales en memoria con recarga en caliente por mtime del archivo."""
+
+    def __init__(self, path: Optional[str], default_price: float, default_address: str = "",
+                 check_every: float = 5.0):
+        self.path = path
+        self.default_price = default_price
+        self.default_address = default_address
+        self.check_every = check_every
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._venues: Dict[str, VenueConfig] = {}
+        self.default_id = "default"
+        self.reload()
+
+    def _read(self) -> dict:
+        if self.path and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as fh:
+                return json.load(fh)
+        return {}
+
+    def reload(self) -> VenueConfig:
+        with self._lock:
+            venues = parse_venues(self._read(), self.default_price, self.default_address)
+            self._venues = {v.id: v for v in venues}
+            self.default_id = venues[0].id
+            self._mtime = os.path.getmtime(self.path) if self.path and os.path.exists(self.path) else None
+            self._checked_at = _time.monotonic()
+            return venues[0]
+
+    def _maybe_reload(self):
+        now = _time.monotonic()
+        if self.path and now - self._checked_at >= self.check_every:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                try:
+                    self.reload()
+                except (ValueError, KeyError, json.JSONDecodeError):
+                    # archivo a medio escribir o inválido: seguimos con la config anterior
+                    self._mtime = mtime
+
+    def get(self, venue_id: Optional[str] = None) -> Optional[VenueConfig]:
+        self._maybe_reload()
+        return self._venues.get(venue_id or self.default_id)
+
+    def all(self) -> List[VenueConfig]:
+        self._maybe_reload()
+        return list(self._venues.values())
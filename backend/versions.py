@@ -0,0 +1,51 @@
+"""
+Contadores de versión en memoria para ETags (por local y clave: "date:2030-01-02",
+"email:cliente@x.com").
+
+El valor de verdad está en Mongo (colección versions, un $inc por escritura de
+reservas). Acá se guarda la última versión vista para contestar If-None-Match
+sin consultar la base:
+- las escrituras del propio worker borran la entrada (la próxima lectura la recarga)
+- un poller trae cada pocos segundos lo que cambiaron los otros workers
+
+Entre dos polls otro worker puede haber escrito: un 304 puede llegar con hasta
+VERSION_POLL_SECONDS de atraso. Nunca al revés: la versión guardada solo sube.
+"""
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class VersionCache:
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._versions: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, venue_id: str, key: str) -> Optional[int]:
+        version = self._versions.get((venue_id, key))
+        if version is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return version
+
+    def put(self, venue_id: str, key: str, version: int):
+        k = (venue_id, key)
+        if version < self._versions.get(k, -1):
+            return
+        self._versions[k] = version
+        self._versions.move_to_end(k)
+        while len(self._versions) > self.max_entries:
+            self._versions.popitem(last=False)
+
+    def update(self, venue_id: str, key: str, version: int):
+        """Versión que trajo el poller: solo interesa si la clave ya está en memoria."""
+        if (venue_id, key) in self._versions:
+            self.put(venue_id, key, version)
+
+    def forget(self, venue_id: str, key: str):
+        self._versions.pop((venue_id, key), None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._versions), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,63 @@
+"""
+Benchmark: arranque en frío de un worker (import de server.py).
+
+Lanza N procesos nuevos que solo hacen `import server` y mide, desde dentro de
+cada proceso, el tiempo de import y el RSS máximo al terminar. Con
+--with-weasyprint además importa WeasyPrint antes, para ver cuánto costaría
+volver al import eager.
+
+Uso:
+    python benchmarks/import_time.py --runs 10
+    python benchmarks/import_time.py --runs 10 --with-weasyprint
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+CHILD = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+if {weasy}:
+    try:
+        import weasyprint  # noqa: F401
+    except Exception:
+        pass
+import server  # noqa: F401
+elapsed = time.perf_counter() - t0
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"import_ms": elapsed * 1000, "rss_mb": rss_kb / 1024,
+                   "weasyprint_loaded": "weasyprint" in sys.modules}}))
+"""
+
+
+def _run_once(with_weasy: bool) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(weasy=with_weasy)],
+        cwd=BACKEND, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--with-weasyprint", action="store_true")
+    args = ap.parse_args()
+
+    _run_once(args.with_weasyprint)   # calienta la caché de bytecode
+    results = [_run_once(args.with_weasyprint) for _ in range(args.runs)]
+    times = [r["import_ms"] for r in results]
+    rss = [r["rss_mb"] for r in results]
+    print(f"runs={args.runs} with_weasyprint={args.with_weasyprint} "
+          f"weasyprint_loaded={results[-1]['weasyprint_loaded']}")
+    print(f"import  p50={statistics.median(times):.1f}ms  min={min(times):.1f}ms  max={max(times):.1f}ms")
+    print(f"max RSS p50={statistics.median(rss):.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: tormenta de logins — throughput y lag del event loop.
+
+Compara verificar la contraseña inline en el handler async contra hacerlo
+en PasswordService (pool de hilos acotado). Un ticker cada 10 ms mide cuánto
+se atrasa el loop: inline el lag crece con el costo del hash; con el pool
+debería quedarse en el orden de milisegundos.
+
+Uso:
+    python benchmarks/login_storm.py --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from passwords import PasswordService  # noqa: E402
+from metrics_util import percentile  # noqa: E402
+
+TICK = 0.010
+
+
+async def _ticker(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, loop.time() - t0 - TICK) * 1000)
+
+
+async def _storm(verify, n, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await verify()
+
+    lags, stop = [], asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(n)])
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await ticker
+    return n / elapsed, percentile(lags, 99), max(lags or [0.0])
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logins", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = ap.parse_args()
+
+    svc = PasswordService(max_workers=args.workers, max_pending=args.concurrency)
+    stored = await svc.hash("correct horse battery")
+    print(f"esquema: {svc.scheme}  workers: {args.workers}")
+
+    async def inline():
+        svc.context.verify("correct horse battery", stored)
+
+    async def pooled():
+        await svc.verify("correct horse battery", stored)
+
+    print(f"{'modo':>8} {'logins/s':>10} {'lag p99 ms':>11} {'lag max ms':>11}")
+    for name, fn in (("inline", inline), ("pool", pooled)):
+        rate, p99, worst = await _storm(fn, args.logins, args.concurrency)
+        print(f"{name:>8} {rate:>10.1f} {p99:>11.1f} {worst:>11.1f}")
+    svc.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
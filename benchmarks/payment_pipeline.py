@@ -0,0 +1,129 @@
+"""
+Benchmark: throughput de POST /api/payments/charge frente a la latencia del proveedor.
+
+Levanta el simulador (payment_simulator.py) y el API en modo gateway como
+procesos aparte y dispara N cobros con C clientes concurrentes, para cada
+latencia del proveedor. El cobro responde `pending` sin esperar al proveedor:
+el throughput del API debería quedar igual con 0 s o con 3 s de latencia; lo
+que crece es solo el tiempo hasta que el webhook lo liquida.
+
+Uso:
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/payment_pipeline.py \\
+        --latencies 0 1 3 --charges 300 --concurrency 30
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..", "backend")
+CHARGE_DATE = (date.today() + timedelta(days=7)).isoformat()
+sys.path.insert(0, BACKEND)
+
+from metrics_util import percentile  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_http(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió")
+
+
+def _start(latency: float, failure_rate: float, db_name: str):
+    sim_port, api_port = _free_port(), _free_port()
+    sim = subprocess.Popen(
+        [sys.executable, "payment_simulator.py", "--port", str(sim_port), "--latency", str(latency),
+         "--jitter", str(latency / 4), "--failure-rate", str(failure_rate),
+         "--duplicate-rate", "0.2", "--reorder-rate", "0.2"],
+        cwd=BACKEND, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    env = dict(os.environ, PAYMENT_MODE="gateway", DB_NAME=db_name, RATE_LIMIT_ENABLED="0",
+               JWT_ALLOW_DEV_KEY="1", PAYMENT_GATEWAY_URL=f"http://127.0.0.1:{sim_port}",
+               PAYMENT_WEBHOOK_URL=f"http://127.0.0.1:{api_port}/api/payments/webhook")
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(api_port), "--log-level", "warning"],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{api_port}"
+    _wait_http(f"http://127.0.0.1:{sim_port}/stats")
+    _wait_http(f"{base}/health")
+    return base, [sim, api]
+
+
+def _charge(session: requests.Session, base: str, i: int):
+    t0 = time.perf_counter()
+    # sin amount_soles: el API lo calcula con la tarifa del turno
+    r = session.post(f"{base}/api/payments/charge", json={
+        "email": f"bench{i}@example.com", "method": "card",
+        "metadata": {"date": CHARGE_DATE, "start": "08:00", "end": "09:00", "court": 1},
+    }, timeout=30)
+    r.raise_for_status()
+    return (time.perf_counter() - t0) * 1000, r.json()["charge"]["id"]
+
+
+def _wait_settled(base: str, ids, timeout: float):
+    # solo para el informe: cuánto tarda el último webhook en liquidar
+    session = requests.Session()
+    pending, t0 = set(ids), time.perf_counter()
+    while pending and time.perf_counter() - t0 < timeout:
+        for cid in list(pending):
+            status = session.get(f"{base}/api/payments/charge/{cid}", timeout=5).json()["charge"]["status"]
+            if status != "pending":
+                pending.discard(cid)
+        time.sleep(0.2)
+    return time.perf_counter() - t0, len(pending)
+
+
+def run(latency: float, n: int, concurrency: int, failure_rate: float):
+    db_name = f"bench_payments_{int(latency * 1000)}"
+    base, procs = _start(latency, failure_rate, db_name)
+    try:
+        sessions = [requests.Session() for _ in range(concurrency)]
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda i: _charge(sessions[i % concurrency], base, i), range(n)))
+        elapsed = time.perf_counter() - t0
+        lat = [ms for ms, _ in results]
+        settle_s, unsettled = _wait_settled(base, [cid for _, cid in results], timeout=latency * 4 + 30)
+        print(f"latencia proveedor {latency:4.1f}s  {n / elapsed:7.1f} cobros/s  "
+              f"p50={percentile(lat, 50):6.1f} ms  p99={percentile(lat, 99):6.1f} ms  "
+              f"todo liquidado en {settle_s:5.1f}s  sin liquidar={unsettled}")
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait(timeout=10)
+        from pymongo import MongoClient
+        with MongoClient(os.getenv("MONGO_URL", "mongodb://localhost:27017")) as c:
+            c.drop_database(db_name)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latencies", type=float, nargs="+", default=[0.0, 1.0, 3.0])
+    ap.add_argument("--charges", type=int, default=300)
+    ap.add_argument("--concurrency", type=int, default=30)
+    ap.add_argument("--failure-rate", type=float, default=0.1)
+    args = ap.parse_args()
+    for latency in args.latencies:
+        run(latency, args.charges, args.concurrency, args.failure_rate)
+
+
+if __name__ == "__main__":
+    main()
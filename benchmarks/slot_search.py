@@ -0,0 +1,56 @@
+"""
+Benchmark: búsqueda del próximo turno libre sobre el índice en memoria.
+
+Llena una ventana de N días con ocupación aleatoria y mide find_slots (la
+parte que corre en cada petición una vez cargadas las fechas). Para 14 días
+debería quedar en el orden de los microsegundos/milisegundos.
+
+Uso:
+    python benchmarks/slot_search.py --days 14 --fill 0.8 --runs 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from free_index import FreeIntervalIndex, date_range, find_slots  # noqa: E402
+from metrics_util import percentile  # noqa: E402
+from venues import parse_venue  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=14)
+    ap.add_argument("--courts", type=int, default=6)
+    ap.add_argument("--fill", type=float, default=0.8, help="Fracción de turnos ocupados")
+    ap.add_argument("--runs", type=int, default=2000)
+    args = ap.parse_args()
+
+    venue = parse_venue({"courts": list(range(1, args.courts + 1)), "slot_minutes": 60}, 35)
+    index = FreeIntervalIndex()
+    dates = date_range(date(2030, 1, 1), date(2030, 1, args.days))
+    for d in dates:
+        masks = {}
+        for court in venue.courts:
+            for slot in venue.slots_for(d):
+                if random.random() < args.fill:
+                    masks[court] = masks.get(court, 0) | slot.mask
+        index.load(venue.id, d.isoformat(), masks)
+
+    samples = []
+    found = 0
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        res = find_slots(index, venue, dates, 120, earliest=18 * 60, limit=5)
+        samples.append((time.perf_counter() - t0) * 1000)
+        found += bool(res)
+    print(f"days={args.days} courts={args.courts} fill={args.fill} hits={found}/{args.runs}")
+    print(f"find_slots p50={percentile(samples, 50):.3f}ms p99={percentile(samples, 99):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: latencia p50/p99 de un local frente a la cantidad total de locales.
+
+Siembra N locales con el mismo volumen de reservas y mide, para el local
+"v0", las consultas del camino caliente (resumen del día, conflicto al
+reservar, listado del día) mientras los demás locales reciben carga en
+paralelo. Con índices que empiezan por venue_id el p99 de v0 no debería
+crecer con N.
+
+Uso:
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/venue_isolation.py --venues 1 10 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+import server  # noqa: E402
+from metrics_util import percentile  # noqa: E402
+from venues import hhmm_to_minutes, minutes_to_hhmm  # noqa: E402
+
+DAYS = 60
+COURTS = (1, 2, 3)
+SLOT_MINUTES = 60
+HOURS = [f"{h:02d}:00" for h in range(6, 22)]
+
+
+async def _seed(vdb, venue_id: str, fill: float):
+    start = date.today()
+    docs = []
+    for d in range(DAYS):
+        day = (start + timedelta(days=d)).isoformat()
+        for court in COURTS:
+            for hh in HOURS:
+                if random.random() < fill:
+                    docs.append({
+                        "venue_id": venue_id, "booking_date": day, "start_time": hh,
+                        "end_time": minutes_to_hhmm(hhmm_to_minutes(hh) + SLOT_MINUTES),
+                        "court_number": court, "status": "confirmed",
+                        "email": f"user{random.randint(0, 500)}@{venue_id}.test",
+                    })
+    if docs:
+        await vdb.bookings.insert_many(docs, ordered=False)
+
+
+async def _hot_path(vdb, venue_id: str):
+    day = (date.today() + timedelta(days=random.randrange(DAYS))).isoformat()
+    await vdb.daily_summaries.find_one({"venue_id": venue_id, "date": day})
+    await vdb.bookings.find_one({"venue_id": venue_id, "booking_date": day,
+                                 "start_time": random.choice(HOURS),
+                                 "court_number": random.choice(COURTS), "status": "confirmed"})
+    await vdb.bookings.find({"venue_id": venue_id, "booking_date": day,
+                             "status": {"$ne": "cancelled"}}).to_list(None)
+
+
+async def _noise(vdb, venue_ids, stop: asyncio.Event):
+    while not stop.is_set():
+        await _hot_path(vdb, random.choice(venue_ids))
+
+
+async def run(n_venues: int, samples: int, fill: float, noise_workers: int):
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    vdb = client[f"bench_venues_{n_venues}"]
+    await client.drop_database(vdb.name)
+    await server.ensure_indexes(vdb)
+    venue_ids = [f"v{i}" for i in range(n_venues)]
+    for vid in venue_ids:
+        await _seed(vdb, vid, fill)
+
+    stop = asyncio.Event()
+    others = venue_ids[1:] or venue_ids
+    noise = [asyncio.create_task(_noise(vdb, others, stop)) for _ in range(noise_workers)]
+    lat = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        await _hot_path(vdb, "v0")
+        lat.append((time.perf_counter() - t0) * 1000)
+    stop.set()
+    await asyncio.gather(*noise)
+    await client.drop_database(vdb.name)
+    client.close()
+    return percentile(lat, 50), percentile(lat, 99)
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--venues", type=int, nargs="+", default=[1, 10, 50])
+    ap.add_argument("--samples", type=int, default=500)
+    ap.add_argument("--fill", type=float, default=0.6, help="ocupación sembrada por local (0-1)")
+    ap.add_argument("--noise", type=int, default=8, help="clientes concurrentes sobre otros locales")
+    args = ap.parse_args()
+
+    print(f"{'venues':>7} {'docs':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for n in args.venues:
+        p50, p99 = await run(n, args.samples, args.fill, args.noise)
+        docs = int(n * DAYS * len(COURTS) * len(HOURS) * args.fill)
+        print(f"{n:>7} {docs:>9} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -15,39 +15,10 @@ import './App.css'
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001'
 const ADMIN_EMAIL = 'admin@tenniscourt.com'
 const HOURS = Array.from({length:16},(_,i)=>6+i) // 06:00–21:00
-const PRICE_PER_HOUR = Number(process.env.REACT_APP_PRICE_PER_HOUR || 35)
 const API_BASE = `${BACKEND_URL}/api`
 
 function hourFromHHMM(hhmm){ return parseInt(hhmm.split(':')[0],10) }
 
-function mergeContiguous(bookings){
-  const sorted = [...bookings].sort((a,b)=>{
-    if(a.booking_date!==b.booking_date) return a.booking_date.localeCompare(b.booking_date)
-    if(a.court_number!==b.court_number) return a.court_number-b.court_number
-    return a.start_time.localeCompare(b.start_time)
-  })
-  const out = []
-  for(const b of sorted){
-    const last = out[out.length-1]
-    if(
-      last &&
-      last.booking_date===b.booking_date &&
-      last.court_number===b.court_number &&
-      last.email===b.email &&
-      hourFromHHMM(last.end_time) === hourFromHHMM(b.start_time)
-    ){
-      last.end_time = b.end_time
-      if(b.admin_comment && !last.admin_comment) last.admin_comment = b.admin_comment
-      if(b.voucher_url && !last.voucher_url) last.voucher_url = b.voucher_url
-      if(b.charge_id && !last.charge_id) last.charge_id = b.charge_id
-      if(b.payment_type && !last.payment_type) last.payment_type = b.payment_type
-    }else{
-      out.push({...b})
-    }
-  }
-  return out
-}
-
 // Toast mínimo
 function toastInline(msg){
   let t = document.getElementById("toast-inline")
@@ -247,10 +218,16 @@ function openDemoCheckout({ amountSoles, email, description, metadata={} }){
           })
         })
         const data = await resp.json()
-        if(!data.ok){ setStatus(""); toastInline("Pago rechazado (demo)"); reject(new Error("failed")); return }
+        let charge = data.charge
+        if(data.ok && charge && charge.status === 'pending'){
+          // PAYMENT_MODE=gateway: la confirmación llega por webhook
+          setStatus("Confirmando pago…")
+          charge = await waitForCharge(charge.id)
+        }
+        if(!data.ok || !charge || charge.status !== 'paid'){ setStatus(""); toastInline("Pago rechazado (demo)"); reject(new Error("failed")); return }
         setStatus("Pago aprobado ✅")
         close()
-        resolve(data.charge)  // { id, voucher_url, ... }
+        resolve(charge)  // { id, voucher_url, ... }
       }catch(e){
         console.error(e)
         setStatus("")
@@ -261,6 +238,19 @@ function openDemoCheckout({ amountSoles, email, description, metadata={} }){
   })
 }
 
+// Espera a que el proveedor confirme un cobro pending (consulta cada segundo)
+async function waitForCharge(chargeId, timeoutMs = 60000){
+  const deadline = Date.now() + timeoutMs
+  while(Date.now() < deadline){
+    await new Promise(r => setTimeout(r, 1000))
+    const resp = await fetch(`${API_BASE}/payments/charge/${encodeURIComponent(chargeId)}`)
+    if(!resp.ok) continue
+    const data = await resp.json()
+    if(data.charge && data.charge.status !== 'pending') return data.charge
+  }
+  return null
+}
+
 // Selector flotante para Admin
 function chooseAdminPaymentMode(){
   return new Promise((resolve, reject)=>{
@@ -343,6 +333,7 @@ export default function App() {
 
   const [selectedDate, setSelectedDate] = useState(new Date())
   const [availability, setAvailability] = useState(new Set())
+  const [slotPrices, setSlotPrices] = useState({}) // hora → céntimos (tarifa del local, con hora punta)
   const [court, setCourt] = useState(1)
   const [selStart, setSelStart] = useState(null)
   const [selEnd, setSelEnd] = useState(null)
@@ -355,6 +346,11 @@ export default function App() {
 
   const [adminDayBookings, setAdminDayBookings] = useState([])
 
+  function authHeaders(){
+    const token = isAdmin ? adminToken : user?.access_token
+    return token ? { Authorization: `Bearer ${token}` } : {}
+  }
+
   const warnedRef = useRef(false)
 
   // disponibilidad
@@ -373,6 +369,14 @@ export default function App() {
           .map(s=>+s.time.split(':')[0])
       )
       setAvailability(busy)
+      // precio por hora de la cancha: suma de los turnos que empiezan en esa hora (turnos de 30 min incluidos)
+      const prices = {}
+      for(const s of (data.slots || [])){
+        if(s.court_number !== court) continue
+        const h = +s.time.split(':')[0]
+        prices[h] = (prices[h] || 0) + (s.price_cents || 0)
+      }
+      setSlotPrices(prices)
     }catch{
       setMessage({type:'error', text:'No se cargó disponibilidad'})
     }
@@ -386,15 +390,17 @@ export default function App() {
   }, [activeTab, user, isAdmin, selectedDate, court])
   async function fetchClientBookings(){
     try{
-      const email = (user?.email) || ADMIN_EMAIL
-      const res = await fetch(`${BACKEND_URL}/api/my-bookings/${encodeURIComponent(email)}`)
+      // el backend identifica al cliente por el token (sub) y ya devuelve los bloques contiguos agrupados
+      const res = await fetch(`${BACKEND_URL}/api/my-reservations`, { headers: authHeaders() })
       if(res.ok){
         const raw = await res.json()
         setClientBookings(raw)
+        return raw
       }
     }catch{
       setMessage({type:'error', text:'Error al cargar tus reservas'})
     }
+    return clientBookings
   }
 
   // admin: resumen del día
@@ -502,14 +508,20 @@ export default function App() {
   }
   useEffect(()=>{ setMessage(null) }, [selectedDate, court])
 
+  function selectionSoles(from, to){
+    let cents = 0
+    for(let h=from; h<to; h++){ cents += slotPrices[h] || 0 }
+    return cents / 100
+  }
+
   // cuota: máx 2h por cancha/día
   async function checkClientQuota(hoursSelected){
     if(isAdmin || !user) return true
     const dateStr = selectedDate.toISOString().slice(0,10)
-    await fetchClientBookings()
-    const already = clientBookings.filter(
-      b => b.booking_date === dateStr && b.court_number === court && b.status === 'confirmed'
-    ).length
+    const reservations = await fetchClientBookings()
+    const already = reservations
+      .filter(b => b.booking_date === dateStr && b.court_number === court && b.status === 'confirmed')
+      .reduce((sum, b) => sum + b.hours, 0)
     if (already + hoursSelected > 2){
       setMessage({type:'error', text:'Límite de 2 horas por cancha y día (usuario).'})
       return false
@@ -592,7 +604,7 @@ export default function App() {
       // Si público o admin con "pago con tarjeta" => flujo de pago
       let charge = null
       if(!isAdmin || adminMode === 'card'){
-        const amountSoles = PRICE_PER_HOUR * hours.length
+        const amountSoles = selectionSoles(selStart, selEnd)   // el backend lo recalcula y rechaza diferencias
         const description = `Reserva Cancha ${court} | ${selStart}:00–${selEnd}:00 (${hours.length}h)`
         const metadata = {
           reservation_id: `tmp_${Date.now()}`,
@@ -643,7 +655,7 @@ export default function App() {
         }
         const res = await fetch(`${BACKEND_URL}/api/bookings`, {
           method:'POST',
-          headers:{'Content-Type':'application/json'},
+          headers:{'Content-Type':'application/json', ...authHeaders()},
           body: JSON.stringify(payload)
         })
         if(!res.ok){
@@ -695,10 +707,6 @@ export default function App() {
     if(activeTab==='booking') clearSelectionAndToast()
   }, [activeTab])
 
-  const mergedMyBookings = mergeContiguous(
-    clientBookings.filter(b => (user?.email || ADMIN_EMAIL) === b.email)
-  )
-
   // Admin: etiquetas de ocupación (ahora incluye tipo de pago si es admin)
   const adminByHourByCourt = (() => {
     const map = new Map()
@@ -848,7 +856,7 @@ export default function App() {
                 <CardDescription>Se agrupan bloques contiguos en uno solo</CardDescription>
               </CardHeader>
               <CardContent>
-                {mergedMyBookings.length===0
+                {clientBookings.length===0
                   ? <p>No tienes reservas.</p>
                   : <Table>
                       <TableHeader>
@@ -862,7 +870,7 @@ export default function App() {
                         </TableRow>
                       </TableHeader>
                       <TableBody>
-                        {mergedMyBookings.map(b=>{
+                        {clientBookings.map(b=>{
                           // URL del voucher con fallback (siempre)
                           const base = b.voucher_url
                             ? (b.voucher_url.startsWith('http') ? b.voucher_url : `${BACKEND_URL}${b.voucher_url}`)
@@ -964,7 +972,7 @@ export default function App() {
             <p><strong>Fecha:</strong> {selectedDate.toLocaleDateString()}</p>
             <p><strong>Cancha:</strong> {court}</p>
             <p><strong>Hora:</strong> {selStart}:00–{selEnd}:00 ({selEnd-selStart}h)</p>
-            <p><strong>Total (demo):</strong> S/ {(PRICE_PER_HOUR * ((selEnd||0)-(selStart||0))).toFixed(2)}</p>
+            <p><strong>Total (demo):</strong> S/ {selectionSoles(selStart||0, selEnd||0).toFixed(2)}</p>
 
             {isAdmin && (
               <>
@@ -0,0 +1,103 @@
+"""
+Fixtures compartidas.
+
+replica_set: replica set local de 3 nodos (1 primario + 2 secundarios) levantado
+con los binarios `mongod` del PATH en puertos libres. Si ya hay uno corriendo se
+puede usar con MONGO_RS_URL=mongodb://host:port,.../?replicaSet=rs. Sin ninguno de
+los dos, los tests que lo piden se saltan.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+os.environ.setdefault("JWT_ALLOW_DEV_KEY", "1")   # los tests no necesitan secretos reales
+
+RS_NAME = "rs_test"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"mongod no levantó en el puerto {port}")
+
+
+def _start_replica_set(root: str):
+    from pymongo import MongoClient
+
+    ports = [_free_port() for _ in range(3)]
+    procs = []
+    for i, port in enumerate(ports):
+        dbpath = os.path.join(root, f"n{i}")
+        os.makedirs(dbpath)
+        procs.append(subprocess.Popen(
+            ["mongod", "--replSet", RS_NAME, "--port", str(port), "--bind_ip", "127.0.0.1",
+             "--dbpath", dbpath, "--oplogSize", "50"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+    for port in ports:
+        _wait_port(port)
+
+    seed = MongoClient("127.0.0.1", ports[0], directConnection=True)
+    seed.admin.command("replSetInitiate", {
+        "_id": RS_NAME,
+        "members": [{"_id": i, "host": f"127.0.0.1:{p}", "priority": 2 if i == 0 else 1}
+                    for i, p in enumerate(ports)],
+    })
+    seed.close()
+
+    url = f"mongodb://{','.join(f'127.0.0.1:{p}' for p in ports)}/?replicaSet={RS_NAME}"
+    client = MongoClient(url, serverSelectionTimeoutMS=30000)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        status = client.admin.command("replSetGetStatus")
+        states = sorted(m["stateStr"] for m in status["members"])
+        if states == ["PRIMARY", "SECONDARY", "SECONDARY"]:
+            break
+        time.sleep(0.5)
+    else:
+        raise RuntimeError("el replica set no quedó listo")
+    client.close()
+    return url, procs
+
+
+@pytest.fixture(scope="session")
+def replica_set():
+    pytest.importorskip("pymongo")
+    url = os.getenv("MONGO_RS_URL")
+    if url:
+        yield url
+        return
+    if shutil.which("mongod") is None:
+        pytest.skip("sin mongod en el PATH ni MONGO_RS_URL")
+    root = tempfile.mkdtemp(prefix="rs_test_")
+    procs = []
+    try:
+        url, procs = _start_replica_set(root)
+        yield url
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        shutil.rmtree(root, ignore_errors=True)
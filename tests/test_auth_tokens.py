@@ -0,0 +1,107 @@
+"""
+TokenService sin Mongo: rotación del refresh token, expiración y rotación de
+claves (JWT_SECRETS con varias claves). MongoRevocations se prueba con una
+colección falsa que imita el índice único por jti.
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("jwt")
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+from auth_tokens import MongoRevocations, TokenError, TokenService, parse_keys  # noqa: E402
+
+
+class _FakeRevocations:
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_one(self, doc):
+        if doc["jti"] in self.docs:
+            raise DuplicateKeyError("E11000 duplicate key")
+        self.docs[doc["jti"]] = doc
+
+
+NEW, OLD, OTHER = "n" * 32, "v" * 32, "x" * 32   # HS256: claves de 32 bytes o más
+
+
+def _service(spec=f"k2:{NEW},k1:{OLD}", **kw):
+    return TokenService(parse_keys(spec, "seed"), **kw)
+
+
+def test_parse_keys_signs_with_the_first():
+    keys = parse_keys(f"k2:{NEW}, k1:{OLD}", "seed")
+    assert list(keys) == ["k2", "k1"] and keys["k1"] == OLD.encode()
+    assert list(parse_keys("solo", "seed")) == ["k1"]
+    assert list(parse_keys(None, "seed")) == ["k0"]
+
+
+def test_issue_and_verify():
+    tokens = _service()
+    session = tokens.issue("ana@example.com", "user", "default")
+    claims = tokens.verify(session["access_token"])
+    assert (claims["sub"], claims["role"], claims["venue"]) == ("ana@example.com", "user", "default")
+    with pytest.raises(TokenError):
+        tokens.verify(session["access_token"], typ="refresh")
+    with pytest.raises(TokenError):
+        tokens.verify(session["refresh_token"])
+
+
+def test_refresh_rotates_once():
+    tokens = _service()
+    first = tokens.issue("ana@example.com", "user", "default")
+    second = tokens.refresh(first["refresh_token"])
+    assert tokens.verify(second["access_token"])["sub"] == "ana@example.com"
+    with pytest.raises(TokenError, match="revocado"):
+        tokens.refresh(first["refresh_token"])
+
+
+def test_expired_token_is_rejected():
+    tokens = _service(access_ttl=-1)
+    with pytest.raises(TokenError):
+        tokens.verify(tokens.issue("ana@example.com", "user", "default")["access_token"])
+
+
+def test_key_rollover():
+    old = _service(f"k1:{OLD}")
+    token = old.issue("ana@example.com", "user", "default")["access_token"]
+    rolled = _service(f"k2:{NEW},k1:{OLD}")
+    assert rolled.verify(token)["sub"] == "ana@example.com"
+    fresh = rolled.issue("ana@example.com", "user", "default")["access_token"]
+    with pytest.raises(TokenError, match="desconocida"):
+        old.verify(fresh)
+    with pytest.raises(TokenError, match="desconocida"):
+        _service(f"k2:{NEW}").verify(token)   # k1 ya retirada
+
+
+def test_forged_signature_is_rejected():
+    token = _service(f"k1:{OTHER}").issue("admin@example.com", "admin", "default")["access_token"]
+    with pytest.raises(TokenError):
+        _service(f"k1:{OLD}").verify(token)
+
+
+def test_revoke_is_scoped_to_the_token():
+    tokens = _service()
+    a = tokens.issue("ana@example.com", "user", "default")
+    b = tokens.issue("ana@example.com", "user", "default")
+    tokens.revoke(tokens.verify(a["access_token"]))
+    with pytest.raises(TokenError):
+        tokens.verify(a["access_token"])
+    assert tokens.verify(b["access_token"])
+
+
+def test_mongo_claim_is_single_use():
+    tokens = _service()
+    revocations = MongoRevocations(_FakeRevocations())
+    claims = tokens.verify(tokens.issue("ana@example.com", "user", "default")["refresh_token"], typ="refresh")
+
+    async def claim_twice():
+        return await revocations.claim(claims), await revocations.claim(claims)
+
+    assert asyncio.run(claim_twice()) == (True, False)
+    doc = revocations.collection.docs[claims["jti"]]
+    assert doc["typ"] == "refresh" and doc["expires_at"].timestamp() == pytest.approx(claims["exp"])
+    assert doc["expires_at"].timestamp() > time.time()
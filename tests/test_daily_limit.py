@@ -0,0 +1,109 @@
+"""
+Límite diario de horas por cancha bajo concurrencia: muchas reservas en paralelo
+del mismo cliente, misma cancha y día, nunca pasan de DAILY_HOURS_LIMIT y el
+contador queda igual a lo que hay en bookings.
+"""
+import asyncio
+import uuid
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+httpx = pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from pymongo import MongoClient  # noqa: E402
+
+DATES = ["2031-03-04", "2031-03-05", "2031-03-06"]   # martes a jueves: 06:00–22:00
+STARTS = [f"{h:02d}:00" for h in range(6, 22)]
+
+
+@pytest.fixture
+def app(replica_set):
+    import server
+
+    server.MONGO_URL = replica_set
+    server.DB_NAME = f"test_limit_{uuid.uuid4().hex[:8]}"
+    server.RATE_LIMIT_ENABLED = False
+    with TestClient(server.app) as c:
+        yield server, c
+    with MongoClient(replica_set) as cleanup:
+        cleanup.drop_database(server.DB_NAME)
+
+
+def _booking(email, booking_date, start, court=1):
+    return {"customer_name": "Test", "email": email, "phone": "999999999",
+            "booking_date": booking_date, "start_time": start, "court_number": court}
+
+
+def _fire(server, c, payloads):
+    # todas en el mismo event loop que el API: se intercalan en cada await contra Mongo
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await asyncio.gather(*(ac.post("/api/bookings", json=p) for p in payloads))
+
+    return c.portal.call(run)
+
+
+def _stored(server, replica_set, email, booking_date, court=1):
+    with MongoClient(replica_set) as mc:
+        db = mc[server.DB_NAME]
+        n = db.bookings.count_documents({"email": email, "booking_date": booking_date,
+                                         "court_number": court, "status": "confirmed"})
+        counter = db.daily_limits.find_one({"email": email, "date": booking_date, "court": court})
+    return n, (counter or {}).get("hours", 0)
+
+
+def test_parallel_bookings_never_exceed_daily_limit(app, replica_set):
+    server, c = app
+    limit = int(server.DAILY_HOURS_LIMIT)
+    for round_ in range(3):
+        email = f"stress{round_}@example.com"
+        for booking_date in DATES:
+            responses = _fire(server, c, [_booking(email, booking_date, s) for s in STARTS])
+            codes = sorted(r.status_code for r in responses)
+
+            assert codes.count(201) == limit, codes
+            assert set(codes[limit:]) == {400}
+            assert _stored(server, replica_set, email, booking_date) == (limit, limit)
+
+
+def test_limit_is_per_court(app, replica_set):
+    server, c = app
+    email = "courts@example.com"
+    payloads = [_booking(email, DATES[0], s, court) for court in (1, 2) for s in STARTS[:6]]
+    codes = [r.status_code for r in _fire(server, c, payloads)]
+
+    assert codes.count(201) == 2 * int(server.DAILY_HOURS_LIMIT)
+    for court in (1, 2):
+        assert _stored(server, replica_set, email, DATES[0], court)[0] == int(server.DAILY_HOURS_LIMIT)
+
+
+def test_cancel_frees_hours(app, replica_set):
+    server, c = app
+    email = "cancel@example.com"
+    limit = int(server.DAILY_HOURS_LIMIT)
+    created = [r.json()["id"] for r in _fire(server, c, [_booking(email, DATES[1], s) for s in STARTS])
+               if r.status_code == 201]
+    token = c.post("/api/admin/login", json={"email": server.ADMIN_EMAIL,
+                                             "password": server.ADMIN_PASSWORD}).json()["access_token"]
+
+    r = c.post(f"/api/bookings/{created[0]}/cancel", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
+    assert _stored(server, replica_set, email, DATES[1]) == (limit - 1, limit - 1)
+
+    codes = sorted(r.status_code for r in _fire(server, c, [_booking(email, DATES[1], s) for s in STARTS[-4:]]))
+    assert codes == [201, 400, 400, 400]
+    assert _stored(server, replica_set, email, DATES[1]) == (limit, limit)
+
+
+def test_booking_longer_than_limit_is_rejected_without_counter(app, replica_set, monkeypatch):
+    server, c = app
+    monkeypatch.setattr(server, "DAILY_HOURS_LIMIT", 0.0)
+    email = "zero@example.com"
+    r = c.post("/api/bookings", json=_booking(email, DATES[2], STARTS[0]))
+
+    assert r.status_code == 400
+    assert _stored(server, replica_set, email, DATES[2]) == (0, 0)
@@ -0,0 +1,97 @@
+"""
+Bitácora de eventos sin Mongo: fold_events reconstruye el estado de cada
+reserva, y EventLog agrupa los inserts, reintenta un lote fallido y vacía lo
+pendiente al apagar (con un writer falso en memoria).
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("bson")
+
+from event_log import EventLog, fold_events  # noqa: E402
+
+
+def _ev(type_, booking_id, **data):
+    return {"type": type_, "booking_id": booking_id, "data": data}
+
+
+def test_fold_applies_events_in_order():
+    state = fold_events([
+        _ev("booking_created", "b1", booking={"status": "confirmed", "court_number": 1}),
+        _ev("booking_created", "b2", booking={"status": "confirmed", "court_number": 2}),
+        _ev("booking_updated", "b1", fields={"payment_status": "paid"}),
+        _ev("booking_cancelled", "b2", reason="payment_failed", fields={"payment_status": "failed"}),
+        _ev("charge_paid", None, charge_id="ch_1"),
+    ])
+    assert state == {
+        "b1": {"status": "confirmed", "court_number": 1, "payment_status": "paid"},
+        "b2": {"status": "cancelled", "court_number": 2, "payment_status": "failed"},
+    }
+
+
+def test_fold_ignores_bookings_older_than_the_log():
+    state = fold_events([_ev("booking_cancelled", "old"), _ev("booking_updated", "old", fields={"x": 1})])
+    assert state == {}
+
+
+def test_fold_does_not_alias_the_snapshot():
+    snapshot = {"status": "confirmed"}
+    fold_events([_ev("booking_created", "b1", booking=snapshot), _ev("booking_cancelled", "b1")])
+    assert snapshot == {"status": "confirmed"}
+
+
+class _Writer:
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    async def __call__(self, batch):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("mongo caído")
+        self.batches.append(list(batch))
+
+
+def test_flush_groups_in_batches():
+    writer = _Writer()
+    log = EventLog(writer, max_batch=2)
+    for i in range(5):
+        log.emit("v", "booking_created", f"b{i}")
+    asyncio.run(log.flush())
+    assert [len(b) for b in writer.batches] == [2, 2, 1]
+    assert [e["booking_id"] for b in writer.batches for e in b] == [f"b{i}" for i in range(5)]
+    assert log.stats()["written"] == 5 and log.stats()["pending"] == 0
+
+
+def test_failed_batch_is_retried_in_order():
+    writer = _Writer(fail_times=1)
+    log = EventLog(writer, max_batch=10)
+    log.emit("v", "booking_created", "b1")
+    log.emit("v", "booking_cancelled", "b1")
+    asyncio.run(log.flush())
+    assert writer.batches == [] and log.stats()["failures"] == 1 and log.stats()["pending"] == 2
+    asyncio.run(log.flush())
+    assert [e["type"] for e in writer.batches[0]] == ["booking_created", "booking_cancelled"]
+
+
+def test_buffer_is_bounded():
+    log = EventLog(_Writer(), max_buffer=3)
+    for i in range(5):
+        log.emit("v", "booking_created", f"b{i}")
+    assert log.stats()["pending"] == 3 and log.stats()["dropped"] == 2
+
+
+def test_stop_flushes_pending_events():
+    writer = _Writer()
+
+    async def run():
+        log = EventLog(writer, flush_interval=60)
+        log.start()
+        log.emit("v", "booking_created", "b1")
+        await log.stop()
+        return log
+
+    log = asyncio.run(run())
+    assert [e["booking_id"] for b in writer.batches for e in b] == ["b1"]
+    assert log.stats()["pending"] == 0
@@ -0,0 +1,79 @@
+"""
+Búsqueda de huecos libres sobre el índice en memoria: sin Mongo, solo bits
+sobre las plantillas del local.
+"""
+from datetime import date
+
+from free_index import FreeIntervalIndex, date_range, find_slots
+from venues import hhmm_to_minutes, occupancy_mask, parse_venue
+
+DAY = date(2031, 3, 4)   # martes
+
+
+def _venue(**raw):
+    raw.setdefault("courts", [1, 2])
+    raw.setdefault("opening_hours", {"default": ["08:00", "12:00"]})
+    return parse_venue(raw, 35)
+
+
+def _busy(start: str, minutes: int = 60) -> int:
+    return occupancy_mask(hhmm_to_minutes(start), minutes)
+
+
+def _starts(results):
+    return [(r["date"], r["court_number"], r["start_time"]) for r in results]
+
+
+def test_orders_by_date_time_and_court():
+    venue, index = _venue(), FreeIntervalIndex()
+    index.load(venue.id, DAY.isoformat(), {1: _busy("08:00")})
+    found = find_slots(index, venue, [DAY], 60, limit=4)
+    assert _starts(found) == [("2031-03-04", 2, "08:00"), ("2031-03-04", 1, "09:00"),
+                              ("2031-03-04", 2, "09:00"), ("2031-03-04", 1, "10:00")]
+
+
+def test_duration_needs_every_slot_free():
+    venue, index = _venue(courts=[1]), FreeIntervalIndex()
+    index.load(venue.id, DAY.isoformat(), {1: _busy("09:00")})
+    found = find_slots(index, venue, [DAY], 120)
+    assert [(r["start_time"], r["end_time"]) for r in found] == [("10:00", "12:00")]
+    assert found[0]["price_cents"] == 7000
+
+
+def test_earliest_latest_and_not_before():
+    venue, index = _venue(courts=[1]), FreeIntervalIndex()
+    found = find_slots(index, venue, [DAY], 60, earliest=hhmm_to_minutes("09:00"),
+                       latest=hhmm_to_minutes("11:00"))
+    assert [r["start_time"] for r in found] == ["09:00", "10:00"]
+    found = find_slots(index, venue, [DAY], 60, not_before=(DAY, hhmm_to_minutes("10:30")))
+    assert [r["start_time"] for r in found] == ["11:00"]
+
+
+def test_nothing_when_the_day_has_no_room():
+    venue = _venue(courts=[1], opening_hours={"default": ["08:00", "10:00"]})
+    index = FreeIntervalIndex()
+    index.load(venue.id, DAY.isoformat(), {1: _busy("08:00")})
+    assert find_slots(index, venue, [DAY], 120) == []
+
+
+def test_apply_and_invalidate():
+    venue, index = _venue(courts=[1]), FreeIntervalIndex()
+    key = DAY.isoformat()
+    index.apply(venue.id, key, 1, _busy("08:00"), added=True)   # fecha no cargada: se ignora
+    assert index.missing(venue.id, [key]) == [key]
+    index.load(venue.id, key, {})
+    index.apply(venue.id, key, 1, _busy("08:00"), added=True)
+    assert find_slots(index, venue, [DAY], 60, limit=1)[0]["start_time"] == "09:00"
+    index.apply(venue.id, key, 1, _busy("08:00"), added=False)
+    assert find_slots(index, venue, [DAY], 60, limit=1)[0]["start_time"] == "08:00"
+    index.invalidate(venue.id, key)
+    assert index.missing(venue.id, [key]) == [key]
+
+
+def test_evicts_least_recently_loaded_dates():
+    index = FreeIntervalIndex(max_dates=2)
+    days = [d.isoformat() for d in date_range(DAY, date(2031, 3, 6))]
+    for d in days:
+        index.load("v", d, {})
+    assert index.missing("v", days) == [days[0]]
+    assert index.stats()["dates"] == 2
@@ -0,0 +1,136 @@
+"""
+Importador sin Mongo: lectura CSV/NDJSON, validación de filas con los modelos
+del API, conflictos de turno en memoria, clasificación de errores de escritura
+y recorte de rechazos al reanudar.
+"""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+
+from pymongo.errors import BulkWriteError  # noqa: E402
+
+import importer  # noqa: E402
+import server  # noqa: E402
+
+DAY = "2031-03-04"   # martes: 06:00–22:00
+
+
+def _booking(**kw):
+    row = {"customer_name": "Ana", "email": "ana@example.com", "phone": "999888777",
+           "booking_date": DAY, "start_time": "08:00", "court_number": "1"}
+    row.update(kw)
+    return row
+
+
+@pytest.fixture
+def venue():
+    return server.venue_registry.get()
+
+
+@pytest.fixture
+def imp(tmp_path, venue):
+    path = tmp_path / "reservas.csv"
+    path.write_text("customer_name\n")
+    job = importer.Importer(venue, "bookings", str(path), workers=1)
+    job._rejects = open(job.rejects_path, "w", encoding="utf-8")
+    yield job
+    job._rejects.close()
+
+
+def test_read_rows_csv_skips_empty_cells(tmp_path):
+    path = tmp_path / "r.csv"
+    path.write_text("﻿customer_name, phone ,notes\nAna, 999 ,\n\nBeto,,x\n", encoding="utf-8")
+    assert list(importer.read_rows(str(path))) == [
+        (2, {"customer_name": "Ana", "phone": "999"}, None),
+        (4, {"customer_name": "Beto", "notes": "x"}, None),
+    ]
+
+
+def test_read_rows_ndjson_reports_bad_lines(tmp_path):
+    path = tmp_path / "r.ndjson"
+    path.write_text('{"a": 1}\n\n{roto\n[1, 2]\n')
+    rows = list(importer.read_rows(str(path)))
+    assert rows[0] == (1, {"a": 1}, None)
+    assert [(n, row) for n, row, _ in rows[1:]] == [(3, None), (4, None)]
+    assert rows[1][2].startswith("JSON inválido") and rows[2][2] == "La línea no es un objeto JSON"
+
+
+def test_validate_bookings(venue):
+    ok, rejected = importer.validate_rows("bookings", venue.id, "imp1", [
+        (2, _booking()),
+        (3, _booking(court_number="99")),
+        (4, _booking(start_time="08:30")),
+        (5, _booking(status="pendiente")),
+        (6, _booking(price_soles="12.5", status="cancelled")),
+        (7, _booking(booking_date="ayer")),
+    ])
+    assert [line for line, _, _ in ok] == [2, 6]
+    first, priced = ok[0][1], ok[1][1]
+    assert (first["start_time"], first["end_time"], first["status"]) == ("08:00", "09:00", "confirmed")
+    assert first["price_cents"] == venue.price_cents(server.date.fromisoformat(DAY), "08:00")
+    assert (priced["price_cents"], priced["status"]) == (1250, "cancelled")
+    assert first["_id"] == importer._row_id("imp1", 2) != priced["_id"]
+    reasons = {line: reason for line, reason, _ in rejected}
+    assert reasons[3] == "Cancha inválida"
+    assert reasons[4] == "Horario fuera de la grilla de atención"
+    assert reasons[5] == "status inválido: pendiente"
+    assert reasons[7].startswith("booking_date:")
+
+
+def test_validate_users_without_password(venue):
+    rows = [(2, {"customer_name": "Ana", "email": "ana@example.com", "phone": "999 888 777"}),
+            (3, {"customer_name": "Beto", "email": "beto@example.com", "phone": "123"}),
+            (4, {"customer_name": "Admin", "email": server.ADMIN_EMAIL, "phone": "999888777"})]
+    ok, rejected = importer.validate_rows("users", venue.id, "imp1", rows)
+    assert len(ok) == 1 and ok[0][1]["password_hash"] == server.UNUSABLE_PASSWORD
+    assert "ana" in ok[0][1]["search_tokens"]
+    assert [line for line, _, _ in rejected] == [3, 4]
+
+
+def test_conflicts_within_the_file_and_already_imported(imp, venue):
+    ok, _ = importer.validate_rows("bookings", venue.id, imp.import_id, [
+        (2, _booking()), (3, _booking(email="beto@example.com")), (4, _booking(court_number="2")),
+        (5, _booking(start_time="09:00", status="cancelled")), (6, _booking(start_time="10:00")),
+    ])
+    imp._occupancy[DAY] = {}                       # fecha ya cargada: no va a Mongo
+    imp._imported_ids.add(ok[-1][1]["_id"])        # línea 6 escrita en una corrida anterior
+    out = asyncio.run(imp._without_conflicts(ok))
+    assert [line for line, _, _ in out] == [2, 4, 5]
+    assert imp.counts["already_imported"] == 1
+    assert imp.reasons["Choca con otra reserva"] == 1
+
+
+class _FailingBookings:
+    def __init__(self, errors):
+        self.errors = errors
+
+    async def insert_many(self, docs, ordered=False):
+        raise BulkWriteError({"writeErrors": self.errors})
+
+
+def test_write_classifies_duplicate_keys(imp, venue):
+    ok, _ = importer.validate_rows("bookings", venue.id, imp.import_id,
+                                   [(2, _booking()), (3, _booking(court_number="2")), (4, _booking(court_number="3"))])
+    imp.vdb = {"bookings": _FailingBookings([
+        {"index": 0, "code": 11000, "keyPattern": {"_id": 1}},
+        {"index": 1, "code": 11000, "keyPattern": {"venue_id": 1, "booking_date": 1, "court_number": 1,
+                                                    "start_time": 1}},
+    ])}
+    written = asyncio.run(imp._write(ok))
+    assert [doc["court_number"] for doc in written] == [3]
+    assert imp.counts["already_imported"] == 1 and imp.counts["inserted"] == 1
+    assert imp.reasons["Choca con otra reserva"] == 1
+
+
+def test_trim_rejects_keeps_lines_up_to_the_checkpoint(imp):
+    with open(imp.rejects_path, "w", encoding="utf-8") as f:
+        for line in (3, 7, 12):
+            f.write(json.dumps({"line": line, "reason": "x", "row": {}}) + "\n")
+        f.write('{"line": 5, "reas')   # cortado a mitad de escritura
+    imp._trim_rejects(7)
+    with open(imp.rejects_path, encoding="utf-8") as f:
+        assert [json.loads(raw)["line"] for raw in f] == [3, 7]
@@ -0,0 +1,138 @@
+"""
+Cola de trabajos sin Mongo: parse_concurrency, backoff, reintentos hasta dead
+y el worker completo contra una colección falsa en memoria que entiende solo
+las consultas que usa JobQueue.
+"""
+import asyncio
+import itertools
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from jobs import JobQueue, JobWorker, _now, parse_concurrency  # noqa: E402
+
+
+class _FakeJobs:
+    def __init__(self):
+        self.docs = {}
+        self._ids = itertools.count(1)
+
+    async def insert_one(self, doc):
+        doc = dict(doc, _id=next(self._ids))
+        self.docs[doc["_id"]] = doc
+
+        class _Res:
+            inserted_id = doc["_id"]
+        return _Res()
+
+    async def find_one_and_update(self, flt, update, sort=None, return_document=None):
+        now = _now()
+        ready = [d for d in self.docs.values() if d["type"] == flt["type"] and (
+            (d["status"] == "queued" and d["run_at"] <= now)
+            or (d["status"] == "running" and d["locked_until"] <= now))]
+        if not ready:
+            return None
+        doc = min(ready, key=lambda d: d["run_at"])
+        self._apply(doc, update)
+        return dict(doc)
+
+    async def update_one(self, flt, update):
+        for doc in self.docs.values():
+            if all(doc.get(k) == v for k, v in flt.items()):
+                self._apply(doc, update)
+                return
+
+    @staticmethod
+    def _apply(doc, update):
+        doc.update(update.get("$set", {}))
+        for k, n in update.get("$inc", {}).items():
+            doc[k] = doc.get(k, 0) + n
+        for k in update.get("$unset", {}):
+            doc.pop(k, None)
+
+
+def test_parse_concurrency():
+    defaults = {"voucher_pdf": 2, "waitlist_promote": 1}
+    assert parse_concurrency("waitlist_promote=4, voucher_pdf = 0,basura", defaults) == \
+        {"voucher_pdf": 0, "waitlist_promote": 4}
+    assert parse_concurrency("", defaults) == defaults
+    assert parse_concurrency("otro=-3", {})["otro"] == 0
+
+
+def test_backoff_grows_with_jitter_and_caps():
+    queue = JobQueue(None, backoff_base=2.0, backoff_max=30.0)
+    for attempts, base in ((1, 2.0), (2, 4.0), (3, 8.0), (10, 30.0)):
+        for _ in range(20):
+            assert base * 0.8 <= queue.backoff(attempts) <= base * 1.2
+
+
+def test_fail_requeues_until_dead():
+    async def run():
+        coll = _FakeJobs()
+        queue = JobQueue(coll, max_attempts=2, backoff_base=60.0)
+        await queue.enqueue("voucher_pdf", {"charge_id": "ch_1"}, "default")
+        job = await queue.claim("voucher_pdf", "w1", visibility=30)
+        first = await queue.fail(job, "boom")
+        doc = dict(coll.docs[job["_id"]])
+        assert await queue.claim("voucher_pdf", "w1", visibility=30) is None   # esperando el backoff
+        coll.docs[job["_id"]]["run_at"] = _now()
+        job = await queue.claim("voucher_pdf", "w1", visibility=30)
+        second = await queue.fail(job, "boom otra vez")
+        return first, doc, second, coll.docs[job["_id"]]
+
+    first, doc, second, final = asyncio.run(run())
+    assert first == "queued" and doc["run_at"] > _now() + timedelta(seconds=40) and "locked_until" not in doc
+    assert second == "dead" and final["status"] == "dead" and final["last_error"] == "boom otra vez"
+
+
+def test_expired_lock_is_reclaimed_and_the_old_owner_cannot_close_it():
+    async def run():
+        coll = _FakeJobs()
+        queue = JobQueue(coll)
+        await queue.enqueue("waitlist_promote", {}, "default")
+        stale = await queue.claim("waitlist_promote", "w1", visibility=-1)   # ya vencido
+        fresh = await queue.claim("waitlist_promote", "w2", visibility=30)
+        await queue.complete(stale)
+        status_after_stale = coll.docs[fresh["_id"]]["status"]
+        await queue.complete(fresh)
+        return fresh, status_after_stale, coll.docs[fresh["_id"]]
+
+    fresh, status_after_stale, final = asyncio.run(run())
+    assert fresh["worker"] == "w2" and fresh["attempts"] == 2
+    assert status_after_stale == "running"
+    assert final["status"] == "done"
+
+
+def test_worker_retries_then_completes_and_dead_letters():
+    async def run():
+        coll = _FakeJobs()
+        queue = JobQueue(coll, max_attempts=3, backoff_base=0.001)
+        calls = {"flaky": 0, "broken": 0}
+
+        async def flaky(job):
+            calls["flaky"] += 1
+            if calls["flaky"] < 3:
+                raise RuntimeError("todavía no")
+
+        async def broken(job):
+            calls["broken"] += 1
+            raise RuntimeError("nunca")
+
+        worker = JobWorker(queue, {"flaky": flaky, "broken": broken}, {}, {}, poll_interval=0.005)
+        await queue.enqueue("flaky", {})
+        await queue.enqueue("broken", {})
+        worker.start()
+        for _ in range(400):
+            if {d["status"] for d in coll.docs.values()} <= {"done", "dead"}:
+                break
+            await asyncio.sleep(0.005)
+        await worker.stop()
+        return calls, worker.stats(), {d["type"]: d["status"] for d in coll.docs.values()}
+
+    calls, stats, statuses = asyncio.run(run())
+    assert statuses == {"flaky": "done", "broken": "dead"}
+    assert calls == {"flaky": 3, "broken": 3}
+    assert (stats["flaky"]["done"], stats["flaky"]["failed"]) == (1, 2)
+    assert (stats["broken"]["failed"], stats["broken"]["dead"]) == (2, 1)
@@ -0,0 +1,76 @@
+"""
+TokenBucketLimiter con un reloj falso: ráfaga hasta capacity, recarga a `rate`
+tokens/s, Retry-After exacto y barrido de buckets llenos. También el match de
+costos por ruta.
+"""
+import asyncio
+
+import pytest
+
+import ratelimit
+from ratelimit import Bucket, TokenBucketLimiter, match_route, route
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", c)
+    return c
+
+
+def _hit(limiter, key, bucket, cost=1.0):
+    return asyncio.run(limiter.hit(key, bucket, cost))
+
+
+def test_burst_then_reject_with_retry_after(clock):
+    limiter, bucket = TokenBucketLimiter(), Bucket(capacity=3, rate=0.5)
+    assert [_hit(limiter, "ip:1", bucket)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry = _hit(limiter, "ip:1", bucket)
+    assert not allowed and retry == pytest.approx(2.0)
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_refills_at_rate_up_to_capacity(clock):
+    limiter, bucket = TokenBucketLimiter(), Bucket(capacity=2, rate=1.0)
+    _hit(limiter, "k", bucket, 2)
+    clock.now += 1.0
+    assert _hit(limiter, "k", bucket)[0]
+    assert not _hit(limiter, "k", bucket)[0]
+    clock.now += 100.0
+    assert _hit(limiter, "k", bucket, 2)[0]          # no acumula más que capacity
+    assert not _hit(limiter, "k", bucket)[0]
+
+
+def test_cost_and_keys_are_independent(clock):
+    limiter, bucket = TokenBucketLimiter(), Bucket(capacity=5, rate=1.0)
+    assert _hit(limiter, "a", bucket, 5)[0]
+    assert not _hit(limiter, "a", bucket, 1)[0]
+    assert _hit(limiter, "b", bucket, 5)[0]
+    allowed, retry = _hit(limiter, "b", bucket, 3)
+    assert not allowed and retry == pytest.approx(3.0)
+
+
+def test_sweep_drops_only_full_buckets(clock):
+    limiter, bucket = TokenBucketLimiter(sweep_every=10), Bucket(capacity=10, rate=1.0)
+    _hit(limiter, "idle", bucket)
+    clock.now += 5
+    _hit(limiter, "busy", bucket, 10)
+    clock.now += 6   # idle ya se rellenó; busy todavía no
+    _hit(limiter, "other", bucket)
+    assert limiter.stats()["buckets"] == 2
+    assert not _hit(limiter, "busy", bucket, 10)[0]
+
+
+def test_match_route_first_rule_wins():
+    rules = [route("POST", r"^/api/login$", 5, "login"), route("*", r"^/api/", 1, "api")]
+    assert match_route(rules, "POST", "/api/login").name == "login"
+    assert match_route(rules, "GET", "/api/login").name == "api"
+    assert match_route(rules, "GET", "/health") is None
@@ -0,0 +1,116 @@
+"""
+Lecturas contra un replica set real: conflictos siempre al primario, lecturas
+pesadas a secundarios y read-your-writes tras reservar.
+"""
+import threading
+import uuid
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from pymongo import MongoClient, monitoring  # noqa: E402
+
+
+class CommandLog(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = []
+
+    def started(self, event):
+        coll = event.command.get(event.command_name)
+        with self._lock:
+            self.events.append({
+                "db":           event.database_name,
+                "name":         event.command_name,
+                "coll":         coll if isinstance(coll, str) else None,
+                "address":      event.connection_id,
+                "read_concern": event.command.get("readConcern") or {},
+            })
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+    def reads(self, db_name, coll, names=("find", "count", "aggregate")):
+        with self._lock:
+            return [e for e in self.events if e["db"] == db_name and e["coll"] == coll and e["name"] in names]
+
+
+_commands = CommandLog()
+monitoring.register(_commands)   # global: aplica a los clientes creados después
+
+
+@pytest.fixture
+def app(replica_set):
+    import server
+
+    server.MONGO_URL = replica_set
+    server.DB_NAME = f"test_reads_{uuid.uuid4().hex[:8]}"
+    server.RATE_LIMIT_ENABLED = False
+    with TestClient(server.app) as c:
+        yield server, c
+    with MongoClient(replica_set) as cleanup:
+        cleanup.drop_database(server.DB_NAME)
+
+
+def _user_headers(c, email):
+    r = c.post("/api/users/register", json={"customer_name": "Test", "email": email,
+                                            "phone": "999999999", "password": "secret123"})
+    assert r.status_code == 201, r.text
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def _booking(email, start="07:00"):
+    return {"customer_name": "Test", "email": email, "phone": "999999999",
+            "booking_date": "2031-03-04", "start_time": start, "court_number": 1}
+
+
+def test_conflict_checks_read_from_primary(app):
+    server, c = app
+    email = "rs1@example.com"
+    headers = _user_headers(c, email)
+    primary = server.client.primary
+
+    _commands.clear()
+    assert c.post("/api/bookings", json=_booking(email), headers=headers).status_code == 201
+    assert c.post("/api/bookings", json=_booking(email), headers=headers).status_code == 400
+
+    checks = _commands.reads(server.DB_NAME, "bookings")
+    assert checks
+    assert {e["address"] for e in checks} == {primary}
+
+
+def test_availability_reads_from_secondary(app):
+    server, c = app
+    secondaries = server.client.secondaries
+    assert secondaries
+
+    _commands.clear()
+    assert c.get("/api/availability/2031-03-04").status_code == 200
+    summary_reads = _commands.reads(server.DB_NAME, "daily_summaries")
+    assert summary_reads
+    assert {e["address"] for e in summary_reads} <= set(secondaries)
+
+
+def test_my_bookings_reads_own_write(app):
+    server, c = app
+    email = "rs2@example.com"
+    headers = _user_headers(c, email)
+
+    r = c.post("/api/bookings", json=_booking(email, "08:00"), headers=headers)
+    assert r.status_code == 201
+    _commands.clear()
+    mine = c.get("/api/my-bookings", headers=headers).json()
+
+    assert [b["id"] for b in mine] == [r.json()["id"]]
+    reads = _commands.reads(server.DB_NAME, "bookings")
+    assert reads and all("afterClusterTime" in e["read_concern"] for e in reads)
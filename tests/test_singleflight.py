@@ -0,0 +1,77 @@
+"""
+SingleFlight: llamadas concurrentes con la misma clave comparten una sola
+ejecución (resultado o excepción), la clave se libera al terminar y cancelar
+a un llamador no corta la ejecución de los demás.
+"""
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def run():
+        sf, calls = SingleFlight(), []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"n": len(calls)}
+
+        results = await asyncio.gather(*(sf.do("charge", "ch_1", load) for _ in range(10)))
+        other = await sf.do("charge", "ch_2", load)
+        return sf, calls, results, other
+
+    sf, calls, results, other = asyncio.run(run())
+    assert len(calls) == 2
+    assert all(r is results[0] for r in results) and other == {"n": 2}
+    assert sf.stats() == {"charge": {"calls": 11, "executions": 2, "collapsed": 9, "inflight": 0}}
+
+
+def test_key_is_released_after_completion():
+    async def run():
+        sf, calls = SingleFlight(), []
+
+        async def load():
+            calls.append(1)
+            return len(calls)
+
+        return [await sf.do("day", "2031-03-04", load) for _ in range(3)]
+
+    assert asyncio.run(run()) == [1, 2, 3]
+
+
+def test_exception_reaches_every_waiter():
+    async def run():
+        sf = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise ValueError("falló")
+
+        return await asyncio.gather(*(sf.do("x", 1, boom) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(r) for r in results] == [ValueError] * 3
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def run():
+        sf = SingleFlight()
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return "ok"
+
+        first = asyncio.ensure_future(sf.do("x", 1, load))
+        second = asyncio.ensure_future(sf.do("x", 1, load))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "ok"
@@ -0,0 +1,93 @@
+"""
+Autocompletado de clientes sin Mongo: tokens de búsqueda y PrefixCache
+(búsqueda por prefijos, marca de "completo" con vencimiento y desalojo LRU).
+"""
+import pytest
+
+import user_search
+from user_search import MAX_PREFIX, PrefixCache, mongo_filter, normalize, query_words, search_tokens
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(user_search.time, "monotonic", c)
+    return c
+
+
+def _user(uid, name, email, phone="999 888 777"):
+    return {"id": uid, "customer_name": name, "email": email, "phone": phone}
+
+
+def _add(cache, user, venue="v"):
+    cache.add(venue, user, search_tokens(user["customer_name"], user["email"], user["phone"]))
+
+
+def test_tokens_and_query_words():
+    assert normalize("  José  PÉREZ ") == "jose perez"
+    assert search_tokens("José Pérez", "Jose.Perez+tenis@Mail.com", "(01) 999-888") == [
+        "01999888", "jose", "jose.perez+tenis@mail.com", "perez", "tenis"]
+    assert query_words("a b c d e") == ["a", "b", "c", "d"]
+    assert mongo_filter("v", ["ju.an"])["search_tokens"]["$all"][0].pattern == r"^ju\.an"
+
+
+def test_search_intersects_words_and_sorts():
+    cache = PrefixCache()
+    _add(cache, _user("1", "Juan Pérez", "jp@x.com"))
+    _add(cache, _user("2", "Juana Díaz", "jd@x.com"))
+    _add(cache, _user("3", "Ana Pérez", "ap@x.com"))
+    _add(cache, _user("4", "Juan Pérez", "otro@x.com"), venue="w")
+    assert [u["id"] for u in cache.search("v", ["jua"], 10)] == ["1", "2"]
+    assert [u["id"] for u in cache.search("v", ["jua", "pe"], 10)] == ["1"]
+    assert [u["id"] for u in cache.search("v", ["per"], 1)] == ["3"]
+    assert cache.search("v", ["zz"], 10) == []
+
+
+def test_long_words_are_checked_against_full_tokens():
+    cache = PrefixCache()
+    long_name = "a" * (MAX_PREFIX + 5)
+    _add(cache, _user("1", long_name, "x@x.com"))
+    _add(cache, _user("2", "a" * (MAX_PREFIX + 1) + "b", "y@x.com"))
+    assert [u["id"] for u in cache.search("v", [long_name], 10)] == ["1"]
+
+
+def test_is_complete_covers_extensions_until_expiry(clock):
+    cache = PrefixCache(complete_ttl=60)
+    cache.mark_complete("v", "juan")
+    assert cache.is_complete("v", "juan")
+    assert cache.is_complete("v", "juan p")
+    assert not cache.is_complete("v", "jua")
+    assert not cache.is_complete("w", "juan p")
+    clock.now += 61
+    assert not cache.is_complete("v", "juan p")
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 3
+
+
+def test_complete_marks_are_bounded(clock):
+    cache = PrefixCache(max_complete=2)
+    for q in ("ana", "beto", "carla"):
+        cache.mark_complete("v", q)
+    assert not cache.is_complete("v", "ana")
+    assert cache.is_complete("v", "carla")
+
+
+def test_eviction_drops_prefixes_and_complete_marks_of_the_venue():
+    cache = PrefixCache(max_users=2)
+    _add(cache, _user("1", "Juan", "j@x.com"))
+    _add(cache, _user("2", "Ana", "a@x.com"))
+    cache.mark_complete("v", "ju")
+    cache.mark_complete("w", "ju")
+    _add(cache, _user("1", "Juan", "j@x.com"))   # uso reciente: Ana queda como la más vieja
+    _add(cache, _user("3", "Beto", "b@x.com"))
+    assert "2" not in cache and "1" in cache
+    assert cache.search("v", ["ana"], 10) == []
+    assert not cache.is_complete("v", "juan")       # la marca del local ya no es confiable
+    assert cache.is_complete("w", "juan")